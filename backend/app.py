@@ -227,6 +227,17 @@ def create_app():
     # 启动时验证配置
     _validate_config_on_startup(logger)
 
+    # 可选：后台预热任务目录大小缓存（REDINK_DIR_SIZE_REFRESH_INTERVAL > 0 时启用）
+    try:
+        from backend.services.dir_size_cache import get_dir_size_cache
+        get_dir_size_cache().start_background_refresh()
+    except Exception as e:
+        logger.warning(f"目录大小缓存后台刷新启动失败: {e}")
+
+    # 继续上次进程退出时未完成的生成任务（REDINK_RESUME_JOBS=0 关闭）
+    if os.environ.get("REDINK_RESUME_JOBS", "1").lower() not in ("0", "false", "no"):
+        _resume_generation_jobs(logger)
+
     # 根据是否有前端构建产物决定根路由行为
     if frontend_dist.exists():
         @app.route('/')
@@ -257,6 +268,24 @@ def create_app():
     return app
 
 
+def _resume_generation_jobs(logger):
+    """在后台线程中接管所属进程已退出的生成任务并继续生成（不阻塞启动）"""
+    import threading
+
+    def _run():
+        try:
+            from backend.services.job_store import get_generation_job_store
+            jobs = get_generation_job_store().claim_unfinished()
+            if not jobs:
+                return
+            from backend.services.image import get_image_service
+            get_image_service().resume_jobs(jobs)
+        except Exception as e:
+            logger.warning(f"继续未完成的生成任务失败: {e}")
+
+    threading.Thread(target=_run, name="resume-generation-jobs", daemon=True).start()
+
+
 def _validate_config_on_startup(logger):
     """启动时验证配置"""
     from pathlib import Path
@@ -3,6 +3,19 @@ from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional
 
 
+class ProviderHTTPError(Exception):
+    """服务商返回的 HTTP 错误（保留状态码和 Retry-After，供调度器识别限流并退避）"""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_response(cls, response, message: str) -> "ProviderHTTPError":
+        return cls(message, response.status_code, response.headers.get("Retry-After"))
+
+
 class ImageGeneratorBase(ABC):
     """图片生成器抽象基类"""
 
@@ -5,7 +5,7 @@ from typing import Dict, Any, Optional
 from google import genai
 from google.genai import types
 from .base import ImageGeneratorBase
-from ..utils.image_compressor import compress_image
+from .reference import ReferencePayload
 
 logger = logging.getLogger(__name__)
 
@@ -333,6 +333,7 @@ class GoogleGenAIGenerator(ImageGeneratorBase):
         temperature: float = 1.0,
         model: str = "gemini-3-pro-image-preview",
         reference_image: Optional[bytes] = None,
+        reference_payload: Optional[ReferencePayload] = None,
         **kwargs
     ) -> bytes:
         """
@@ -344,28 +345,29 @@ class GoogleGenAIGenerator(ImageGeneratorBase):
             temperature: 温度
             model: 模型名称
             reference_image: 参考图片二进制数据（用于保持风格一致）
+            reference_payload: 预处理好的参考图（优先使用其中的封面，避免每页重复压缩）
             **kwargs: 其他参数
 
         Returns:
             图片二进制数据
         """
         logger.info(f"Google GenAI 生成图片: model={model}, aspect_ratio={aspect_ratio}")
-        logger.debug(f"  prompt 长度: {len(prompt)} 字符, 有参考图: {reference_image is not None}")
+        if reference_payload is None and reference_image:
+            # 压缩参考图到 200KB 以内
+            reference_payload = ReferencePayload.prepare(cover_image=reference_image)
+        reference = reference_payload.cover if reference_payload is not None else None
+        logger.debug(f"  prompt 长度: {len(prompt)} 字符, 有参考图: {reference is not None}")
 
         # 构建 parts 列表
         parts = []
 
         # 如果有参考图，先添加参考图和说明
-        if reference_image:
-            logger.debug(f"  添加参考图片 ({len(reference_image)} bytes)")
-            # 压缩参考图到 200KB 以内
-            compressed_ref = compress_image(reference_image, max_size_kb=200)
-            logger.debug(f"  参考图压缩后: {len(compressed_ref)} bytes")
-            # 添加参考图
+        if reference is not None:
+            logger.debug(f"  添加参考图片 ({len(reference.data)} bytes, {reference.mime_type})")
             parts.append(types.Part(
                 inline_data=types.Blob(
-                    mime_type="image/png",
-                    data=compressed_ref
+                    mime_type=reference.mime_type,
+                    data=reference.data
                 )
             ))
             # 添加带参考说明的提示词
@@ -3,8 +3,8 @@ import logging
 import base64
 import requests
 from typing import Dict, Any, Optional, List, Union
-from .base import ImageGeneratorBase
-from ..utils.image_compressor import compress_image
+from .base import ImageGeneratorBase, ProviderHTTPError
+from .reference import ReferencePayload
 from backend.utils.url import normalize_openai_base_url
 
 logger = logging.getLogger(__name__)
@@ -61,6 +61,7 @@ class ImageApiGenerator(ImageGeneratorBase):
         model: str = None,
         reference_image: Optional[bytes] = None,
         reference_images: Optional[List[bytes]] = None,
+        reference_payload: Optional[ReferencePayload] = None,
         **kwargs
     ) -> bytes:
         """
@@ -73,6 +74,7 @@ class ImageApiGenerator(ImageGeneratorBase):
             model: 模型名称
             reference_image: 单张参考图片数据（向后兼容）
             reference_images: 多张参考图片数据列表
+            reference_payload: 预处理好的参考图（优先使用，避免每页重复压缩/编码）
 
         Returns:
             生成的图片二进制数据
@@ -87,19 +89,25 @@ class ImageApiGenerator(ImageGeneratorBase):
 
         logger.info(f"Image API 生成图片: model={model}, aspect_ratio={aspect_ratio}, endpoint={self.endpoint_type}")
 
+        if reference_payload is None:
+            # 收集所有参考图片：多张参考图在前，单张参考图在后
+            reference_payload = ReferencePayload.prepare(
+                cover_image=reference_image,
+                user_images=reference_images
+            )
+
         # 根据端点类型选择不同的生成方式
         if 'chat' in self.endpoint_type or 'completions' in self.endpoint_type:
-            return self._generate_via_chat_api(prompt, aspect_ratio, model, reference_image, reference_images)
+            return self._generate_via_chat_api(prompt, aspect_ratio, model, reference_payload)
         else:
-            return self._generate_via_images_api(prompt, aspect_ratio, model, reference_image, reference_images)
+            return self._generate_via_images_api(prompt, aspect_ratio, model, reference_payload)
 
     def _generate_via_images_api(
         self,
         prompt: str,
         aspect_ratio: str,
         model: str,
-        reference_image: Optional[bytes] = None,
-        reference_images: Optional[List[bytes]] = None
+        reference_payload: ReferencePayload
     ) -> bytes:
         """通过 /v1/images/generations 端点生成图片"""
         headers = {
@@ -115,27 +123,12 @@ class ImageApiGenerator(ImageGeneratorBase):
             "image_size": self.image_size
         }
 
-        # 收集所有参考图片
-        all_reference_images = []
-        if reference_images and len(reference_images) > 0:
-            all_reference_images.extend(reference_images)
-        if reference_image and reference_image not in all_reference_images:
-            all_reference_images.append(reference_image)
-
-        # 如果有参考图片，添加到 image 数组
-        if all_reference_images:
-            logger.debug(f"  添加 {len(all_reference_images)} 张参考图片")
-            image_uris = []
-            for idx, img_data in enumerate(all_reference_images):
-                compressed_img = compress_image(img_data, max_size_kb=200)
-                logger.debug(f"  参考图 {idx}: {len(img_data)} -> {len(compressed_img)} bytes")
-                base64_image = base64.b64encode(compressed_img).decode('utf-8')
-                data_uri = f"data:image/png;base64,{base64_image}"
-                image_uris.append(data_uri)
-
-            payload["image"] = image_uris
-
-            ref_count = len(all_reference_images)
+        # 如果有参考图片，添加到 image 数组（已预先压缩并编码为 data URI）
+        if reference_payload:
+            logger.debug(f"  添加 {len(reference_payload)} 张参考图片")
+            payload["image"] = [ref.data_uri for ref in reference_payload.images]
+
+            ref_count = len(reference_payload)
             enhanced_prompt = f"""参考提供的 {ref_count} 张图片的风格（色彩、光影、构图、氛围），生成一张新图片。
 
 新图片内容：{prompt}
@@ -154,7 +147,8 @@ class ImageApiGenerator(ImageGeneratorBase):
         if response.status_code != 200:
             error_detail = response.text[:500]
             logger.error(f"Image API 请求失败: status={response.status_code}, error={error_detail}")
-            raise Exception(
+            raise ProviderHTTPError.from_response(
+                response,
                 f"Image API 请求失败 (状态码: {response.status_code})\n"
                 f"错误详情: {error_detail}\n"
                 f"请求地址: {api_url}\n"
@@ -198,8 +192,7 @@ class ImageApiGenerator(ImageGeneratorBase):
         prompt: str,
         aspect_ratio: str,
         model: str,
-        reference_image: Optional[bytes] = None,
-        reference_images: Optional[List[bytes]] = None
+        reference_payload: ReferencePayload
     ) -> bytes:
         """通过 /v1/chat/completions 端点生成图片（如即梦 API）"""
         import re
@@ -212,25 +205,15 @@ class ImageApiGenerator(ImageGeneratorBase):
         # 构建用户消息内容
         user_content: Any = prompt
 
-        # 收集所有参考图片
-        all_reference_images = []
-        if reference_images and len(reference_images) > 0:
-            all_reference_images.extend(reference_images)
-        if reference_image and reference_image not in all_reference_images:
-            all_reference_images.append(reference_image)
-
         # 如果有参考图片，构建多模态消息
-        if all_reference_images:
-            logger.debug(f"  添加 {len(all_reference_images)} 张参考图片到 chat 消息")
+        if reference_payload:
+            logger.debug(f"  添加 {len(reference_payload)} 张参考图片到 chat 消息")
             content_parts = [{"type": "text", "text": prompt}]
 
-            for idx, img_data in enumerate(all_reference_images):
-                compressed_img = compress_image(img_data, max_size_kb=200)
-                logger.debug(f"  参考图 {idx}: {len(img_data)} -> {len(compressed_img)} bytes")
-                base64_image = base64.b64encode(compressed_img).decode('utf-8')
+            for ref in reference_payload.images:
                 content_parts.append({
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/png;base64,{base64_image}"}
+                    "image_url": {"url": ref.data_uri}
                 })
 
             user_content = content_parts
@@ -252,7 +235,8 @@ class ImageApiGenerator(ImageGeneratorBase):
             status_code = response.status_code
 
             if status_code == 401:
-                raise Exception(
+                raise ProviderHTTPError.from_response(
+                    response,
                     "❌ API Key 认证失败\n\n"
                     "【可能原因】\n"
                     "1. API Key 无效或已过期\n"
@@ -261,14 +245,16 @@ class ImageApiGenerator(ImageGeneratorBase):
                     "在系统设置页面检查 API Key 是否正确"
                 )
             elif status_code == 429:
-                raise Exception(
+                raise ProviderHTTPError.from_response(
+                    response,
                     "⏳ API 配额或速率限制\n\n"
                     "【解决方案】\n"
                     "1. 稍后再试\n"
                     "2. 检查 API 配额使用情况"
                 )
             else:
-                raise Exception(
+                raise ProviderHTTPError.from_response(
+                    response,
                     f"❌ Chat API 请求失败 (状态码: {status_code})\n\n"
                     f"【错误详情】\n{error_detail[:300]}\n\n"
                     f"【请求地址】{api_url}\n"
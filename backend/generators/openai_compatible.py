@@ -3,7 +3,7 @@ import logging
 import base64
 from typing import Dict, Any
 import requests
-from .base import ImageGeneratorBase
+from .base import ImageGeneratorBase, ProviderHTTPError
 from backend.utils.url import normalize_openai_base_url
 
 logger = logging.getLogger(__name__)
@@ -118,7 +118,8 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
         if response.status_code != 200:
             error_detail = response.text[:500]
             logger.error(f"OpenAI Images API 请求失败: status={response.status_code}, error={error_detail}")
-            raise Exception(
+            raise ProviderHTTPError.from_response(
+                response,
                 f"OpenAI Images API 请求失败 (状态码: {response.status_code})\n"
                 f"错误详情: {error_detail}\n"
                 f"请求地址: {url}\n"
@@ -221,7 +222,8 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
 
             # 详细的错误信息
             if status_code == 401:
-                raise Exception(
+                raise ProviderHTTPError.from_response(
+                    response,
                     "❌ API Key 认证失败\n\n"
                     "【可能原因】\n"
                     "1. API Key 无效或已过期\n"
@@ -230,14 +232,16 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
                     "在系统设置页面检查 API Key 是否正确"
                 )
             elif status_code == 429:
-                raise Exception(
+                raise ProviderHTTPError.from_response(
+                    response,
                     "⏳ API 配额或速率限制\n\n"
                     "【解决方案】\n"
                     "1. 稍后再试\n"
                     "2. 检查 API 配额使用情况"
                 )
             else:
-                raise Exception(
+                raise ProviderHTTPError.from_response(
+                    response,
                     f"❌ Chat API 请求失败 (状态码: {status_code})\n\n"
                     f"【错误详情】\n{error_detail[:300]}\n\n"
                     f"【请求地址】{url}\n"
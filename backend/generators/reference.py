@@ -0,0 +1,89 @@
+"""
+预处理后的参考图
+
+同一任务的每一页都使用相同的封面和用户参考图。ReferencePayload 在任务开始时
+把它们压缩、识别 MIME 类型并编码为 base64 / data URI，只做一次，
+之后在各页面的生成线程之间只读共享，生成器直接使用，不再重复压缩和编码。
+"""
+
+import base64
+from typing import Iterable, Optional, Tuple
+
+from ..utils.image_compressor import compress_image
+from ..utils.image_variants import mimetype_from_bytes
+
+# 参考图压缩目标大小（KB）
+REFERENCE_MAX_SIZE_KB = 200
+
+
+class ReferenceImage:
+    """一张已压缩、已编码的参考图（只读）"""
+
+    __slots__ = ("data", "mime_type", "base64", "data_uri")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.mime_type = mimetype_from_bytes(data[:16])
+        self.base64 = base64.b64encode(data).decode("ascii")
+        self.data_uri = f"data:{self.mime_type};base64,{self.base64}"
+
+    @classmethod
+    def from_raw(cls, image_data: bytes, max_size_kb: int = REFERENCE_MAX_SIZE_KB) -> "ReferenceImage":
+        """压缩原始图片数据后构造"""
+        return cls(compress_image(image_data, max_size_kb=max_size_kb))
+
+
+class ReferencePayload:
+    """
+    一次任务的参考图集合（只读，可跨线程共享）
+
+    Attributes:
+        cover: 封面参考图（内容页保持风格一致用）
+        user_images: 用户上传的参考图
+    """
+
+    __slots__ = ("cover", "user_images", "images")
+
+    def __init__(self, cover: Optional[ReferenceImage] = None, user_images: Iterable[ReferenceImage] = ()):
+        self.cover = cover
+        self.user_images: Tuple[ReferenceImage, ...] = tuple(user_images)
+        # 多图接口使用的顺序：用户参考图在前，封面在后（与用户参考图重复时不再重复发送）
+        images = self.user_images
+        if cover is not None and all(img.data != cover.data for img in images):
+            images = images + (cover,)
+        self.images: Tuple[ReferenceImage, ...] = images
+
+    def __bool__(self) -> bool:
+        return bool(self.images)
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    @classmethod
+    def prepare(
+        cls,
+        cover_image: Optional[bytes] = None,
+        user_images: Optional[Iterable[bytes]] = None,
+        max_size_kb: int = REFERENCE_MAX_SIZE_KB,
+    ) -> "ReferencePayload":
+        """
+        压缩并编码参考图（重复的用户参考图只保留一份）
+
+        Args:
+            cover_image: 封面图片数据
+            user_images: 用户上传的参考图片数据
+            max_size_kb: 压缩目标大小（KB）
+
+        Returns:
+            ReferencePayload: 预处理后的参考图
+        """
+        seen = set()
+        prepared_users = []
+        for img in user_images or ():
+            if img and img not in seen:
+                seen.add(img)
+                prepared_users.append(ReferenceImage.from_raw(img, max_size_kb))
+
+        cover = ReferenceImage.from_raw(cover_image, max_size_kb) if cover_image else None
+
+        return cls(cover, prepared_users)
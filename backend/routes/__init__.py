@@ -8,6 +8,7 @@ API 路由模块
 - config_routes: 配置管理 API
 - content_routes: 内容生成相关 API（标题、文案、标签）
 - admin_routes: 管理/监控 API（默认仅 localhost）
+- reference_routes: 参考图片上传 API
 
 所有路由都注册到统一的 /api 前缀下
 """
@@ -30,6 +31,7 @@ def create_api_blueprint():
     from .config_routes import create_config_blueprint
     from .content_routes import create_content_blueprint
     from .admin_routes import create_admin_blueprint
+    from .reference_routes import create_reference_blueprint
 
     # 创建主 API 蓝图
     api_bp = Blueprint('api', __name__, url_prefix='/api')
@@ -41,6 +43,7 @@ def create_api_blueprint():
     api_bp.register_blueprint(create_config_blueprint())
     api_bp.register_blueprint(create_content_blueprint())
     api_bp.register_blueprint(create_admin_blueprint())
+    api_bp.register_blueprint(create_reference_blueprint())
 
     return api_bp
 
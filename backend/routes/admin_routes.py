@@ -24,7 +24,17 @@ import yaml
 import requests
 from flask import Blueprint, jsonify, request, send_file
 
+from backend.services.dir_size_cache import get_dir_size_cache
+from backend.services.history import get_history_service
 from backend.services.image import get_image_service
+from backend.services.thumbnail_pool import get_thumbnail_pool
+from backend.services.generation_scheduler import get_generation_scheduler
+from backend.services.job_runner import get_generation_job_runner
+from backend.services.job_store import get_generation_job_store
+from backend.services.rate_limiter import rate_limiter_stats
+from backend.services.zip_cache import get_zip_bundle_cache
+from backend.services.reference_store import get_reference_store
+from backend.utils.image_compressor import compress_cache_stats
 from backend.utils.url import normalize_openai_base_url
 
 logger = logging.getLogger(__name__)
@@ -145,51 +155,21 @@ def _read_log_chunk(path: Path, offset: int, max_bytes: int) -> Dict[str, Any]:
     return {"offset": offset, "next_offset": next_offset, "content": text, "exists": True, "size": size}
 
 
-def _dir_size_bytes(path: Path) -> int:
-    total = 0
-    try:
-        for p in path.rglob("*"):
-            if p.is_file():
-                try:
-                    total += p.stat().st_size
-                except Exception:
-                    pass
-    except Exception:
-        return 0
-    return total
-
-
 def _history_stats() -> Dict[str, Any]:
     root = _get_project_root()
     history_root = root / "history"
     history_root.mkdir(parents=True, exist_ok=True)
-    index_path = history_root / "index.json"
 
-    records = []
-    if index_path.exists():
-        try:
-            import json
-            records = (json.loads(index_path.read_text(encoding="utf-8")) or {}).get("records", [])
-        except Exception:
-            records = []
-
-    referenced_task_ids = set()
-    for r in records:
-        tid = (r or {}).get("task_id")
-        if tid:
-            referenced_task_ids.add(str(tid))
-
-    task_dirs = []
-    total_bytes = 0
-    for p in history_root.iterdir():
-        if p.is_dir():
-            sz = _dir_size_bytes(p)
-            total_bytes += sz
-            try:
-                mtime = p.stat().st_mtime
-            except Exception:
-                mtime = None
-            task_dirs.append({"task_id": p.name, "bytes": sz, "mtime": mtime})
+    history_service = get_history_service()
+    total_records = history_service.get_statistics().get("total", 0)
+    referenced_task_ids = set(history_service.get_referenced_task_ids())
+
+    # 目录大小来自按目录 mtime 失效的缓存，未变化的目录不会重新统计
+    task_dirs = [
+        {"task_id": d["task_id"], "bytes": d["bytes"], "mtime": d["mtime"]}
+        for d in get_dir_size_cache().snapshot()
+    ]
+    total_bytes = sum(d["bytes"] for d in task_dirs)
 
     task_dirs.sort(key=lambda x: x["bytes"], reverse=True)
     newest_dirs = sorted(task_dirs, key=lambda x: (x["mtime"] or 0), reverse=True)
@@ -199,7 +179,7 @@ def _history_stats() -> Dict[str, Any]:
     return {
         "history_root": str(history_root),
         "total_task_dirs": len(task_dirs),
-        "total_records": len(records),
+        "total_records": total_records,
         "total_bytes": total_bytes,
         "orphan_task_dirs": orphan_dirs[:200],
         "orphan_task_dirs_count": len(orphan_dirs),
@@ -325,6 +305,13 @@ def create_admin_blueprint():
                 },
             },
             "probes": probes,
+            "thumbnail_pool": get_thumbnail_pool().stats(),
+            "generation_scheduler": get_generation_scheduler().stats(),
+            "rate_limits": rate_limiter_stats(),
+            "generation_jobs": get_generation_job_store().stats(),
+            "generation_runner": get_generation_job_runner().stats(),
+            "compress_cache": compress_cache_stats(),
+            "reference_images": get_reference_store().stats(),
         })
 
     @admin_bp.route("/admin/tasks", methods=["GET"])
@@ -350,6 +337,9 @@ def create_admin_blueprint():
             try:
                 if task_dir and task_dir.exists() and task_dir.is_dir():
                     shutil.rmtree(task_dir)
+                    get_dir_size_cache().invalidate(task_id, touch=False)
+                    get_zip_bundle_cache().invalidate(task_id)
+                    get_generation_job_store().delete_job(task_id)
                     deleted = True
             except Exception as e:
                 error = str(e)
@@ -550,37 +540,20 @@ def create_admin_blueprint():
                     "error": "删除孤儿任务目录需要确认：请传入 confirm_delete_orphans='YES_DELETE_ORPHAN_TASKS'（并建议先 dry_run）"
                 }), 400
 
-        stats = _history_stats()
-
-        # Build metadata map from stats.largest/newest isn't enough; rescan quick for scope decisions.
+        # Per-directory size/mtime come from the dir size cache (only changed dirs are rescanned).
         task_meta = {}
-        referenced_task_ids = set()
         try:
-            import json
-            idx = history_root / "index.json"
-            if idx.exists():
-                records = (json.loads(idx.read_text(encoding="utf-8")) or {}).get("records", [])
-                for r in records:
-                    tid = (r or {}).get("task_id")
-                    if tid:
-                        referenced_task_ids.add(str(tid))
+            referenced_task_ids = set(get_history_service().get_referenced_task_ids())
         except Exception:
             referenced_task_ids = set()
 
-        for p in history_root.iterdir():
-            if not p.is_dir():
-                continue
-            try:
-                bytes_ = _dir_size_bytes(p)
-                mtime = p.stat().st_mtime
-            except Exception:
-                bytes_ = 0
-                mtime = None
-            tid = p.name
+        dir_cache = get_dir_size_cache()
+        for d in dir_cache.snapshot():
+            tid = d["task_id"]
             task_meta[tid] = {
                 "task_id": tid,
-                "bytes": bytes_,
-                "mtime": mtime,
+                "bytes": d["bytes"],
+                "mtime": d["mtime"],
                 "is_orphan": tid not in referenced_task_ids,
             }
 
@@ -628,6 +601,8 @@ def create_admin_blueprint():
                 continue
             try:
                 shutil.rmtree(task_dir)
+                dir_cache.invalidate(tid, touch=False)
+                get_zip_bundle_cache().invalidate(tid)
                 deleted.append({"task_id": tid, "dry_run": False, "bytes": (task_meta.get(tid) or {}).get("bytes")})
             except Exception as e:
                 failed.append({"task_id": tid, "error": str(e)})
@@ -13,10 +13,13 @@ import os
 import io
 import zipfile
 import logging
+import unicodedata
 from pathlib import Path
-from typing import Optional
-from flask import Blueprint, request, jsonify, send_file
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import quote
+from flask import Blueprint, Response, request, jsonify, send_file, stream_with_context
 from backend.services.history import get_history_service
+from backend.services.zip_cache import get_zip_bundle_cache
 
 logger = logging.getLogger(__name__)
 
@@ -94,24 +97,53 @@ def create_history_blueprint():
         """
         获取历史记录列表（分页）
 
+        支持两种分页方式：
+        - 页码分页：page + page_size
+        - 游标分页：携带 cursor 参数（第一页传空字符串），翻页时传上一页返回的 next_cursor
+
         查询参数：
         - page: 页码（默认 1）
         - page_size: 每页数量（默认 20）
-        - status: 状态过滤（可选：all/completed/draft）
+        - cursor: 游标（可选，出现该参数时使用游标分页）
+        - status: 状态过滤（可选：all/draft/generating/partial/completed/error）
+        - sort: 排序字段（可选：created_at/updated_at，默认 created_at）
+        - order: 排序方向（可选：desc/asc，默认 desc）
 
         返回：
         - success: 是否成功
         - records: 记录列表
-        - total: 总数
-        - total_pages: 总页数
+        - total: 总数（页码分页）
+        - total_pages: 总页数（页码分页）
+        - next_cursor: 下一页游标（游标分页，无更多记录时为 null）
+        - has_more: 是否还有更多记录（游标分页）
         """
         try:
-            page = int(request.args.get('page', 1))
-            page_size = int(request.args.get('page_size', 20))
+            try:
+                page = max(1, int(request.args.get('page', 1)))
+                page_size = max(1, int(request.args.get('page_size', 20)))
+            except ValueError:
+                return jsonify({
+                    "success": False,
+                    "error": "参数错误：page 和 page_size 必须是整数。"
+                }), 400
             status = request.args.get('status')
+            if status == 'all':
+                status = None
+            sort = request.args.get('sort', 'created_at')
+            order = request.args.get('order', 'desc')
+            cursor = request.args.get('cursor')
 
             history_service = get_history_service()
-            result = history_service.list_records(page, page_size, status)
+            try:
+                if cursor is not None:
+                    result = history_service.list_records_after(cursor or None, page_size, status, sort, order)
+                else:
+                    result = history_service.list_records(page, page_size, status, sort, order)
+            except ValueError as e:
+                return jsonify({
+                    "success": False,
+                    "error": f"参数错误：{str(e)}"
+                }), 400
 
             return jsonify({
                 "success": True,
@@ -304,17 +336,29 @@ def create_history_blueprint():
     @history_bp.route('/history/search', methods=['GET'])
     def search_history():
         """
-        搜索历史记录
+        搜索历史记录（全文检索：标题、大纲、生成的标题/文案/标签）
 
         查询参数：
         - keyword: 搜索关键词（必填）
+        - page: 页码（默认 1）
+        - page_size: 每页数量（默认 20）
 
         返回：
         - success: 是否成功
-        - records: 匹配的记录列表
+        - records: 当前页匹配的记录（按相关度排序）
+        - total: 匹配总数
+        - total_pages: 总页数
         """
         try:
             keyword = request.args.get('keyword', '')
+            try:
+                page = max(1, int(request.args.get('page', 1)))
+                page_size = min(100, max(1, int(request.args.get('page_size', 20))))
+            except ValueError:
+                return jsonify({
+                    "success": False,
+                    "error": "参数错误：page 和 page_size 必须是整数。"
+                }), 400
 
             if not keyword:
                 return jsonify({
@@ -323,11 +367,11 @@ def create_history_blueprint():
                 }), 400
 
             history_service = get_history_service()
-            results = history_service.search_records(keyword)
+            result = history_service.search_records_page(keyword, page, page_size)
 
             return jsonify({
                 "success": True,
-                "records": results
+                **result
             }), 200
 
         except Exception as e:
@@ -342,15 +386,29 @@ def create_history_blueprint():
         """
         获取历史记录统计信息
 
+        查询参数：
+        - days: 可选，返回最近 N 天每天新建的记录数（by_day）
+
         返回：
         - success: 是否成功
         - total: 总记录数
         - by_status: 按状态分组的统计
+        - by_day: 每天新建的记录数（仅在传入 days 时返回）
         """
         try:
             history_service = get_history_service()
             stats = history_service.get_statistics()
 
+            days = request.args.get('days')
+            if days:
+                try:
+                    stats["by_day"] = history_service.get_daily_counts(int(days))
+                except ValueError:
+                    return jsonify({
+                        "success": False,
+                        "error": "参数错误：days 必须是整数。"
+                    }), 400
+
             return jsonify({
                 "success": True,
                 **stats
@@ -365,6 +423,34 @@ def create_history_blueprint():
 
     # ==================== 扫描和同步 ====================
 
+    @history_bp.route('/history/stats/reconcile', methods=['POST'])
+    def reconcile_history_stats():
+        """
+        重新计算历史记录统计计数器
+
+        统计计数器平时随记录变化增量维护；计数与实际不符时可调用此接口从头重算。
+
+        返回：
+        - success: 是否成功
+        - total: 总记录数
+        - by_status: 按状态分组的统计
+        """
+        try:
+            history_service = get_history_service()
+            stats = history_service.reconcile_statistics()
+
+            return jsonify({
+                "success": True,
+                **stats
+            }), 200
+
+        except Exception as e:
+            error_msg = str(e)
+            return jsonify({
+                "success": False,
+                "error": f"重算历史记录统计失败。\n错误详情: {error_msg}"
+            }), 500
+
     @history_bp.route('/history/scan/<task_id>', methods=['GET'])
     def scan_task(task_id):
         """
@@ -401,16 +487,29 @@ def create_history_blueprint():
         """
         扫描所有任务并同步图片列表
 
+        请求体（可选）：
+        - incremental: 为 true 时跳过自上次扫描后未变化的任务目录（也可用查询参数 ?incremental=1）
+
         返回：
         - success: 是否成功
-        - total_tasks: 扫描的任务总数
+        - incremental: 是否为增量扫描
+        - total_tasks: 任务目录总数
+        - scanned: 实际扫描的目录数
+        - skipped: 因未变化而跳过的目录数
         - synced: 成功同步的任务数
+        - updated: 记录实际发生变化的任务数
         - failed: 失败的任务数
         - orphan_tasks: 孤立任务列表（有图片但无记录）
+        - elapsed_ms: 扫描耗时（毫秒）
         """
         try:
+            data = request.get_json(silent=True) or {}
+            incremental = data.get('incremental')
+            if incremental is None:
+                incremental = request.args.get('incremental', '').lower() in ('1', 'true', 'yes')
+
             history_service = get_history_service()
-            result = history_service.scan_all_tasks()
+            result = history_service.scan_all_tasks(incremental=bool(incremental))
 
             if not result.get("success"):
                 return jsonify(result), 500
@@ -463,19 +562,42 @@ def create_history_blueprint():
                     "error": f"任务目录不存在或路径不安全：{task_id}"
                 }), 404
 
-            # 创建内存中的 ZIP 文件
-            zip_buffer = _create_images_zip(task_dir, record)
-
             # 生成安全的下载文件名
             title = record.get('title', 'images')
             safe_title = _sanitize_filename(title)
             filename = f"{safe_title}.zip"
 
-            return send_file(
-                zip_buffer,
+            # 优先使用磁盘上的 ZIP 缓存（支持 Range / 条件请求）；
+            # 未命中时边打包边输出，同时写入缓存
+            zip_cache = get_zip_bundle_cache()
+            bundle_path, zip_stream = zip_cache.open_bundle(
+                task_id,
+                record_id,
+                record.get('updated_at', ''),
+                str(task_dir),
+                lambda: _iter_images_zip(task_dir, record)
+            )
+            if bundle_path:
+                try:
+                    return send_file(
+                        bundle_path,
+                        mimetype='application/zip',
+                        as_attachment=True,
+                        download_name=filename,
+                        etag=Path(bundle_path).stem
+                    )
+                except FileNotFoundError:
+                    # 刚好被其它请求淘汰，退回流式打包
+                    pass
+
+            # 流式生成 ZIP（边打包边输出，不在内存中缓存整个归档）
+            if zip_stream is None:
+                zip_stream = _iter_images_zip(task_dir, record)
+
+            return Response(
+                stream_with_context(zip_stream),
                 mimetype='application/zip',
-                as_attachment=True,
-                download_name=filename
+                headers={"Content-Disposition": _content_disposition(filename)}
             )
 
         except Exception as e:
@@ -488,113 +610,228 @@ def create_history_blueprint():
     return history_bp
 
 
-def _create_images_zip(task_dir: str, record: Optional[dict] = None) -> io.BytesIO:
+# 流式打包时每次从磁盘读取并输出的块大小
+_ZIP_CHUNK_SIZE = 64 * 1024
+
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """
+    供 ZipFile 写入的不可 seek 缓冲区
+
+    ZipFile 检测到输出不可 seek 时会改用数据描述符（data descriptor）写入条目，
+    因此可以边生成边把已写入的字节交给 HTTP 响应，然后清空缓冲区。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._offset = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        data = bytes(b)
+        self._chunks.append(data)
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # ZipFile 需要知道当前偏移量来记录中央目录；不支持 seek 即可触发流式模式
+        return self._offset
+
+    def seekable(self) -> bool:
+        return False
+
+    def take(self) -> bytes:
+        """取出并清空已写入的数据"""
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _zip_text_entries(record: Optional[dict]) -> List[Tuple[str, str]]:
     """
-    创建包含所有图片的 ZIP 文件
+    生成 ZIP 中的文本条目（meta.txt / outline.txt / content.txt）
 
     Args:
-        task_dir: 任务目录路径
+        record: 历史记录
 
     Returns:
-        io.BytesIO: 内存中的 ZIP 文件
+        List[Tuple[str, str]]: (归档文件名, 文本内容)
     """
-    memory_file = io.BytesIO()
+    if not record:
+        return []
+
+    entries: List[Tuple[str, str]] = []
+    try:
+        title = record.get("title", "")
+        record_id = record.get("id", "")
+        created_at = record.get("created_at", "")
+        updated_at = record.get("updated_at", "")
+        status = record.get("status", "")
+        task_id = (record.get("images") or {}).get("task_id", "")
+        pages = (record.get("outline") or {}).get("pages") or []
+        page_count = len(pages)
+        style_hint = record.get("style_hint", "")
+
+        meta_lines = [
+            f"Title: {title}",
+            f"Record ID: {record_id}",
+            f"Status: {status}",
+            f"Created At: {created_at}",
+            f"Updated At: {updated_at}",
+            f"Task ID: {task_id}",
+            f"Pages: {page_count}",
+        ]
+        if style_hint:
+            meta_lines.append(f"Style Hint: {style_hint}")
+        entries.append(("meta.txt", "\n".join(meta_lines) + "\n"))
+
+        outline_raw = (record.get("outline") or {}).get("raw", "")
+        if outline_raw:
+            entries.append(("outline.txt", str(outline_raw)))
+
+        content = record.get("content") or {}
+        titles = content.get("titles") or []
+        copywriting = content.get("copywriting") or ""
+        tags = content.get("tags") or []
+        if titles or copywriting or tags:
+            parts = []
+            if titles:
+                parts.append("Titles:")
+                parts.extend([f"- {t}" for t in titles])
+                parts.append("")
+            if copywriting:
+                parts.append("Copywriting:")
+                parts.append(str(copywriting))
+                parts.append("")
+            if tags:
+                parts.append("Tags:")
+                parts.append(" ".join([f"#{t}" for t in tags]))
+                parts.append("")
+            entries.append(("content.txt", "\n".join(parts).strip() + "\n"))
+    except Exception:
+        # 元信息生成失败不影响图片打包
+        return []
 
+    return entries
+
+
+def _zip_image_entries(task_dir: str) -> List[Tuple[str, Path]]:
+    """
+    列出任务目录中需要打包的图片（排除缩略图、符号链接和目录外的文件）
+
+    Args:
+        task_dir: 任务目录路径
+
+    Returns:
+        List[Tuple[str, Path]]: (归档文件名, 文件路径)
+    """
     task_path = Path(task_dir).resolve()
     if Path(task_dir).is_symlink():
         raise ValueError("任务目录为符号链接，已拒绝打包")
 
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        # 附带元信息
-        if record:
+    entries: List[Tuple[str, Path]] = []
+    for filename in os.listdir(task_dir):
+        # 跳过缩略图文件
+        if filename.startswith('thumb_'):
+            continue
+
+        if filename.endswith(('.png', '.jpg', '.jpeg')):
+            file_path = (task_path / filename)
+
+            # 跳过符号链接
             try:
-                title = record.get("title", "")
-                record_id = record.get("id", "")
-                created_at = record.get("created_at", "")
-                updated_at = record.get("updated_at", "")
-                status = record.get("status", "")
-                task_id = (record.get("images") or {}).get("task_id", "")
-                pages = (record.get("outline") or {}).get("pages") or []
-                page_count = len(pages)
-                style_hint = record.get("style_hint", "")
-
-                meta_lines = [
-                    f"Title: {title}",
-                    f"Record ID: {record_id}",
-                    f"Status: {status}",
-                    f"Created At: {created_at}",
-                    f"Updated At: {updated_at}",
-                    f"Task ID: {task_id}",
-                    f"Pages: {page_count}",
-                ]
-                if style_hint:
-                    meta_lines.append(f"Style Hint: {style_hint}")
-                zf.writestr("meta.txt", "\n".join(meta_lines) + "\n")
-
-                outline_raw = (record.get("outline") or {}).get("raw", "")
-                if outline_raw:
-                    zf.writestr("outline.txt", str(outline_raw))
-
-                content = record.get("content") or {}
-                titles = content.get("titles") or []
-                copywriting = content.get("copywriting") or ""
-                tags = content.get("tags") or []
-                if titles or copywriting or tags:
-                    parts = []
-                    if titles:
-                        parts.append("Titles:")
-                        parts.extend([f"- {t}" for t in titles])
-                        parts.append("")
-                    if copywriting:
-                        parts.append("Copywriting:")
-                        parts.append(str(copywriting))
-                        parts.append("")
-                    if tags:
-                        parts.append("Tags:")
-                        parts.append(" ".join([f"#{t}" for t in tags]))
-                        parts.append("")
-                    zf.writestr("content.txt", "\n".join(parts).strip() + "\n")
+                if file_path.is_symlink():
+                    continue
             except Exception:
-                # 元信息写入失败不影响图片打包
-                pass
+                continue
 
-        # 遍历任务目录中的所有图片（排除缩略图）
-        for filename in os.listdir(task_dir):
-            # 跳过缩略图文件
-            if filename.startswith('thumb_'):
+            # 确保在 task_dir 内
+            try:
+                file_path.resolve().relative_to(task_path)
+            except Exception:
                 continue
 
-            if filename.endswith(('.png', '.jpg', '.jpeg')):
-                file_path = (task_path / filename)
+            if not file_path.exists() or not file_path.is_file():
+                continue
 
-                # 跳过符号链接
-                try:
-                    if file_path.is_symlink():
-                        continue
-                except Exception:
-                    continue
+            # 生成归档文件名（page_N.png 格式）
+            try:
+                index = int(filename.split('.')[0])
+                archive_name = f"page_{index + 1}.png"
+            except ValueError:
+                archive_name = filename
 
-                # 确保在 task_dir 内
-                try:
-                    file_path.resolve().relative_to(task_path)
-                except Exception:
-                    continue
+            entries.append((archive_name, file_path))
 
-                if not file_path.exists() or not file_path.is_file():
-                    continue
+    return entries
 
-                # 生成归档文件名（page_N.png 格式）
-                try:
-                    index = int(filename.split('.')[0])
-                    archive_name = f"page_{index + 1}.png"
-                except ValueError:
-                    archive_name = filename
 
-                zf.write(str(file_path), archive_name)
+def _iter_images_zip(task_dir: str, record: Optional[dict] = None) -> Iterator[bytes]:
+    """
+    流式生成包含所有图片的 ZIP 文件
+
+    文本条目使用 DEFLATE 压缩；PNG/JPEG 本身已压缩，直接 STORED 存储。
+    图片按块读取并立即输出，单次下载的内存占用与归档大小无关。
+
+    Args:
+        task_dir: 任务目录路径
+        record: 历史记录（用于生成元信息文本）
 
-    # 将指针移到开始位置
-    memory_file.seek(0)
-    return memory_file
+    Yields:
+        bytes: ZIP 数据块
+    """
+    # 在输出任何数据之前完成目录检查，出错时调用方仍可返回 JSON 错误
+    images = _zip_image_entries(task_dir)
+    texts = _zip_text_entries(record)
+
+    def _generate() -> Iterator[bytes]:
+        buffer = _ZipStreamBuffer()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            for name, text in texts:
+                zf.writestr(name, text, compress_type=zipfile.ZIP_DEFLATED)
+            chunk = buffer.take()
+            if chunk:
+                yield chunk
+
+            for archive_name, file_path in images:
+                try:
+                    src = open(file_path, "rb")
+                except OSError:
+                    continue
+                with src:
+                    zinfo = zipfile.ZipInfo.from_file(str(file_path), archive_name)
+                    zinfo.compress_type = zipfile.ZIP_STORED
+                    with zf.open(zinfo, "w") as dest:
+                        while True:
+                            data = src.read(_ZIP_CHUNK_SIZE)
+                            if not data:
+                                break
+                            dest.write(data)
+                            chunk = buffer.take()
+                            if chunk:
+                                yield chunk
+                chunk = buffer.take()
+                if chunk:
+                    yield chunk
+        # 中央目录
+        chunk = buffer.take()
+        if chunk:
+            yield chunk
+
+    return _generate()
+
+
+def _content_disposition(filename: str) -> str:
+    """构造附件下载的 Content-Disposition（非 ASCII 文件名使用 RFC 5987 编码）"""
+    try:
+        filename.encode("ascii")
+        return f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii") or "images.zip"
+        return f"attachment; filename=\"{simple}\"; filename*=UTF-8''{quote(filename, safe='')}"
 
 
 def _sanitize_filename(title: str) -> str:
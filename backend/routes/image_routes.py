@@ -7,21 +7,35 @@
 - 重试/重新生成单张图片
 - 批量重试失败图片
 - 获取任务状态
+- 重新连接任务事件流
 """
 
 import os
 import json
 import base64
+import itertools
 import logging
 import re
+import uuid
 from pathlib import Path
 from flask import Blueprint, request, jsonify, Response, send_file
 from backend.config import Config
-from backend.services.image import get_image_service
+from backend.services.image import get_image_service, image_version
+from backend.services.job_runner import get_generation_job_runner
+from backend.services.reference_store import get_reference_store
+from backend.services.thumbnail_pool import get_thumbnail_pool
+from backend.utils.image_variants import VARIANT_FILENAME_RE, find_variant, sniff_mimetype, variant_mimetype
+from backend.utils.upload_stream import parse_multipart_images
 from .utils import log_request, log_error
 
 logger = logging.getLogger(__name__)
 
+# 带正确版本号的图片 URL 内容不会变化，可长期缓存
+_IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# 事件流空闲时发送心跳的间隔（秒），及时发现已断开的连接
+_SSE_HEARTBEAT_SECONDS = 15.0
+
 
 def create_image_blueprint():
     """创建图片路由蓝图（工厂函数，支持多次调用）"""
@@ -34,13 +48,13 @@ def create_image_blueprint():
         """
         防止路径遍历：确保最终路径在 history_root 内，且只允许预期文件名。
 
-        仅允许：{index}.png 或 thumb_{index}.png
+        仅允许：{index}.png、thumb_{index}.png 或尺寸变体 var_{index}_{size}.{webp|avif}
         """
         if not re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9._-]{0,127}", task_id or ""):
             return None
 
         # NOTE: use single backslashes in raw regex. `\\d` would match the literal string "\d".
-        if not re.fullmatch(r"(thumb_)?\d+\.png", filename or ""):
+        if not re.fullmatch(r"(thumb_)?\d+\.png", filename or "") and not VARIANT_FILENAME_RE.fullmatch(filename or ""):
             return None
 
         base = history_root.resolve()
@@ -62,6 +76,29 @@ def create_image_blueprint():
 
         return target
 
+    def _send_image(path: Path, mimetype: str, immutable: bool, negotiated: bool) -> Response:
+        """
+        发送图片（强 ETag + Last-Modified，支持 304 与 Range）
+
+        带版本号的 URL 使用长期不可变缓存；其它情况要求浏览器每次用 ETag 重新验证。
+        按 Accept 协商格式的响应附带 Vary: Accept。
+        """
+        st = path.stat()
+        response = send_file(
+            str(path),
+            mimetype=mimetype,
+            etag=f"{st.st_mtime_ns:x}-{st.st_size:x}",
+            last_modified=st.st_mtime,
+            conditional=True
+        )
+        if immutable:
+            response.headers['Cache-Control'] = _IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        if negotiated:
+            response.vary.add('Accept')
+        return response
+
     # ==================== 图片生成 ====================
 
     @image_bp.route('/generate', methods=['POST'])
@@ -69,21 +106,40 @@ def create_image_blueprint():
         """
         批量生成图片（SSE 流式返回）
 
-        请求体：
+        请求体（application/json）：
         - pages: 页面列表（必填）
         - task_id: 任务 ID
         - full_outline: 完整大纲文本
         - user_topic: 用户原始输入主题
         - user_images: base64 编码的用户参考图片列表
+        - user_image_ids: 已上传参考图片的 ID 列表（见 /reference-images）
+
+        也可以使用 multipart/form-data（图片流式解析，不经过 base64）：
+        - payload: 上述 JSON 字段（不含 user_images）序列化后的字符串
+        - user_images: 参考图片文件列表
+
+        生成在后台执行，响应只读取任务的事件日志：连接断开不影响生成，
+        同一任务正在生成时再次提交只会连接到已有的事件流（可带 Last-Event-ID 续传）。
 
         返回：
-        SSE 事件流，包含以下事件类型：
-        - image: 单张图片生成完成
+        SSE 事件流（每个事件带 id），包含以下事件类型：
+        - progress: 页面开始生成
+        - complete: 单张图片生成完成
         - error: 生成错误
-        - complete: 全部完成
+        - queue: 排队位置
+        - finish: 全部完成
         """
         try:
-            data = request.get_json(silent=True)
+            uploaded_images = []
+            if request.mimetype == 'multipart/form-data':
+                form, uploads = parse_multipart_images(request, 'user_images')
+                uploaded_images = [upload.data for upload in uploads]
+                try:
+                    data = json.loads(form.get('payload') or '{}')
+                except ValueError:
+                    data = None
+            else:
+                data = request.get_json(silent=True)
             if not isinstance(data, dict):
                 return jsonify({"success": False, "error": "请求体必须是 JSON object"}), 400
             pages = data.get('pages')
@@ -95,8 +151,24 @@ def create_image_blueprint():
             if task_id is not None and task_id != "" and not _is_safe_task_id(task_id):
                 return jsonify({"success": False, "error": "参数错误：task_id 不安全"}), 400
 
-            # 解析 base64 格式的用户参考图片
-            user_images = _parse_base64_images(data.get('user_images', []))
+            # 用户参考图片：multipart 上传的文件、base64 数组、已上传图片的 ID
+            # 三种来源合计受数量和总大小限制；数量在解码/读取之前检查
+            images_base64 = data.get('user_images', [])
+            image_ids = data.get('user_image_ids')
+            requested = len(uploaded_images) + sum(
+                len(v) for v in (images_base64, image_ids) if isinstance(v, list)
+            )
+            if requested > Config.MAX_BASE64_IMAGES:
+                raise ValueError(f"参数错误：user_images 最多允许 {Config.MAX_BASE64_IMAGES} 张图片")
+            user_images = uploaded_images + _parse_base64_images(images_base64)
+            total_bytes = sum(len(img) for img in user_images)
+            if total_bytes > Config.MAX_BASE64_TOTAL_BYTES:
+                raise ValueError("参数错误：user_images 总大小超过限制")
+            user_images += get_reference_store().resolve(
+                image_ids,
+                field='user_image_ids',
+                max_total_bytes=Config.MAX_BASE64_TOTAL_BYTES - total_bytes
+            )
 
             log_request('/generate', {
                 'pages_count': len(pages) if pages else 0,
@@ -112,32 +184,25 @@ def create_image_blueprint():
                     "error": "参数错误：pages 不能为空。\n请提供要生成的页面列表数据。"
                 }), 400
 
-            logger.info(f"🖼️  开始图片生成任务: {task_id}, 共 {len(pages)} 页")
-            image_service = get_image_service()
+            if not task_id:
+                task_id = f"task_{uuid.uuid4().hex[:8]}"
 
-            def generate():
-                """SSE 事件生成器"""
-                for event in image_service.generate_images(
+            image_service = get_image_service()
+            log, started = get_generation_job_runner().start(
+                task_id,
+                lambda: image_service.generate_images(
                     pages, task_id, full_outline,
                     user_images=user_images if user_images else None,
                     user_topic=user_topic,
                     style_hint=style_hint
-                ):
-                    event_type = event["event"]
-                    event_data = event["data"]
-
-                    # 格式化为 SSE 格式
-                    yield f"event: {event_type}\n"
-                    yield f"data: {json.dumps(event_data, ensure_ascii=False)}\n\n"
-
-            return Response(
-                generate(),
-                mimetype='text/event-stream',
-                headers={
-                    'Cache-Control': 'no-cache',
-                    'X-Accel-Buffering': 'no',
-                }
+                )
             )
+            if started:
+                logger.info(f"🖼️  开始图片生成任务: {task_id}, 共 {len(pages)} 页")
+            else:
+                logger.info(f"任务 {task_id} 正在生成，连接到已有的事件流")
+
+            return _event_log_response(log, image_service)
 
         except ValueError as e:
             return jsonify({
@@ -165,6 +230,12 @@ def create_image_blueprint():
 
         查询参数：
         - thumbnail: 是否返回缩略图（默认 true）
+        - w: 期望显示宽度（像素），用于选择 gallery/card/preview 尺寸变体
+        - v: 图片版本号（与当前文件一致时返回长期缓存头）
+
+        缩略图/指定宽度时，按 Accept 头优先返回 AVIF/WebP 变体，
+        客户端不支持或变体尚未生成时返回 JPEG 缩略图或原图；
+        缩略图仍在后台编码时最多等待 REDINK_THUMBNAIL_WAIT 秒，超时返回原图。
 
         返回：
         - 成功：图片文件
@@ -178,20 +249,46 @@ def create_image_blueprint():
 
             history_root = Path(__file__).parent.parent.parent / "history"
 
-            if thumbnail:
-                thumb_filename = f"thumb_{filename}"
-                safe_thumb = _safe_image_path(history_root, task_id, thumb_filename)
-                if safe_thumb:
-                    return send_file(str(safe_thumb), mimetype='image/png')
+            try:
+                width = int(request.args.get('w', 0) or 0)
+            except ValueError:
+                return jsonify({"success": False, "error": "参数错误：w 必须是整数"}), 400
 
             safe_file = _safe_image_path(history_root, task_id, filename)
-            if not safe_file:
+            negotiated = thumbnail or width > 0
+            target = None
+            mimetype = None
+
+            # 缩略图仍在后台编码时短暂等待，超时则直接返回原图（避免返回旧缩略图）
+            thumbs_ready = True
+            if negotiated and safe_file is not None:
+                pool = get_thumbnail_pool()
+                if pool.is_pending(str(safe_file)):
+                    thumbs_ready = pool.wait(str(safe_file))
+
+            if negotiated and safe_file is not None and thumbs_ready:
+                variant = find_variant(str(safe_file.parent), filename, request.headers.get('Accept', ''), width)
+                if variant:
+                    target = _safe_image_path(history_root, task_id, variant)
+                    mimetype = variant_mimetype(variant)
+            if target is None and thumbnail and thumbs_ready:
+                target = _safe_image_path(history_root, task_id, f"thumb_{filename}")
+            if target is None:
+                target = safe_file
+            if not target:
                 return jsonify({
                     "success": False,
                     "error": f"图片不存在或路径不安全：{task_id}/{filename}"
                 }), 404
 
-            return send_file(str(safe_file), mimetype='image/png')
+            # 版本号与原图一致时（URL 由 ImageService 生成），内容不会再变化
+            version = request.args.get('v')
+            immutable = (
+                bool(version) and thumbs_ready and safe_file is not None
+                and version == image_version(str(safe_file))
+            )
+
+            return _send_image(target, mimetype or sniff_mimetype(str(target)), immutable, negotiated)
 
         except Exception as e:
             log_error('/images', e)
@@ -458,6 +555,66 @@ def create_image_blueprint():
                 "error": f"获取任务状态失败。\n错误详情: {error_msg}"
             }), 500
 
+    @image_bp.route('/task/<task_id>/events', methods=['GET'])
+    def follow_task_events(task_id):
+        """
+        重新连接任务的事件流（SSE，用于页面刷新或断线后继续查看进度）
+
+        本进程正在执行（或刚结束）的任务直接读取事件日志，带 Last-Event-ID 请求头
+        （或 last_event_id 查询参数）时只推送之后的事件。
+        其它情况（服务重启后、任务由其它进程执行）按持久化的页面状态回放，之后推送后续进度，
+        任务中断时在后台继续生成，不需要重新提交 /generate。
+
+        路径参数：
+        - task_id: 任务 ID
+
+        返回：
+        - SSE 事件流（事件格式同 /generate）
+        - 404: 任务不存在（未被持久化或已过保留期）
+        """
+        if not _is_safe_task_id(task_id):
+            return jsonify({"success": False, "error": "参数错误：task_id 不安全"}), 400
+
+        try:
+            image_service = get_image_service()
+            runner = get_generation_job_runner()
+            log = runner.get(task_id)
+            if log is None and image_service.resume_task(task_id):
+                log = runner.get(task_id)
+            if log is not None:
+                return _event_log_response(log, image_service)
+
+            events = image_service.follow_job(task_id)
+            # 先取第一个事件：任务不存在时直接返回 404，而不是空的事件流
+            first = next(events, None)
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 404
+        except Exception as e:
+            log_error('/task/events', e)
+            return jsonify({
+                "success": False,
+                "error": f"获取任务事件失败。\n错误详情: {str(e)}"
+            }), 500
+
+        def generate():
+            """SSE 事件生成器"""
+            if first is None:
+                return
+            for event in itertools.chain([first], events):
+                yield _format_sse(event['event'], event['data'])
+
+        return Response(
+            generate(),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no',
+            }
+        )
+
     # ==================== 健康检查 ====================
 
     @image_bp.route('/health', methods=['GET'])
@@ -479,6 +636,40 @@ def create_image_blueprint():
 
 # ==================== 辅助函数 ====================
 
+def _format_sse(event_type: str, data, event_id: str | None = None) -> str:
+    """格式化为 SSE 格式"""
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _event_log_response(log, image_service) -> Response:
+    """读取任务事件日志的 SSE 响应（从客户端的 Last-Event-ID 之后开始）"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    after = log.parse_event_id(last_event_id)
+
+    def generate():
+        """SSE 事件生成器（断开连接只结束读取，不影响后台生成）"""
+        for item in log.tail(
+            after,
+            heartbeat=_SSE_HEARTBEAT_SECONDS,
+            snapshot=lambda: image_service.task_snapshot_events(log.task_id),
+        ):
+            if item is None:
+                yield ": keep-alive\n\n"
+                continue
+            event_id, event_type, event_data = item
+            yield _format_sse(event_type, event_data, event_id)
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        }
+    )
+
+
 def _parse_base64_images(images_base64: list) -> list:
     """
     解析 base64 编码的图片列表
@@ -11,6 +11,8 @@ import logging
 from flask import Blueprint, request, jsonify
 from backend.config import Config
 from backend.services.outline import get_outline_service
+from backend.services.reference_store import get_reference_store
+from backend.utils.upload_stream import parse_multipart_images
 from .utils import log_request, log_error
 
 logger = logging.getLogger(__name__)
@@ -26,13 +28,15 @@ def create_outline_blueprint():
         生成大纲（支持图片上传）
 
         请求格式：
-        1. multipart/form-data（带图片文件）
+        1. multipart/form-data（带图片文件，流式解析）
            - topic: 主题文本
            - images: 图片文件列表
+           - image_ids: 已上传参考图片的 ID（可重复，可选）
 
         2. application/json（无图片或 base64 图片）
            - topic: 主题文本
            - images: base64 编码的图片数组（可选）
+           - image_ids: 已上传参考图片的 ID 数组（可选，见 /reference-images）
 
         返回：
         - success: 是否成功
@@ -97,28 +101,12 @@ def _parse_outline_request():
         tuple: (topic, images) - 主题和图片列表
     """
     # 检查是否是 multipart/form-data（带图片文件）
-    if request.content_type and 'multipart/form-data' in request.content_type:
-        topic = request.form.get('topic')
-        images = []
-
-        # 获取上传的图片文件
-        if 'images' in request.files:
-            files = request.files.getlist('images')
-            if len(files) > Config.MAX_BASE64_IMAGES:
-                raise ValueError(f"参数错误：images 最多允许 {Config.MAX_BASE64_IMAGES} 张图片")
-
-            total_bytes = 0
-            for file in files:
-                if file and file.filename:
-                    image_data = file.read()
-                    if len(image_data) > Config.MAX_BASE64_IMAGE_BYTES:
-                        raise ValueError("参数错误：上传图片过大")
-
-                    total_bytes += len(image_data)
-                    if total_bytes > Config.MAX_BASE64_TOTAL_BYTES:
-                        raise ValueError("参数错误：上传图片总大小超过限制")
-                    images.append(image_data)
-
+    if request.mimetype == 'multipart/form-data':
+        # 边接收边校验并写入临时文件，不合规的上传在读完之前就被拒绝
+        form, uploads = parse_multipart_images(request, 'images')
+        topic = form.get('topic')
+        images = [upload.data for upload in uploads]
+        images += _resolve_image_ids(form.getlist('image_ids'), images)
         return topic, images
 
     # JSON 请求（无图片或 base64 图片）
@@ -134,7 +122,10 @@ def _parse_outline_request():
         if not isinstance(images_base64, list):
             raise ValueError("参数错误：images 必须是数组")
 
-        if len(images_base64) > Config.MAX_BASE64_IMAGES:
+        # 与 image_ids 合计受数量限制，在解码之前检查
+        image_ids = data.get('image_ids')
+        requested = len(images_base64) + (len(image_ids) if isinstance(image_ids, list) else 0)
+        if requested > Config.MAX_BASE64_IMAGES:
             raise ValueError(f"参数错误：images 最多允许 {Config.MAX_BASE64_IMAGES} 张图片")
 
         total_bytes = 0
@@ -166,4 +157,20 @@ def _parse_outline_request():
 
             images.append(img)
 
+    images += _resolve_image_ids(data.get('image_ids'), images)
     return topic, images
+
+
+def _resolve_image_ids(image_ids, uploaded: list) -> list:
+    """
+    把已上传参考图片的 ID 解析为图片数据
+
+    与本次上传的图片合计受数量和总大小限制；数量在读取任何图片之前检查。
+    """
+    if isinstance(image_ids, list) and len(uploaded) + len(image_ids) > Config.MAX_BASE64_IMAGES:
+        raise ValueError(f"参数错误：images 最多允许 {Config.MAX_BASE64_IMAGES} 张图片")
+    return get_reference_store().resolve(
+        image_ids,
+        field='image_ids',
+        max_total_bytes=Config.MAX_BASE64_TOTAL_BYTES - sum(len(img) for img in uploaded)
+    )
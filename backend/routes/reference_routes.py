@@ -0,0 +1,80 @@
+"""
+参考图片上传 API 路由
+
+包含功能：
+- 上传参考图片（multipart 或二进制请求体），返回图片 ID 供后续请求引用
+"""
+
+import logging
+from flask import Blueprint, request, jsonify
+from backend.services.reference_store import get_reference_store
+from backend.utils.image_compressor import compress_image
+from backend.utils.upload_stream import parse_multipart_images, read_binary_image
+from .utils import log_error
+
+logger = logging.getLogger(__name__)
+
+
+def create_reference_blueprint():
+    """创建参考图片路由蓝图（工厂函数，支持多次调用）"""
+    reference_bp = Blueprint('reference', __name__)
+
+    @reference_bp.route('/reference-images', methods=['POST'])
+    def upload_reference_images():
+        """
+        上传参考图片
+
+        请求格式：
+        1. multipart/form-data
+           - images: 图片文件列表
+        2. 二进制请求体（Content-Type: image/png、image/jpeg 等），单张图片
+
+        上传过程中流式校验数量、大小和格式，不合规时立即返回 400。
+
+        返回：
+        - success: 是否成功
+        - images: [{id, bytes, mime_type, deduplicated, expires_in}]，id 为内容哈希，
+          可在 /outline 的 image_ids、/generate 的 user_image_ids 中引用
+        """
+        try:
+            mimetype = request.mimetype or ''
+            if mimetype == 'multipart/form-data':
+                _, uploads = parse_multipart_images(request, 'images')
+            elif mimetype.startswith('image/') or mimetype == 'application/octet-stream':
+                uploads = [read_binary_image(request)]
+            else:
+                return jsonify({
+                    "success": False,
+                    "error": "参数错误：请使用 multipart/form-data 或图片二进制请求体上传"
+                }), 400
+
+            if not uploads:
+                return jsonify({
+                    "success": False,
+                    "error": "参数错误：images 不能为空"
+                }), 400
+
+            store = get_reference_store()
+            images = []
+            for upload in uploads:
+                entry = store.put(upload.data, upload.mime_type)
+                if not entry["deduplicated"]:
+                    # 预先压缩（结果进入压缩缓存），生成时不必再从原图压缩
+                    compress_image(upload.data, max_size_kb=200)
+                images.append(entry)
+            logger.info(f"已保存 {len(images)} 张参考图片（复用 {sum(1 for i in images if i['deduplicated'])} 张）")
+            return jsonify({"success": True, "images": images}), 200
+
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        except Exception as e:
+            log_error('/reference-images', e)
+            return jsonify({
+                "success": False,
+                "error": f"上传参考图片失败: {str(e)}"
+            }), 500
+
+    return reference_bp
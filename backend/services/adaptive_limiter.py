@@ -0,0 +1,186 @@
+"""
+服务商自适应并发控制
+
+image_providers.yaml 中的 max_concurrent 只是一个静态上限，配高了会被上游 429/503，
+配低了又浪费额度。这里按 AIMD（加性增、乘性减）在运行时调整每个服务商的实际并发：
+
+- 从较小的并发（REDINK_ADAPTIVE_INITIAL_LIMIT）开始，不超过配置的上限
+- 调用成功且耗时没有明显变慢（不超过基线耗时的 REDINK_ADAPTIVE_LATENCY_TOLERANCE 倍）时，
+  每连续成功 limit 次并发 +1
+- 遇到 429/503 时并发减半（最低 1），并按 Retry-After 暂停向该服务商派发新调用；
+  同一批并发中的多个 429 只减半一次（减半之前就已开始的调用不再重复计入）
+- 普通错误和变慢的调用不会减并发，但会打断连续成功计数
+
+本类不加锁，由 GenerationScheduler 在持有自身锁时调用。
+"""
+
+import os
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+# 视为限流的状态码
+THROTTLE_STATUS_CODES = (429, 503)
+
+_THROTTLE_MESSAGE_RE = re.compile(
+    r"\b(429|503)\b|RESOURCE_EXHAUSTED|UNAVAILABLE|rate.?limit|速率限制",
+    re.IGNORECASE,
+)
+
+
+def parse_retry_after(value: Any) -> Optional[float]:
+    """
+    解析 Retry-After 头（秒数或 HTTP 日期）
+
+    Returns:
+        Optional[float]: 需要等待的秒数，无法解析时返回 None
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return max(0.0, float(value))
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    # ProviderHTTPError.status_code / google.genai APIError.code / requests HTTPError.response
+    for attr in ("status_code", "code"):
+        code = getattr(error, attr, None)
+        if isinstance(code, int):
+            return code
+    response = getattr(error, "response", None)
+    code = getattr(response, "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_throttle_error(error: BaseException) -> bool:
+    """判断生成调用的异常是否为上游限流/过载（429、503）"""
+    code = _status_code(error)
+    if code is not None:
+        return code in THROTTLE_STATUS_CODES
+    return bool(_THROTTLE_MESSAGE_RE.search(str(error)))
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """从异常中取出上游给的 Retry-After（秒），没有时返回 None"""
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        if headers is not None:
+            try:
+                value = headers.get("Retry-After")
+            except Exception:
+                value = None
+    return parse_retry_after(value)
+
+
+class AdaptiveLimiter:
+    """单个服务商的 AIMD 并发限制"""
+
+    # 是否启用自适应（关闭后并发固定为配置上限，仍遵守 Retry-After）
+    ENABLED = os.environ.get("REDINK_ADAPTIVE_CONCURRENCY", "1").lower() not in ("0", "false", "no")
+    # 初始并发
+    INITIAL_LIMIT = int(os.environ.get("REDINK_ADAPTIVE_INITIAL_LIMIT", "4"))
+    # 耗时超过基线的多少倍视为变慢
+    LATENCY_TOLERANCE = float(os.environ.get("REDINK_ADAPTIVE_LATENCY_TOLERANCE", "2.0"))
+    # 429/503 没有 Retry-After 时的暂停时间（秒）
+    DEFAULT_BACKOFF = float(os.environ.get("REDINK_ADAPTIVE_BACKOFF_SECONDS", "2"))
+    # Retry-After 的最长暂停时间（秒），避免异常的响应头把服务商长时间挂起
+    MAX_BACKOFF = 300.0
+    # 基线耗时的 EWMA 系数；变慢的调用只缓慢拉高基线，上游整体变慢时最终也会被接受
+    LATENCY_ALPHA = 0.2
+    SLOW_LATENCY_ALPHA = 0.02
+
+    def __init__(
+        self,
+        max_limit: int,
+        initial_limit: Optional[int] = None,
+        enabled: Optional[bool] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_limit = max(1, int(max_limit))
+        self.enabled = self.ENABLED if enabled is None else enabled
+        self._clock = clock
+        self._initial_limit = max(1, self.INITIAL_LIMIT if initial_limit is None else initial_limit)
+        self._limit = float(min(self.max_limit, self._initial_limit)) if self.enabled else float(self.max_limit)
+        self._healthy_streak = 0
+        self._baseline_latency: Optional[float] = None
+        self._last_decrease = float("-inf")
+        self._blocked_until = float("-inf")
+        self.throttled = 0
+
+    @property
+    def limit(self) -> int:
+        """当前允许的并发数"""
+        return int(self._limit)
+
+    def set_max(self, max_limit: int) -> None:
+        """调整上限（配置更新时）：当前并发收紧到新上限内，且不低于初始并发"""
+        self.max_limit = max(1, int(max_limit))
+        if self.enabled:
+            self._limit = float(min(max(self._limit, self._initial_limit), self.max_limit))
+        else:
+            self._limit = float(self.max_limit)
+
+    def blocked_for(self) -> float:
+        """还需要暂停派发的秒数（0 表示可以派发）"""
+        return max(0.0, self._blocked_until - self._clock())
+
+    def on_success(self, started: float) -> None:
+        """记录一次成功调用（started 为调用开始时的 clock() 值）"""
+        latency = max(0.0, self._clock() - started)
+        baseline = self._baseline_latency
+        healthy = baseline is None or latency <= baseline * self.LATENCY_TOLERANCE
+        if baseline is None:
+            self._baseline_latency = latency
+        else:
+            alpha = self.LATENCY_ALPHA if healthy else self.SLOW_LATENCY_ALPHA
+            self._baseline_latency = baseline + alpha * (latency - baseline)
+
+        if not self.enabled:
+            return
+        if not healthy:
+            self._healthy_streak = 0
+            return
+        self._healthy_streak += 1
+        if self._healthy_streak >= self.limit and self._limit < self.max_limit:
+            self._limit = min(float(self.max_limit), self._limit + 1)
+            self._healthy_streak = 0
+
+    def on_error(self) -> None:
+        """记录一次非限流的失败调用"""
+        self._healthy_streak = 0
+
+    def on_throttle(self, started: float, retry_after: Optional[float] = None) -> None:
+        """记录一次 429/503：并发减半并按 Retry-After 暂停派发"""
+        now = self._clock()
+        self.throttled += 1
+        self._healthy_streak = 0
+        delay = self.DEFAULT_BACKOFF if retry_after is None else retry_after
+        self._blocked_until = max(self._blocked_until, now + min(delay, self.MAX_BACKOFF))
+        if self.enabled and started >= self._last_decrease:
+            self._limit = max(1.0, float(int(self._limit * 0.5)))
+            self._last_decrease = now
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前状态（管理面板健康检查）"""
+        baseline = self._baseline_latency
+        return {
+            "limit": self.limit,
+            "max_limit": self.max_limit,
+            "adaptive": self.enabled,
+            "blocked_for": round(self.blocked_for(), 1),
+            "latency_ms": None if baseline is None else int(baseline * 1000),
+            "throttled": self.throttled,
+        }
@@ -0,0 +1,235 @@
+"""
+任务目录大小缓存
+
+管理面板的历史统计/清理需要每个任务目录的占用空间。逐个 rglob + stat 在
+图片很多时非常慢，这里按目录缓存 (字节数, 文件数)，并以目录 mtime 判断是否失效：
+
+- 目录中新增/删除/重命名文件会更新目录 mtime，缓存自动失效
+- 原地覆盖已有文件不会改变目录 mtime，因此图片写入方需要调用 invalidate()
+  （会同时 touch 目录 mtime，让其它 worker 进程的缓存也失效）
+- 缓存持久化到 history/.dir_sizes.json，重启后无需全量重扫
+- 可选的后台线程（REDINK_DIR_SIZE_REFRESH_INTERVAL 秒）定期预热缓存
+"""
+
+import os
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.utils.atomic_file import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+
+def scan_dir_size(path: str) -> Tuple[int, int, Dict[str, int]]:
+    """
+    用 os.scandir 递归统计目录大小（不跟随符号链接）
+
+    Returns:
+        (总字节数, 文件数, {子目录相对路径: mtime_ns})
+    """
+    total = 0
+    files = 0
+    subdirs: Dict[str, int] = {}
+    stack = [path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs[os.path.relpath(entry.path, path)] = entry.stat(follow_symlinks=False).st_mtime_ns
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            total += entry.stat(follow_symlinks=False).st_size
+                            files += 1
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total, files, subdirs
+
+
+class DirSizeCache:
+    """按任务目录缓存占用空间，以目录（及其子目录）mtime 作为失效依据"""
+
+    # 后台刷新间隔（秒），<= 0 表示不启动后台线程
+    REFRESH_INTERVAL = float(os.environ.get("REDINK_DIR_SIZE_REFRESH_INTERVAL", "0"))
+
+    CACHE_FILENAME = ".dir_sizes.json"
+
+    def __init__(self, root: str):
+        self.root = root
+        self.cache_file = os.path.join(root, self.CACHE_FILENAME)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+        self._dirty = False
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception:
+            return {}
+
+    def _save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = dict(self._entries)
+            self._dirty = False
+        try:
+            atomic_write_json(self.cache_file, entries, indent=None)
+        except Exception as e:
+            logger.warning(f"保存目录大小缓存失败: {e}")
+
+    def _is_fresh(self, path: str, entry: Dict[str, Any], mtime_ns: int) -> bool:
+        if entry.get("mtime_ns") != mtime_ns:
+            return False
+        for rel, sub_mtime in (entry.get("subdirs") or {}).items():
+            try:
+                if os.stat(os.path.join(path, rel), follow_symlinks=False).st_mtime_ns != sub_mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取单个任务目录的占用信息（缓存失效时重新统计）
+
+        Returns:
+            {"task_id", "bytes", "files", "mtime"}，目录不存在时返回 None
+        """
+        path = os.path.join(self.root, task_id)
+        try:
+            st = os.stat(path, follow_symlinks=False)
+        except OSError:
+            with self._lock:
+                if self._entries.pop(task_id, None) is not None:
+                    self._dirty = True
+            return None
+
+        with self._lock:
+            entry = self._entries.get(task_id)
+        if entry is None or not self._is_fresh(path, entry, st.st_mtime_ns):
+            total, files, subdirs = scan_dir_size(path)
+            entry = {"mtime_ns": st.st_mtime_ns, "bytes": total, "files": files, "subdirs": subdirs}
+            with self._lock:
+                self._entries[task_id] = entry
+                self._dirty = True
+
+        return {
+            "task_id": task_id,
+            "bytes": entry["bytes"],
+            "files": entry["files"],
+            "mtime": st.st_mtime,
+        }
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        history 根目录下所有任务目录的占用信息
+
+        未变化的目录直接使用缓存；已删除目录的缓存条目会被清理。
+        """
+        results: List[Dict[str, Any]] = []
+        seen = set()
+        try:
+            with os.scandir(self.root) as it:
+                task_ids = [e.name for e in it if e.is_dir(follow_symlinks=False)]
+        except OSError:
+            task_ids = []
+
+        for task_id in task_ids:
+            info = self.get(task_id)
+            if info is not None:
+                seen.add(task_id)
+                results.append(info)
+
+        with self._lock:
+            stale = [tid for tid in self._entries if tid not in seen]
+            for tid in stale:
+                del self._entries[tid]
+            if stale:
+                self._dirty = True
+        self._save()
+        return results
+
+    def invalidate(self, task_id: str, touch: bool = True) -> None:
+        """
+        使某个任务目录的缓存失效（图片写入/覆盖/删除后调用）
+
+        Args:
+            touch: 是否更新目录 mtime，使其它进程中的缓存同样失效
+        """
+        with self._lock:
+            if self._entries.pop(task_id, None) is not None:
+                self._dirty = True
+        if touch:
+            try:
+                os.utime(os.path.join(self.root, task_id))
+            except OSError:
+                pass
+
+    def start_background_refresh(self, interval: Optional[float] = None) -> bool:
+        """
+        启动后台刷新线程（守护线程），定期预热所有任务目录的缓存
+
+        Returns:
+            bool: 是否启动（间隔 <= 0 或已在运行时返回 False）
+        """
+        interval = self.REFRESH_INTERVAL if interval is None else interval
+        if interval <= 0 or (self._refresh_thread and self._refresh_thread.is_alive()):
+            return False
+
+        self._stop_event.clear()
+
+        def _loop():
+            while not self._stop_event.wait(interval):
+                try:
+                    self.snapshot()
+                except Exception as e:
+                    logger.warning(f"后台刷新目录大小缓存失败: {e}")
+
+        self._refresh_thread = threading.Thread(target=_loop, name="dir-size-refresh", daemon=True)
+        self._refresh_thread.start()
+        logger.info(f"目录大小缓存后台刷新已启动: interval={interval}s")
+        return True
+
+    def stop_background_refresh(self) -> None:
+        """停止后台刷新线程"""
+        self._stop_event.set()
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout=5)
+        self._refresh_thread = None
+
+
+# 全局缓存实例（history 根目录）
+_cache_instance: Optional[DirSizeCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_dir_size_cache() -> DirSizeCache:
+    """
+    获取 history 根目录的目录大小缓存（单例模式）
+
+    Returns:
+        DirSizeCache: 缓存实例
+    """
+    global _cache_instance
+    if _cache_instance is None:
+        with _cache_lock:
+            if _cache_instance is None:
+                root = os.path.join(
+                    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                    "history"
+                )
+                os.makedirs(root, exist_ok=True)
+                _cache_instance = DirSizeCache(root)
+    return _cache_instance
@@ -0,0 +1,336 @@
+"""
+图片生成调度器
+
+以前每次生成/批量重试都会新建一个 ThreadPoolExecutor(max_workers=15)，
+多个用户同时生成时上游调用数没有上限，也谈不上公平。这里改为进程级共享的调度器：
+
+- 全局并发上限（REDINK_GENERATION_MAX_CONCURRENT），由固定数量的 worker 线程执行
+- 按服务商的并发上限（image_providers.yaml 中的 max_concurrent），实际并发由
+  AdaptiveLimiter 根据 429/503 和耗时在该上限内自适应调整，并遵守 Retry-After
+- 按服务商的速率配额（rate_limit.rpm）：配额不足时调用留在队列中，不占用 worker
+- 按任务公平排队：每个任务一条队列，空闲槽位在有等待的任务之间轮询分配，
+  大任务不会把后来的小任务饿住；单个任务同时占用的槽位也有上限
+- queue_position() 给出任务在队列中的位置，用于在 SSE 流中推送排队事件
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Optional
+
+from backend.services.adaptive_limiter import AdaptiveLimiter, is_throttle_error, retry_after_seconds
+from backend.services.rate_limiter import ProviderRateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    """一次排队中的生成调用"""
+
+    __slots__ = ("task_id", "provider", "task_limit", "fn", "future")
+
+    def __init__(self, task_id: str, provider: str, task_limit: int, fn: Callable[[], Any]):
+        self.task_id = task_id
+        self.provider = provider
+        self.task_limit = task_limit
+        self.fn = fn
+        self.future: Future = Future()
+
+
+class GenerationScheduler:
+    """进程级共享的生成调度器：全局/服务商并发上限 + 任务间轮询公平排队"""
+
+    # 全局同时进行的生成调用数（worker 线程数）
+    MAX_CONCURRENT = int(os.environ.get("REDINK_GENERATION_MAX_CONCURRENT", "15"))
+
+    def __init__(self, max_concurrent: Optional[int] = None):
+        self.max_concurrent = max(1, self.MAX_CONCURRENT if max_concurrent is None else max_concurrent)
+        self._cond = threading.Condition()
+        # task_id -> 等待中的调用；字典顺序即轮询顺序
+        self._queues: "OrderedDict[str, Deque[_Job]]" = OrderedDict()
+        self._provider_limits: Dict[str, int] = {}
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+        self._rate_limiters: Dict[str, ProviderRateLimiter] = {}
+        # 最近一次调度时，最早恢复速率配额的服务商还需等待的秒数
+        self._rate_wait: Optional[float] = None
+        self._provider_running: Dict[str, int] = {}
+        self._task_running: Dict[str, int] = {}
+        self._running = 0
+        self._workers = []
+        self._shutdown = False
+        self._submitted = 0
+        self._completed = 0
+        self._cancelled = 0
+
+    # ==================== 配置 ====================
+
+    def set_provider_limit(self, provider: str, limit: Optional[int]) -> None:
+        """设置服务商并发上限（None 或 <= 0 表示只受全局上限约束）"""
+        with self._cond:
+            if limit and limit > 0:
+                self._provider_limits[provider] = int(limit)
+            else:
+                self._provider_limits.pop(provider, None)
+            if provider in self._limiters:
+                self._limiters[provider].set_max(self._max_limit(provider))
+            self._cond.notify_all()
+
+    def set_provider_rate_limiter(self, provider: str, rate_limiter: Optional[ProviderRateLimiter]) -> None:
+        """设置服务商的速率限制（None 表示不限制）"""
+        with self._cond:
+            if rate_limiter is not None:
+                self._rate_limiters[provider] = rate_limiter
+            else:
+                self._rate_limiters.pop(provider, None)
+            self._cond.notify_all()
+
+    def provider_limit(self, provider: str) -> int:
+        """服务商当前允许的并发数（自适应调整后的值）"""
+        with self._cond:
+            return self._limiter(provider).limit
+
+    def _max_limit(self, provider: str) -> int:
+        return min(self._provider_limits.get(provider, self.max_concurrent), self.max_concurrent)
+
+    def _limiter(self, provider: str) -> AdaptiveLimiter:
+        """取服务商的自适应限制（调用方持有锁）"""
+        limiter = self._limiters.get(provider)
+        if limiter is None:
+            limiter = self._limiters[provider] = AdaptiveLimiter(self._max_limit(provider))
+        return limiter
+
+    def record_result(self, provider: str, started: float, error: Optional[BaseException] = None) -> None:
+        """
+        反馈一次上游调用的结果，用于自适应调整该服务商的并发
+
+        Args:
+            provider: 服务商名称
+            started: 调用开始时的 time.monotonic()
+            error: 调用失败时的异常（429/503 会触发减并发和 Retry-After 暂停）
+        """
+        with self._cond:
+            limiter = self._limiter(provider)
+            if error is None:
+                limiter.on_success(started)
+            elif is_throttle_error(error):
+                limiter.on_throttle(started, retry_after_seconds(error))
+                logger.warning(
+                    f"服务商 {provider} 限流，并发降至 {limiter.limit}，"
+                    f"暂停派发 {limiter.blocked_for():.1f} 秒"
+                )
+            else:
+                limiter.on_error()
+            self._cond.notify_all()
+
+    # ==================== 提交与调度 ====================
+
+    def submit(
+        self,
+        task_id: str,
+        provider: str,
+        fn: Callable[[], Any],
+        task_limit: Optional[int] = None,
+    ) -> Future:
+        """
+        提交一次生成调用
+
+        Args:
+            task_id: 所属任务（公平排队的单位）
+            provider: 服务商名称（按服务商限流）
+            fn: 实际的生成函数
+            task_limit: 该任务最多同时占用的槽位数（默认不单独限制）
+
+        Returns:
+            Future: 调用结果；排队中的调用可以 cancel()
+        """
+        job = _Job(task_id, provider, task_limit or self.max_concurrent, fn)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("生成调度器已关闭")
+            self._queues.setdefault(task_id, deque()).append(job)
+            self._submitted += 1
+            self._ensure_workers()
+            self._cond.notify()
+        return job.future
+
+    def _ensure_workers(self) -> None:
+        while len(self._workers) < self.max_concurrent:
+            worker = threading.Thread(
+                target=self._worker,
+                name=f"generation-{len(self._workers)}",
+                daemon=True,
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_job(self) -> Optional[_Job]:
+        """按轮询顺序取出第一个可以执行的调用（调用方持有锁）"""
+        self._rate_wait = None
+        for task_id in list(self._queues):
+            queue = self._queues[task_id]
+            # 跳过排队期间已被取消的调用
+            while queue and queue[0].future.cancelled():
+                queue.popleft()
+                self._cancelled += 1
+            if not queue:
+                del self._queues[task_id]
+                continue
+
+            job = queue[0]
+            limiter = self._limiter(job.provider)
+            if limiter.blocked_for() > 0:
+                continue
+            if self._provider_running.get(job.provider, 0) >= limiter.limit:
+                continue
+            if self._task_running.get(task_id, 0) >= job.task_limit:
+                continue
+            rate_limiter = self._rate_limiters.get(job.provider)
+            if rate_limiter is not None:
+                # 其余条件都满足时才扣速率配额
+                wait = rate_limiter.try_acquire()
+                if wait > 0:
+                    self._rate_wait = wait if self._rate_wait is None else min(self._rate_wait, wait)
+                    continue
+
+            queue.popleft()
+            if queue:
+                # 轮到过的任务排到队尾
+                self._queues.move_to_end(task_id)
+            else:
+                del self._queues[task_id]
+            return job
+        return None
+
+    def _wake_timeout(self) -> Optional[float]:
+        """有服务商处于 Retry-After 暂停或等待速率配额时，返回最近一个可以恢复派发的时间（调用方持有锁）"""
+        blocked = [d for d in (limiter.blocked_for() for limiter in self._limiters.values()) if d > 0]
+        if self._rate_wait is not None:
+            blocked.append(self._rate_wait)
+        return min(blocked) if blocked else None
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._shutdown:
+                        return
+                    job = self._next_job()
+                    if job is not None:
+                        break
+                    self._cond.wait(self._wake_timeout())
+                self._running += 1
+                self._provider_running[job.provider] = self._provider_running.get(job.provider, 0) + 1
+                self._task_running[job.task_id] = self._task_running.get(job.task_id, 0) + 1
+
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    try:
+                        job.future.set_result(job.fn())
+                    except BaseException as e:
+                        job.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._completed += 1
+                    self._provider_running[job.provider] -= 1
+                    self._task_running[job.task_id] -= 1
+                    if self._task_running[job.task_id] <= 0:
+                        del self._task_running[job.task_id]
+                    self._cond.notify_all()
+
+    def cancel_task(self, task_id: str) -> int:
+        """取消某个任务所有尚未开始的调用，返回取消的数量"""
+        with self._cond:
+            queue = self._queues.pop(task_id, None)
+        cancelled = 0
+        for job in queue or ():
+            if job.future.cancel():
+                cancelled += 1
+        if cancelled:
+            with self._cond:
+                self._cancelled += cancelled
+        return cancelled
+
+    # ==================== 状态 ====================
+
+    def queue_position(self, task_id: str) -> Optional[Dict[str, int]]:
+        """
+        任务的排队位置
+
+        Returns:
+            Optional[Dict]: ahead=轮询顺序中排在前面的任务数，waiting=该任务等待中的调用数；
+                该任务没有等待中的调用时返回 None
+        """
+        with self._cond:
+            queue = self._queues.get(task_id)
+            waiting = sum(1 for job in queue or () if not job.future.cancelled())
+            if not waiting:
+                return None
+            return {
+                "ahead": list(self._queues).index(task_id),
+                "waiting": waiting,
+                "queued_tasks": len(self._queues),
+                "running": self._running,
+                "max_concurrent": self.max_concurrent,
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        """调度统计（管理面板健康检查）"""
+        with self._cond:
+            providers = {
+                name: {
+                    "running": self._provider_running.get(name, 0),
+                    **self._limiter(name).snapshot(),
+                }
+                for name in set(self._provider_limits) | set(self._provider_running) | set(self._limiters)
+            }
+            return {
+                "max_concurrent": self.max_concurrent,
+                "running": self._running,
+                "queued": sum(len(q) for q in self._queues.values()),
+                "queued_tasks": len(self._queues),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "cancelled": self._cancelled,
+                "providers": providers,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """关闭调度器（排队中的调用会被取消）"""
+        with self._cond:
+            self._shutdown = True
+            queues, self._queues = self._queues, OrderedDict()
+            workers = list(self._workers)
+            self._cond.notify_all()
+        for queue in queues.values():
+            for job in queue:
+                job.future.cancel()
+        if wait:
+            for worker in workers:
+                if worker is not threading.current_thread():
+                    worker.join()
+
+
+# 全局调度器实例
+_scheduler_instance: Optional[GenerationScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_generation_scheduler() -> GenerationScheduler:
+    """
+    获取生成调度器（单例模式）
+
+    ImageService 在配置更新后会被重建，调度器则在整个进程内共享，
+    正在排队/执行的调用不受影响。
+
+    Returns:
+        GenerationScheduler: 调度器实例
+    """
+    global _scheduler_instance
+    if _scheduler_instance is None:
+        with _scheduler_lock:
+            if _scheduler_instance is None:
+                _scheduler_instance = GenerationScheduler()
+    return _scheduler_instance
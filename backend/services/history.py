@@ -7,17 +7,45 @@
 
 import os
 import json
+import atexit
+import base64
+import binascii
 import logging
 import uuid
 import re
 import threading
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+import time
+import weakref
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, Tuple
 from pathlib import Path
 from enum import Enum
 
+from backend.services.dir_size_cache import get_dir_size_cache
+from backend.services.zip_cache import get_zip_bundle_cache
+from backend.services.history_search import build_search_document
+from backend.services.history_store import HistoryIndexStore, create_index_store
+from backend.utils.atomic_file import atomic_write_json
+from backend.utils.file_lock import FileLock
+
 logger = logging.getLogger(__name__)
 
+# 存活的 HistoryService 实例，进程正常退出时统一刷写尚未落盘的索引更新
+_live_services: "weakref.WeakSet[HistoryService]" = weakref.WeakSet()
+
+
+def _flush_all_services() -> None:
+    for service in list(_live_services):
+        try:
+            service.flush()
+        except Exception as e:
+            logger.error(f"退出时刷写历史索引失败: {e}")
+
+
+atexit.register(_flush_all_services)
+
 
 class RecordStatus:
     """历史记录状态常量"""
@@ -29,22 +57,48 @@ class RecordStatus:
 
 
 class HistoryService:
-    def __init__(self):
+    # 索引存储后端：sqlite（默认）或 json（旧版 index.json）
+    STORE_BACKEND = os.environ.get("REDINK_HISTORY_STORE", "sqlite")
+
+    # scan-all 并发扫描任务目录的线程数
+    SCAN_WORKERS = int(os.environ.get("REDINK_SCAN_WORKERS", "8"))
+
+    # 记录文件锁的分片数：不同记录落在不同的锁文件上，可以并发读改写
+    RECORD_LOCK_STRIPES = int(os.environ.get("REDINK_RECORD_LOCK_STRIPES", "64"))
+
+    # 索引写合并窗口（秒）：窗口内对同一批记录的索引更新合并为一次写入，<= 0 表示立即写入
+    INDEX_FLUSH_DELAY = float(os.environ.get("REDINK_INDEX_FLUSH_DELAY", "0.5"))
+
+    def __init__(self, history_dir: Optional[str] = None, store_backend: Optional[str] = None):
         """
         初始化历史记录服务
 
-        创建历史记录存储目录和索引文件
+        创建历史记录存储目录和索引存储
+
+        Args:
+            history_dir: 历史记录存储目录，默认为项目根目录/history
+            store_backend: 索引存储后端，默认为 STORE_BACKEND
         """
-        # 历史记录存储目录（项目根目录/history）
-        self.history_dir = os.path.join(
+        # 历史记录存储目录（索引在这里打开/迁移，必须在 _init_index 之前确定）
+        self.history_dir = history_dir or os.path.join(
             os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
             "history"
         )
         os.makedirs(self.history_dir, exist_ok=True)
+        if store_backend is not None:
+            self.STORE_BACKEND = store_backend
 
-        # 索引文件路径
+        # 旧版索引文件路径（json 后端直接使用；sqlite 后端首次启动时从这里迁移）
         self.index_file = os.path.join(self.history_dir, "index.json")
+        self._store: Optional[HistoryIndexStore] = None
+
+        # 待写入的索引更新 {record_id: 合并后的字段}，由定时器或读操作前的 flush() 落盘
+        self._pending_index: Dict[str, Dict[str, Any]] = {}
+        self._pending_lock = threading.RLock()
+        self._flush_timer: Optional[threading.Timer] = None
+
         self._init_index()
+        _live_services.add(self)
 
     def _safe_task_dir(self, task_id: str) -> Optional[Path]:
         """
@@ -78,36 +132,118 @@ class HistoryService:
 
     def _init_index(self) -> None:
         """
-        初始化索引文件
+        初始化索引存储
 
-        如果索引文件不存在，则创建一个空索引
+        按 STORE_BACKEND 打开 history_dir 下的索引；sqlite 后端会自动迁移旧版 index.json
         """
-        if not os.path.exists(self.index_file):
-            with open(self.index_file, "w", encoding="utf-8") as f:
-                json.dump({"records": []}, f, ensure_ascii=False, indent=2)
+        if self._store is not None:
+            self.flush()
+            self._store.close()
+        self._store = create_index_store(self.STORE_BACKEND, self.history_dir, self.index_file)
+        self._backfill_search_index()
 
-    def _load_index(self) -> Dict:
+    def _backfill_search_index(self) -> int:
         """
-        加载索引文件
+        为尚无检索文档的记录补建全文检索索引
+
+        用于从旧版索引迁移后、或检索索引被清空后的首次启动。
 
         Returns:
-            Dict: 索引数据，包含 records 列表
+            int: 补建的记录数
+        """
+        count = 0
+        for record_id in self._store.unindexed_ids():
+            record = self.get_record(record_id)
+            if record:
+                self._store.index_document(record_id, *build_search_document(record))
+                count += 1
+        if count:
+            logger.info(f"已补建 {count} 条历史记录的检索索引")
+        return count
+
+    def _queue_index_update(self, record_id: str, fields: Dict[str, Any]) -> None:
         """
+        登记一次索引更新（写后合并）
+
+        生成过程中前端会频繁 PUT 同一条记录，这里把窗口内的更新按 record_id 合并，
+        到期后由 flush() 一次性写入索引存储。完整记录文件仍然同步写入，
+        索引只是它的摘要，异常退出最多丢失一个窗口内的索引字段（可由 scan-all 修复）。
+        """
+        if self.INDEX_FLUSH_DELAY <= 0:
+            self._store.update(record_id, fields)
+            return
+
+        with self._pending_lock:
+            self._pending_index.setdefault(record_id, {}).update(fields)
+            if self._flush_timer is None:
+                timer = threading.Timer(self.INDEX_FLUSH_DELAY, self._flush_in_background)
+                timer.daemon = True
+                self._flush_timer = timer
+                timer.start()
+
+    def flush(self) -> int:
+        """
+        立即把合并中的索引更新写入索引存储
+
+        读取索引前、切换存储前和进程退出时会自动调用。
+
+        Returns:
+            int: 本次写入的记录数
+        """
+        with self._pending_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._pending_index:
+                return 0
+            pending, self._pending_index = self._pending_index, {}
+            try:
+                self._store.update_many(pending)
+            except Exception:
+                # 写入失败时放回队列（保留期间更新的新值），等待下次 flush 重试
+                for record_id, fields in pending.items():
+                    self._pending_index[record_id] = {**fields, **self._pending_index.get(record_id, {})}
+                raise
+            return len(pending)
+
+    def _flush_in_background(self) -> None:
+        """定时器回调：失败时只记录日志，待写入的更新保留到下次 flush"""
         try:
-            with open(self.index_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return {"records": []}
+            self.flush()
+        except Exception as e:
+            logger.error(f"刷写历史索引失败: {e}")
+
+    def _load_index(self) -> Dict:
+        """
+        加载索引
+
+        Returns:
+            Dict: 索引数据，包含 records 列表（按创建时间倒序）
+        """
+        self.flush()
+        return {"records": self._store.list_all()}
 
     def _save_index(self, index: Dict) -> None:
         """
-        保存索引文件
+        整体替换索引
 
         Args:
             index: 索引数据
         """
-        with open(self.index_file, "w", encoding="utf-8") as f:
-            json.dump(index, f, ensure_ascii=False, indent=2)
+        with self._pending_lock:
+            self._pending_index.clear()
+            self._store.replace_all(index.get("records", []))
+        self._backfill_search_index()
+
+    def _records_lock(self, record_id: str) -> FileLock:
+        """
+        单条记录文件的读改写锁（history_dir/.records-<分片>.lock）
+
+        跨线程、跨 worker 进程互斥，保护同一条记录“读取 -> 修改 -> 写回”整个过程；
+        按 record_id 稳定哈希分片，不同记录的更新（如 scan-all 的并发同步）互不阻塞。
+        """
+        stripe = zlib.crc32(str(record_id).encode("utf-8")) % max(1, self.RECORD_LOCK_STRIPES)
+        return FileLock(os.path.join(self.history_dir, f".records-{stripe}.lock"))
 
     def _get_record_path(self, record_id: str) -> str:
         """
@@ -200,12 +336,10 @@ class HistoryService:
 
         # 保存完整记录到独立文件
         record_path = self._get_record_path(record_id)
-        with open(record_path, "w", encoding="utf-8") as f:
-            json.dump(record, f, ensure_ascii=False, indent=2)
+        atomic_write_json(record_path, record)
 
         # 更新索引（用于快速列表查询）
-        index = self._load_index()
-        index["records"].insert(0, {
+        self._store.insert({
             "id": record_id,
             "title": topic,
             "created_at": now,
@@ -215,7 +349,7 @@ class HistoryService:
             "page_count": len(outline.get("pages", [])),  # 预期页数
             "task_id": task_id
         })
-        self._save_index(index)
+        self._store.index_document(record_id, *build_search_document(record))
 
         return record_id
 
@@ -298,10 +432,40 @@ class HistoryService:
             partial -> generating: 继续生成剩余图片
             partial -> completed: 剩余图片生成完成
         """
-        # 获取现有记录
-        record = self.get_record(record_id)
-        if not record:
-            return False
+        # 读改写在记录锁内完成，避免并发更新（含其它 worker 进程）互相覆盖
+        with self._records_lock(record_id):
+            # 获取现有记录
+            record = self.get_record(record_id)
+            if not record:
+                return False
+
+            return self._apply_record_update(
+                record_id,
+                record,
+                outline=outline,
+                images=images,
+                content=content,
+                status=status,
+                thumbnail=thumbnail
+            )
+
+    def _apply_record_update(
+        self,
+        record_id: str,
+        record: Dict,
+        outline: Optional[Dict] = None,
+        images: Optional[Dict] = None,
+        content: Optional[Dict] = None,
+        status: Optional[str] = None,
+        thumbnail: Optional[str] = None
+    ) -> bool:
+        """
+        将更新应用到已读取的记录上，并写回记录文件和索引
+
+        供已持有记录内容的调用方（如扫描同步）使用，避免重复读取记录文件。
+        """
+        # 大纲/内容变化时才需要重建检索文档
+        old_document = build_search_document(record) if (outline is not None or content is not None) else None
 
         # 更新时间戳
         now = datetime.now().isoformat()
@@ -331,34 +495,33 @@ class HistoryService:
         record_path = self._get_record_path(record_id)
         if not record_path:
             return False
-        with open(record_path, "w", encoding="utf-8") as f:
-            json.dump(record, f, ensure_ascii=False, indent=2)
+        atomic_write_json(record_path, record)
 
         # 同步更新索引
-        index = self._load_index()
-        for idx_record in index["records"]:
-            if idx_record["id"] == record_id:
-                idx_record["updated_at"] = now
+        idx_fields: Dict[str, Any] = {"updated_at": now}
 
-                # 更新状态
-                if status is not None:
-                    idx_record["status"] = status
+        # 更新状态
+        if status is not None:
+            idx_fields["status"] = status
 
-                # 更新缩略图
-                if thumbnail is not None:
-                    idx_record["thumbnail"] = thumbnail
+        # 更新缩略图
+        if thumbnail is not None:
+            idx_fields["thumbnail"] = thumbnail
 
-                # 更新页数（如果大纲被修改）
-                if outline is not None:
-                    idx_record["page_count"] = len(outline.get("pages", []))
+        # 更新页数（如果大纲被修改）
+        if outline is not None:
+            idx_fields["page_count"] = len(outline.get("pages", []))
 
-                # 更新任务 ID
-                if images is not None:
-                    idx_record["task_id"] = images.get("task_id")
+        # 更新任务 ID
+        if images is not None:
+            idx_fields["task_id"] = images.get("task_id")
 
-                break
+        self._queue_index_update(record_id, idx_fields)
 
-        self._save_index(index)
+        if old_document is not None:
+            document = build_search_document(record)
+            if document != old_document:
+                self._store.index_document(record_id, *document)
         return True
 
     def delete_record(self, record_id: str) -> bool:
@@ -376,55 +539,60 @@ class HistoryService:
         Returns:
             bool: 删除是否成功，记录不存在时返回 False
         """
-        record = self.get_record(record_id)
-        if not record:
-            return False
-
-        # 删除关联的任务图片目录
-        if record.get("images") and record["images"].get("task_id"):
-            task_id = record["images"]["task_id"]
-            # 防止路径遍历/符号链接导致误删任意目录
-            if re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9._-]{0,127}", str(task_id) or ""):
-                try:
-                    base = Path(self.history_dir).resolve()
-                    raw_dir = (Path(self.history_dir) / str(task_id))
-
-                    # Never delete symlinks
-                    if raw_dir.is_symlink():
-                        logger.warning(f"跳过符号链接任务目录: {raw_dir}")
-                    else:
-                        resolved = raw_dir.resolve()
-                        resolved.relative_to(base)
-                        if resolved.exists() and resolved.is_dir():
-                            import shutil
-                            shutil.rmtree(str(resolved))
-                            logger.info(f"已删除任务目录: {resolved}")
-                except Exception as e:
-                    logger.error(f"删除任务目录失败: {task_id}, {e}")
-            else:
-                logger.warning(f"任务目录 task_id 不安全，已跳过删除: {task_id}")
+        with self._records_lock(record_id):
+            record = self.get_record(record_id)
+            if not record:
+                return False
+
+            # 删除关联的任务图片目录
+            if record.get("images") and record["images"].get("task_id"):
+                task_id = record["images"]["task_id"]
+                # 防止路径遍历/符号链接导致误删任意目录
+                if re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9._-]{0,127}", str(task_id) or ""):
+                    try:
+                        base = Path(self.history_dir).resolve()
+                        raw_dir = (Path(self.history_dir) / str(task_id))
+
+                        # Never delete symlinks
+                        if raw_dir.is_symlink():
+                            logger.warning(f"跳过符号链接任务目录: {raw_dir}")
+                        else:
+                            resolved = raw_dir.resolve()
+                            resolved.relative_to(base)
+                            if resolved.exists() and resolved.is_dir():
+                                import shutil
+                                shutil.rmtree(str(resolved))
+                                get_dir_size_cache().invalidate(task_id, touch=False)
+                                get_zip_bundle_cache().invalidate(task_id)
+                                logger.info(f"已删除任务目录: {resolved}")
+                    except Exception as e:
+                        logger.error(f"删除任务目录失败: {task_id}, {e}")
+                else:
+                    logger.warning(f"任务目录 task_id 不安全，已跳过删除: {task_id}")
 
-        # 删除记录 JSON 文件
-        record_path = self._get_record_path(record_id)
-        if not record_path:
-            return False
-        try:
-            os.remove(record_path)
-        except Exception:
-            return False
+            # 删除记录 JSON 文件
+            record_path = self._get_record_path(record_id)
+            if not record_path:
+                return False
+            try:
+                os.remove(record_path)
+            except Exception:
+                return False
 
-        # 从索引中移除
-        index = self._load_index()
-        index["records"] = [r for r in index["records"] if r["id"] != record_id]
-        self._save_index(index)
+            # 从索引中移除（连同尚未写入的索引更新）
+            with self._pending_lock:
+                self._pending_index.pop(record_id, None)
+                self._store.delete(record_id)
 
-        return True
+            return True
 
     def list_records(
         self,
         page: int = 1,
         page_size: int = 20,
-        status: Optional[str] = None
+        status: Optional[str] = None,
+        sort: str = "created_at",
+        order: str = "desc"
     ) -> Dict:
         """
         分页获取历史记录列表
@@ -433,6 +601,8 @@ class HistoryService:
             page: 页码，从 1 开始
             page_size: 每页记录数
             status: 状态过滤（可选），支持：draft/generating/partial/completed/error
+            sort: 排序字段，created_at（默认）或 updated_at
+            order: desc（默认）或 asc
 
         Returns:
             Dict: 分页结果
@@ -442,18 +612,15 @@ class HistoryService:
                 - page_size: 每页大小
                 - total_pages: 总页数
         """
-        index = self._load_index()
-        records = index.get("records", [])
-
-        # 按状态过滤
-        if status:
-            records = [r for r in records if r.get("status") == status]
-
-        # 分页计算
-        total = len(records)
-        start = (page - 1) * page_size
-        end = start + page_size
-        page_records = records[start:end]
+        # 按状态过滤 + 分页（由索引存储完成）
+        self.flush()
+        page_records, total = self._store.query(
+            status=status or None,
+            offset=(page - 1) * page_size,
+            limit=page_size,
+            sort=sort,
+            descending=self._is_descending(order)
+        )
 
         return {
             "records": page_records,
@@ -463,27 +630,125 @@ class HistoryService:
             "total_pages": (total + page_size - 1) // page_size
         }
 
+    @staticmethod
+    def _is_descending(order: str) -> bool:
+        order = (order or "desc").lower()
+        if order not in ("asc", "desc"):
+            raise ValueError(f"不支持的排序方向: {order}（可选：asc/desc）")
+        return order == "desc"
+
+    @staticmethod
+    def _encode_cursor(sort: str, order: str, record: Dict) -> str:
+        payload = json.dumps([sort, order, record.get(sort) or "", record.get("id")], ensure_ascii=False)
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def _decode_cursor(cursor: str, sort: str, order: str) -> Tuple[str, str]:
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            c_sort, c_order, value, record_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        except (ValueError, TypeError, binascii.Error):
+            raise ValueError("cursor 无效")
+        if c_sort != sort or c_order != order:
+            raise ValueError("cursor 与当前排序参数不一致，请从第一页重新获取")
+        return str(value), str(record_id)
+
+    def list_records_after(
+        self,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+        status: Optional[str] = None,
+        sort: str = "created_at",
+        order: str = "desc"
+    ) -> Dict:
+        """
+        游标分页获取历史记录列表
+
+        按 (sort 字段, id) 做键集分页：深翻页与第一页代价相同，
+        翻页过程中新增记录也不会导致结果重复或遗漏。
+
+        Args:
+            cursor: 上一页返回的 next_cursor，为空表示第一页
+            limit: 每页记录数
+            status: 状态过滤（可选）
+            sort: 排序字段，created_at（默认）或 updated_at
+            order: desc（默认）或 asc
+
+        Returns:
+            Dict: 分页结果
+                - records: 当前页的记录列表
+                - next_cursor: 下一页游标，没有更多记录时为 None
+                - has_more: 是否还有更多记录
+                - limit / sort / order: 本次使用的参数
+        """
+        descending = self._is_descending(order)
+        order = "desc" if descending else "asc"
+        after = self._decode_cursor(cursor, sort, order) if cursor else None
+
+        self.flush()
+        # 多取一条用于判断是否还有下一页
+        rows = self._store.query_after(
+            status=status or None,
+            sort=sort,
+            descending=descending,
+            after=after,
+            limit=limit + 1
+        )
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        return {
+            "records": rows,
+            "next_cursor": self._encode_cursor(sort, order, rows[-1]) if has_more and rows else None,
+            "has_more": has_more,
+            "limit": limit,
+            "sort": sort,
+            "order": order
+        }
+
     def search_records(self, keyword: str) -> List[Dict]:
         """
         根据关键词搜索历史记录
 
+        检索范围包括标题、大纲、生成的标题/文案/标签；中文按单字/双字匹配，
+        英文等按单词前缀匹配（不区分大小写），多个词需同时命中。
+
         Args:
-            keyword: 搜索关键词（不区分大小写）
+            keyword: 搜索关键词
 
         Returns:
-            List[Dict]: 匹配的记录列表（按创建时间倒序）
+            List[Dict]: 全部匹配的记录（按相关度降序，同分按创建时间倒序）
         """
-        index = self._load_index()
-        records = index.get("records", [])
+        self.flush()
+        records, _ = self._store.search(keyword, offset=0, limit=None)
+        return records
 
-        # 不区分大小写的标题搜索
-        keyword_lower = keyword.lower()
-        results = [
-            r for r in records
-            if keyword_lower in r.get("title", "").lower()
-        ]
+    def search_records_page(
+        self,
+        keyword: str,
+        page: int = 1,
+        page_size: int = 20
+    ) -> Dict:
+        """
+        分页搜索历史记录（匹配规则同 search_records）
 
-        return results
+        Returns:
+            Dict: 分页结果，字段同 list_records
+        """
+        self.flush()
+        page_records, total = self._store.search(
+            keyword,
+            offset=(page - 1) * page_size,
+            limit=page_size
+        )
+
+        return {
+            "records": page_records,
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "total_pages": (total + page_size - 1) // page_size
+        }
 
     def get_statistics(self) -> Dict:
         """
@@ -498,23 +763,55 @@ class HistoryService:
                     - partial: 部分完成数
                     - completed: 已完成数
                     - error: 错误数
-        """
-        index = self._load_index()
-        records = index.get("records", [])
-
-        total = len(records)
-        status_count = {}
 
+        计数器随记录的增删和状态变化增量维护，这里只读取计数器（O(状态数)）。
+        """
         # 统计各状态的记录数
-        for record in records:
-            status = record.get("status", RecordStatus.DRAFT)
-            status_count[status] = status_count.get(status, 0) + 1
+        self.flush()
+        status_count = self._store.count_by_status()
+        total = sum(status_count.values())
 
         return {
             "total": total,
             "by_status": status_count
         }
 
+    def get_daily_counts(self, days: int = 30) -> Dict[str, int]:
+        """
+        获取最近若干天每天新建的记录数
+
+        Args:
+            days: 天数（含今天）
+
+        Returns:
+            Dict[str, int]: {YYYY-MM-DD: 新建记录数}，按日期升序，没有新建记录的日期不返回
+        """
+        since = (datetime.now() - timedelta(days=max(1, days) - 1)).strftime("%Y-%m-%d")
+        return self._store.count_by_day(since)
+
+    def reconcile_statistics(self) -> Dict:
+        """
+        从全部索引条目重新计算统计计数器
+
+        用于计数器与实际数据不一致时（例如手动修改过索引）的修复。
+
+        Returns:
+            Dict: 重算后的统计数据（同 get_statistics）
+        """
+        self.flush()
+        self._store.reconcile_stats()
+        return self.get_statistics()
+
+    def get_referenced_task_ids(self) -> List[str]:
+        """
+        获取所有历史记录关联的任务 ID
+
+        Returns:
+            List[str]: 去重后的 task_id 列表（用于识别孤儿任务目录）
+        """
+        self.flush()
+        return self._store.referenced_task_ids()
+
     def scan_and_sync_task_images(self, task_id: str) -> Dict[str, Any]:
         """
         扫描任务文件夹，同步图片列表
@@ -535,6 +832,8 @@ class HistoryService:
                 - images_count: 图片数量
                 - images: 图片文件名列表
                 - status: 更新后的状态
+                - updated: 记录是否发生变化（未变化时不会重写记录）
+                - updated_at: 关联记录的 updated_at
                 - error: 错误信息（失败时）
         """
         task_path = self._safe_task_dir(task_id)
@@ -545,129 +844,229 @@ class HistoryService:
             }
 
         try:
-            # 扫描目录下所有图片文件（排除缩略图）
-            image_files: List[str] = []
-            index_to_file: Dict[int, str] = {}
-            for filename in os.listdir(str(task_path)):
-                # 跳过缩略图文件（以 thumb_ 开头）
-                if filename.startswith('thumb_'):
-                    continue
-                if filename.endswith('.png') or filename.endswith('.jpg') or filename.endswith('.jpeg'):
-                    image_files.append(filename)
-                    try:
-                        idx = int(filename.split('.')[0])
-                        index_to_file[idx] = filename
-                    except Exception:
-                        pass
+            self.flush()
+            return self._sync_task_images(task_id, os.listdir(str(task_path)))
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"扫描任务失败: {str(e)}"
+            }
+
+    def _sync_task_images(self, task_id: str, filenames: List[str]) -> Dict[str, Any]:
+        """
+        根据任务目录的文件列表同步关联记录
 
-            # 按文件名排序（数字排序）
-            def get_index(filename):
+        只在关联记录的锁内读改写该记录；调用方需先 flush()，保证 task_id 反向索引是最新的。
+
+        Args:
+            task_id: 任务 ID
+            filenames: 任务目录下的文件名列表
+        """
+        # 扫描目录下所有图片文件（排除缩略图）
+        image_files: List[str] = []
+        index_to_file: Dict[int, str] = {}
+        for filename in filenames:
+            # 跳过缩略图文件（以 thumb_ 开头）
+            if filename.startswith('thumb_'):
+                continue
+            if filename.endswith('.png') or filename.endswith('.jpg') or filename.endswith('.jpeg'):
+                image_files.append(filename)
                 try:
-                    return int(filename.split('.')[0])
-                except:
-                    return 999
-
-            image_files.sort(key=get_index)
-
-            # 查找关联的历史记录
-            index = self._load_index()
-            record_id = None
-            for rec in index.get("records", []):
-                # 通过遍历所有记录，找到 task_id 匹配的记录
-                record_detail = self.get_record(rec["id"])
-                if record_detail and record_detail.get("images", {}).get("task_id") == task_id:
-                    record_id = rec["id"]
+                    idx = int(filename.split('.')[0])
+                    index_to_file[idx] = filename
+                except Exception:
+                    pass
+
+        # 按文件名排序（数字排序）
+        def get_index(filename):
+            try:
+                return int(filename.split('.')[0])
+            except:
+                return 999
+
+        image_files.sort(key=get_index)
+
+        # 通过 task_id 反向索引查找关联的历史记录
+        record_id = self._store.find_by_task_id(task_id)
+        if not record_id:
+            return self._unlinked_task_result(task_id, image_files)
+
+        with self._records_lock(record_id):
+            return self._sync_record_images(task_id, record_id, image_files, index_to_file)
+
+    def _unlinked_task_result(self, task_id: str, image_files: List[str]) -> Dict[str, Any]:
+        """没有关联记录的任务目录的扫描结果"""
+        return {
+            "success": True,
+            "task_id": task_id,
+            "images_count": len(image_files),
+            "images": image_files,
+            "no_record": True
+        }
+
+    def _sync_record_images(
+        self,
+        task_id: str,
+        record_id: str,
+        image_files: List[str],
+        index_to_file: Dict[int, str]
+    ) -> Dict[str, Any]:
+        """在记录锁内读取关联记录并同步图片列表和状态（只读取一次记录文件）"""
+        record = self.get_record(record_id)
+        if record and (record.get("images") or {}).get("task_id") != task_id:
+            # 索引与记录文件不一致（例如记录文件被手动修改），以记录文件为准
+            logger.warning(f"索引中的 task_id 与记录不一致，已忽略: record={record_id}, task_id={task_id}")
+            self._store.update(record_id, {"task_id": (record.get("images") or {}).get("task_id")})
+            record = None
+
+        if record:
+            # 根据生成图片数量判断状态
+            expected_count = len(record.get("outline", {}).get("pages", []))
+            aligned: List[Optional[str]] = [None] * expected_count
+            for idx, fname in index_to_file.items():
+                if 0 <= idx < expected_count:
+                    aligned[idx] = fname
+
+            done_count = sum(1 for x in aligned if x)
+
+            if expected_count <= 0 or done_count == 0:
+                status = RecordStatus.DRAFT  # 无图片：草稿
+            elif done_count == expected_count:
+                status = RecordStatus.COMPLETED  # 全部完成
+            else:
+                status = RecordStatus.PARTIAL  # 部分完成
+
+            pages = record.get("outline", {}).get("pages", []) or []
+            cover_index = 0
+            for p in pages:
+                if isinstance(p, dict) and p.get("type") == "cover":
+                    try:
+                        cover_index = int(p.get("index", 0))
+                    except Exception:
+                        cover_index = 0
                     break
 
-            if record_id:
-                # 更新历史记录
-                record = self.get_record(record_id)
-                if record:
-                    # 根据生成图片数量判断状态
-                    expected_count = len(record.get("outline", {}).get("pages", []))
-                    aligned: List[Optional[str]] = [None] * expected_count
-                    for idx, fname in index_to_file.items():
-                        if 0 <= idx < expected_count:
-                            aligned[idx] = fname
-
-                    done_count = sum(1 for x in aligned if x)
-
-                    if expected_count <= 0 or done_count == 0:
-                        status = RecordStatus.DRAFT  # 无图片：草稿
-                    elif done_count == expected_count:
-                        status = RecordStatus.COMPLETED  # 全部完成
-                    else:
-                        status = RecordStatus.PARTIAL  # 部分完成
-
-                    pages = record.get("outline", {}).get("pages", []) or []
-                    cover_index = 0
-                    for p in pages:
-                        if isinstance(p, dict) and p.get("type") == "cover":
-                            try:
-                                cover_index = int(p.get("index", 0))
-                            except Exception:
-                                cover_index = 0
-                            break
-
-                    thumbnail = None
-                    if 0 <= cover_index < len(aligned) and aligned[cover_index]:
-                        thumbnail = aligned[cover_index]
-                    else:
-                        for x in aligned:
-                            if x:
-                                thumbnail = x
-                                break
-
-                    # 更新图片列表和状态
-                    self.update_record(
-                        record_id,
-                        images={
-                            "task_id": task_id,
-                            "generated": aligned
-                        },
-                        status=status,
-                        thumbnail=thumbnail
-                    )
-
-                    return {
-                        "success": True,
-                        "record_id": record_id,
-                        "task_id": task_id,
-                        "images_count": done_count,
-                        "images": aligned,
-                        "status": status
-                    }
-
-            # 没有关联的记录，返回扫描结果
+            thumbnail = None
+            if 0 <= cover_index < len(aligned) and aligned[cover_index]:
+                thumbnail = aligned[cover_index]
+            else:
+                for x in aligned:
+                    if x:
+                        thumbnail = x
+                        break
+
+            images = {
+                "task_id": task_id,
+                "generated": aligned
+            }
+
+            # 内容未变化时不重写记录（避免无意义地刷新 updated_at）
+            updated = (
+                record.get("images") != images
+                or record.get("status") != status
+                or (thumbnail is not None and record.get("thumbnail") != thumbnail)
+            )
+            if updated:
+                # 更新图片列表和状态
+                self._apply_record_update(
+                    record_id,
+                    record,
+                    images=images,
+                    status=status,
+                    thumbnail=thumbnail
+                )
+
             return {
                 "success": True,
+                "record_id": record_id,
                 "task_id": task_id,
-                "images_count": len(image_files),
-                "images": image_files,
-                "no_record": True
+                "images_count": done_count,
+                "images": aligned,
+                "status": status,
+                "updated": updated,
+                "updated_at": record.get("updated_at")
             }
 
+        # 没有关联的记录，返回扫描结果
+        return self._unlinked_task_result(task_id, image_files)
+
+    def _task_dir_watermark(self, task_id: str, filenames: List[str], mtime_ns: int) -> List[Any]:
+        """
+        任务目录水位线：目录 mtime、条目数，以及关联记录的 ID 和 updated_at
+
+        任一项变化（增删图片、记录被修改/新建/删除）都会触发重新扫描。
+        调用方需先 flush()，保证读到的索引是最新的。
+        """
+        record_id = self._store.find_by_task_id(task_id)
+        entry = self._store.get(record_id) if record_id else None
+        return [mtime_ns, len(filenames), record_id or "", (entry or {}).get("updated_at") or ""]
+
+    def _scan_task_dir(self, task_id: str, watermark: Optional[List[Any]]) -> Tuple[Dict[str, Any], Optional[List[Any]]]:
+        """
+        scan_all_tasks 的单目录扫描（在线程池中执行）
+
+        Args:
+            task_id: 任务 ID
+            watermark: 上次扫描记录的水位线，None 表示强制扫描
+
+        Returns:
+            (扫描结果, 本次水位线)；扫描失败时水位线为 None
+        """
+        task_path = self._safe_task_dir(task_id)
+        if not task_path:
+            return {
+                "success": False,
+                "task_id": task_id,
+                "error": f"任务目录不存在或路径不安全: {task_id}"
+            }, None
+
+        try:
+            mtime_ns = os.stat(str(task_path)).st_mtime_ns
+            filenames = os.listdir(str(task_path))
+            current = self._task_dir_watermark(task_id, filenames, mtime_ns)
+            if watermark is not None and list(watermark) == current:
+                return {
+                    "success": True,
+                    "task_id": task_id,
+                    "skipped": True,
+                    "no_record": not current[2]
+                }, current
+
+            result = self._sync_task_images(task_id, filenames)
+            if result.get("updated"):
+                # 记录被改写后 updated_at 已变化（索引更新要等扫描结束后统一 flush），直接取记录中的新值
+                current = [mtime_ns, len(filenames), result["record_id"], result.get("updated_at") or ""]
+            return result, current
         except Exception as e:
             return {
                 "success": False,
+                "task_id": task_id,
                 "error": f"扫描任务失败: {str(e)}"
-            }
+            }, None
 
-    def scan_all_tasks(self) -> Dict[str, Any]:
+    def scan_all_tasks(self, incremental: bool = False) -> Dict[str, Any]:
         """
         扫描所有任务文件夹，同步图片列表
 
         批量扫描 history 目录下的所有任务文件夹，
-        同步图片列表并更新记录状态。
+        同步图片列表并更新记录状态。目录在有界线程池中并发扫描。
+
+        Args:
+            incremental: 增量模式，跳过水位线（目录 mtime/条目数/关联记录）未变化的目录
 
         Returns:
             Dict[str, Any]: 扫描结果统计
                 - success: 是否成功
-                - total_tasks: 扫描的任务总数
-                - synced: 成功同步的任务数
+                - incremental: 是否为增量模式
+                - total_tasks: 任务目录总数
+                - scanned: 实际扫描的目录数
+                - skipped: 因未变化而跳过的目录数
+                - updated: 记录发生变化并被改写的目录数
+                - synced: 成功同步（有关联记录）的任务数
                 - failed: 失败的任务数
                 - orphan_tasks: 孤立任务列表（有图片但无记录）
-                - results: 详细结果列表
+                - results: 实际扫描目录的详细结果列表
+                - elapsed_ms: 耗时（毫秒）
                 - error: 错误信息（失败时）
         """
         if not os.path.exists(self.history_dir):
@@ -676,42 +1075,72 @@ class HistoryService:
                 "error": "历史记录目录不存在"
             }
 
+        started = time.monotonic()
         try:
             synced_count = 0
             failed_count = 0
+            skipped_count = 0
+            updated_count = 0
             orphan_tasks = []  # 没有关联记录的任务
             results = []
 
-            # 遍历 history 目录
-            for item in os.listdir(self.history_dir):
-                item_path = os.path.join(self.history_dir, item)
-
-                # 只处理目录（任务文件夹）
-                if not os.path.isdir(item_path):
-                    continue
-
-                # 假设任务文件夹名就是 task_id
-                task_id = item
+            # 遍历 history 目录（scandir 自带文件类型信息，无需逐项 stat）
+            with os.scandir(self.history_dir) as entries:
+                # 任务文件夹名就是 task_id
+                task_ids = sorted(e.name for e in entries if e.is_dir())
+
+            previous = self._store.load_scan_watermarks() if incremental else {}
+            watermarks: Dict[str, List[Any]] = {}
+
+            # 扫描前统一 flush 一次：各目录的扫描只读索引，不再逐个 flush
+            self.flush()
+
+            workers = max(1, min(self.SCAN_WORKERS, len(task_ids) or 1))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # 扫描并同步（map 保持目录顺序，结果顺序稳定）
+                outcomes = executor.map(
+                    lambda tid: self._scan_task_dir(tid, previous.get(tid) if incremental else None),
+                    task_ids
+                )
+                for task_id, (result, watermark) in zip(task_ids, outcomes):
+                    if watermark is not None:
+                        watermarks[task_id] = watermark
+
+                    if result.get("skipped"):
+                        skipped_count += 1
+                        if result.get("no_record"):
+                            orphan_tasks.append(task_id)
+                        continue
+
+                    results.append(result)
+                    if result.get("success"):
+                        if result.get("no_record"):
+                            orphan_tasks.append(task_id)
+                        else:
+                            synced_count += 1
+                            if result.get("updated"):
+                                updated_count += 1
+                    else:
+                        failed_count += 1
 
-                # 扫描并同步
-                result = self.scan_and_sync_task_images(task_id)
-                results.append(result)
+            # 扫描中合并的索引更新统一写入一次
+            self.flush()
 
-                if result.get("success"):
-                    if result.get("no_record"):
-                        orphan_tasks.append(task_id)
-                    else:
-                        synced_count += 1
-                else:
-                    failed_count += 1
+            # 只保留仍存在的目录的水位线
+            self._store.save_scan_watermarks(watermarks)
 
             return {
                 "success": True,
-                "total_tasks": len(results),
+                "incremental": incremental,
+                "total_tasks": len(task_ids),
+                "scanned": len(results),
+                "skipped": skipped_count,
+                "updated": updated_count,
                 "synced": synced_count,
                 "failed": failed_count,
                 "orphan_tasks": orphan_tasks,
-                "results": results
+                "results": results,
+                "elapsed_ms": int((time.monotonic() - started) * 1000)
             }
 
         except Exception as e:
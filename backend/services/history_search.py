@@ -0,0 +1,230 @@
+"""
+历史记录全文检索
+
+负责把一条历史记录转换为可检索的文本（标题 + 大纲 + 生成的标题/文案/标签），
+以及两种索引后端共用的分词规则：
+
+- 中日韩文字：按连续片段切分为单字 + 相邻双字（bigram），
+  查询时两个字以上的片段按 bigram 精确匹配，单个字按单字匹配
+- 其它文字（英文、数字等）：按单词切分并转为小写，查询时按前缀匹配
+
+SqliteIndexStore 把分好的词写入 FTS5 表（bm25 排序）；
+JsonIndexStore 使用本模块的 InvertedIndex（内存倒排索引，同样按 BM25 打分）。
+"""
+
+import math
+import re
+import bisect
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# 中日韩统一表意文字（含扩展 A）、兼容表意文字、日文假名、韩文音节
+_CJK_RANGES = (
+    "\u3040-\u30ff"
+    "\u3400-\u4dbf"
+    "\u4e00-\u9fff"
+    "\uac00-\ud7af"
+    "\uf900-\ufaff"
+)
+_TOKEN_RE = re.compile(rf"([{_CJK_RANGES}]+)|([^\W_{_CJK_RANGES}]+)")
+
+# 标题的权重高于正文
+TITLE_WEIGHT = 3.0
+BODY_WEIGHT = 1.0
+
+# BM25 参数
+_K1 = 1.2
+_B = 0.75
+
+# (词, 是否前缀匹配)
+QueryTerm = Tuple[str, bool]
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    把文本切分为索引词
+
+    中日韩片段输出单字和相邻双字，其它文字按单词输出（小写）。
+    """
+    tokens: List[str] = []
+    for cjk, word in _TOKEN_RE.findall((text or "").lower()):
+        if word:
+            tokens.append(word)
+            continue
+        tokens.extend(cjk)
+        tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+
+def parse_query(keyword: str) -> List[QueryTerm]:
+    """
+    把搜索关键词切分为查询词（所有词都需命中）
+
+    Returns:
+        List[QueryTerm]: 去重后的 (词, 是否前缀匹配) 列表
+    """
+    terms: List[QueryTerm] = []
+    for cjk, word in _TOKEN_RE.findall((keyword or "").lower()):
+        if word:
+            terms.append((word, True))
+        elif len(cjk) == 1:
+            terms.append((cjk, False))
+        else:
+            terms.extend((cjk[i:i + 2], False) for i in range(len(cjk) - 1))
+    return list(dict.fromkeys(terms))
+
+
+def fts5_match_expression(terms: List[QueryTerm]) -> str:
+    """把查询词转换为 FTS5 MATCH 表达式（隐式 AND）"""
+    parts = []
+    for term, prefix in terms:
+        quoted = '"' + term.replace('"', '""') + '"'
+        parts.append(quoted + "*" if prefix else quoted)
+    return " ".join(parts)
+
+
+def _collect_text(value: Any, out: List[str]) -> None:
+    if isinstance(value, str):
+        if value:
+            out.append(value)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _collect_text(v, out)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _collect_text(v, out)
+
+
+def build_search_document(record: Dict) -> Tuple[str, str]:
+    """
+    从完整记录中提取检索文本
+
+    Returns:
+        (标题, 正文)：正文包含大纲原文与各页内容、生成的标题、文案和标签
+    """
+    outline = record.get("outline") or {}
+    content = record.get("content") or {}
+
+    parts: List[str] = []
+    if isinstance(outline, dict):
+        _collect_text(outline.get("raw"), parts)
+        for page in outline.get("pages") or []:
+            if isinstance(page, dict):
+                _collect_text(page.get("content"), parts)
+            else:
+                _collect_text(page, parts)
+    if isinstance(content, dict):
+        _collect_text(content.get("titles"), parts)
+        _collect_text(content.get("copywriting"), parts)
+        _collect_text(content.get("tags"), parts)
+
+    return record.get("title") or "", "\n".join(parts)
+
+
+class InvertedIndex:
+    """
+    内存倒排索引（JsonIndexStore 使用）
+
+    postings: 词 -> {record_id: (标题词频, 正文词频)}
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._doc_len: Dict[str, Tuple[int, int]] = {}
+        self._sorted_terms: Optional[List[str]] = None
+        self._total_len = [0, 0]
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self._doc_terms
+
+    def add(self, record_id: str, title: str, body: str) -> None:
+        """添加或替换一篇文档"""
+        self.remove(record_id)
+        title_tokens = tokenize(title)
+        body_tokens = tokenize(body)
+
+        counts: Dict[str, List[int]] = {}
+        for token in title_tokens:
+            counts.setdefault(token, [0, 0])[0] += 1
+        for token in body_tokens:
+            counts.setdefault(token, [0, 0])[1] += 1
+
+        for token, (tf_title, tf_body) in counts.items():
+            if token not in self._postings:
+                self._sorted_terms = None
+            self._postings.setdefault(token, {})[record_id] = (tf_title, tf_body)
+
+        self._doc_terms[record_id] = list(counts)
+        self._doc_len[record_id] = (len(title_tokens), len(body_tokens))
+        self._total_len[0] += len(title_tokens)
+        self._total_len[1] += len(body_tokens)
+
+    def remove(self, record_id: str) -> None:
+        """删除一篇文档（不存在时忽略）"""
+        terms = self._doc_terms.pop(record_id, None)
+        if terms is None:
+            return
+        for token in terms:
+            docs = self._postings.get(token)
+            if docs is None:
+                continue
+            docs.pop(record_id, None)
+            if not docs:
+                del self._postings[token]
+                self._sorted_terms = None
+        title_len, body_len = self._doc_len.pop(record_id)
+        self._total_len[0] -= title_len
+        self._total_len[1] -= body_len
+
+    def _expand(self, term: str, prefix: bool) -> Iterable[str]:
+        if not prefix:
+            return [term] if term in self._postings else []
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        matched = []
+        i = bisect.bisect_left(self._sorted_terms, term)
+        while i < len(self._sorted_terms) and self._sorted_terms[i].startswith(term):
+            matched.append(self._sorted_terms[i])
+            i += 1
+        return matched
+
+    def search(self, terms: List[QueryTerm]) -> List[Tuple[str, float]]:
+        """
+        查询所有词都命中的文档
+
+        Returns:
+            List[Tuple[str, float]]: (record_id, BM25 得分)，未排序
+        """
+        if not terms or not self._doc_terms:
+            return []
+
+        n_docs = len(self._doc_terms)
+        avg_title = (self._total_len[0] / n_docs) or 1.0
+        avg_body = (self._total_len[1] / n_docs) or 1.0
+
+        scores: Optional[Dict[str, float]] = None
+        for term, prefix in terms:
+            term_scores: Dict[str, float] = {}
+            for token in self._expand(term, prefix):
+                docs = self._postings[token]
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for record_id, (tf_title, tf_body) in docs.items():
+                    title_len, body_len = self._doc_len[record_id]
+                    tf = (
+                        TITLE_WEIGHT * tf_title / (1 - _B + _B * title_len / avg_title)
+                        + BODY_WEIGHT * tf_body / (1 - _B + _B * body_len / avg_body)
+                    )
+                    score = idf * tf * (_K1 + 1) / (tf + _K1)
+                    term_scores[record_id] = max(term_scores.get(record_id, 0.0), score)
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {rid: s + term_scores[rid] for rid, s in scores.items() if rid in term_scores}
+            if not scores:
+                return []
+
+        return list((scores or {}).items())
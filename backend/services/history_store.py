@@ -0,0 +1,970 @@
+"""
+历史记录索引存储
+
+HistoryService 的列表/搜索/统计只依赖索引条目（不含大纲、图片等大字段），
+完整记录仍以 `{record_id}.json` 独立文件保存。
+
+本模块把索引的读写抽象为可插拔的存储后端：
+- SqliteIndexStore: 默认后端，SQLite（WAL 模式）+ 常用字段索引，单条增删改不再重写全部索引
+- JsonIndexStore: 旧版 `index.json` 整文件读写，仅用于兼容（REDINK_HISTORY_STORE=json）
+
+两种后端都维护全文检索文档（SQLite 为 FTS5 表，JSON 为 search_index.json + 内存倒排索引），
+分词规则见 history_search。
+
+以及从旧版 `index.json` 一次性迁移到 SQLite 的 migrate_json_index()。
+"""
+
+import os
+import json
+import bisect
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+from backend.services.history_search import InvertedIndex, fts5_match_expression, parse_query, tokenize
+from backend.utils.atomic_file import atomic_write_json
+from backend.utils.file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+# 索引条目字段（顺序即 API 返回的字段顺序）
+INDEX_FIELDS = (
+    "id",
+    "title",
+    "created_at",
+    "updated_at",
+    "status",
+    "thumbnail",
+    "page_count",
+    "task_id",
+)
+
+# 允许通过 update() 修改的字段
+UPDATABLE_FIELDS = frozenset(INDEX_FIELDS) - {"id", "created_at"}
+
+# 列表可排序的字段
+SORT_FIELDS = ("created_at", "updated_at")
+
+
+def _check_sort(sort: str) -> str:
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"不支持的排序字段: {sort}（可选：{'/'.join(SORT_FIELDS)}）")
+    return sort
+
+
+def _normalize_entry(entry: Dict) -> Dict:
+    """只保留索引字段，并补齐缺失字段的默认值"""
+    return {
+        "id": str(entry.get("id")),
+        "title": entry.get("title") or "",
+        "created_at": entry.get("created_at") or "",
+        "updated_at": entry.get("updated_at") or entry.get("created_at") or "",
+        "status": entry.get("status") or "draft",
+        "thumbnail": entry.get("thumbnail"),
+        "page_count": int(entry.get("page_count") or 0),
+        "task_id": entry.get("task_id"),
+    }
+
+
+def _created_day(entry: Dict) -> str:
+    """创建日期（YYYY-MM-DD），用于按天统计"""
+    return (entry.get("created_at") or "")[:10]
+
+
+def _count_records(records: List[Dict]) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """从头统计 (各状态记录数, 每天新建记录数)"""
+    by_status: Dict[str, int] = {}
+    by_day: Dict[str, int] = {}
+    for r in records:
+        status = r.get("status", "draft")
+        by_status[status] = by_status.get(status, 0) + 1
+        day = _created_day(r)
+        by_day[day] = by_day.get(day, 0) + 1
+    return by_status, by_day
+
+
+def _is_stale(entry: Dict, fields: Dict) -> bool:
+    """待写入的 fields 是否比索引中已有的条目更旧（按 updated_at 比较）"""
+    updated_at = fields.get("updated_at")
+    return bool(updated_at) and (entry.get("updated_at") or "") > updated_at
+
+
+class HistoryIndexStore(ABC):
+    """历史记录索引存储后端抽象基类"""
+
+    @abstractmethod
+    def insert(self, entry: Dict) -> None:
+        """插入一条索引条目（最新创建的记录排在最前）"""
+
+    @abstractmethod
+    def update(self, record_id: str, fields: Dict) -> bool:
+        """部分更新索引条目，记录不存在时返回 False"""
+
+    def update_many(self, updates: Dict[str, Dict]) -> int:
+        """
+        批量更新多条索引条目 {record_id: fields}
+
+        默认逐条调用 update()；后端可覆盖为单次写入/单个事务。
+        fields 带 updated_at 时，若索引中的条目已被更新的写入覆盖（例如另一个 worker 进程），
+        则跳过该条目，避免延迟写入把新值改回旧值。
+
+        Returns:
+            int: 实际存在并被更新的条目数
+        """
+        updated = 0
+        for record_id, fields in updates.items():
+            entry = self.get(record_id)
+            if entry is None or _is_stale(entry, fields):
+                continue
+            updated += 1 if self.update(record_id, fields) else 0
+        return updated
+
+    @abstractmethod
+    def delete(self, record_id: str) -> bool:
+        """删除索引条目，记录不存在时返回 False"""
+
+    @abstractmethod
+    def get(self, record_id: str) -> Optional[Dict]:
+        """获取单条索引条目"""
+
+    @abstractmethod
+    def list_all(self) -> List[Dict]:
+        """返回全部索引条目（按创建时间倒序）"""
+
+    @abstractmethod
+    def query(
+        self,
+        status: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 20,
+        sort: str = "created_at",
+        descending: bool = True
+    ) -> Tuple[List[Dict], int]:
+        """
+        分页查询索引条目（默认按创建时间倒序）
+
+        Returns:
+            (当前页条目, 满足过滤条件的总数)
+        """
+
+    @abstractmethod
+    def query_after(
+        self,
+        status: Optional[str] = None,
+        sort: str = "created_at",
+        descending: bool = True,
+        after: Optional[Tuple[str, str]] = None,
+        limit: int = 20
+    ) -> List[Dict]:
+        """
+        键集（keyset）分页：按 (sort 字段, id) 排序，返回位于 after 之后的最多 limit 条
+
+        与 offset 分页不同，翻页代价与页数无关，且翻页期间插入新记录不会导致重复或遗漏。
+
+        Args:
+            after: 上一页最后一条的 (sort 字段值, id)，None 表示从头开始
+        """
+
+    @abstractmethod
+    def search_titles(self, keyword: str) -> List[Dict]:
+        """标题包含关键词（不区分大小写）的条目"""
+
+    @abstractmethod
+    def index_document(self, record_id: str, title: str, body: str) -> None:
+        """写入/替换一条记录的全文检索文档（见 history_search.build_search_document）"""
+
+    @abstractmethod
+    def search(
+        self,
+        keyword: str,
+        offset: int = 0,
+        limit: Optional[int] = 20
+    ) -> Tuple[List[Dict], int]:
+        """
+        全文检索（所有查询词都需命中），按相关度降序，同分按创建时间倒序
+
+        Args:
+            limit: 每页条数，None 表示返回全部
+
+        Returns:
+            (当前页条目, 命中总数)
+        """
+
+    @abstractmethod
+    def unindexed_ids(self) -> List[str]:
+        """尚未写入检索文档的记录 ID（用于启动时补建检索索引）"""
+
+    @abstractmethod
+    def count_by_status(self) -> Dict[str, int]:
+        """各状态的记录数（读取增量维护的计数器，不扫描全部条目）"""
+
+    @abstractmethod
+    def count_by_day(self, since: Optional[str] = None) -> Dict[str, int]:
+        """
+        每天新建的记录数 {YYYY-MM-DD: n}（按日期升序）
+
+        Args:
+            since: 起始日期（含），None 表示全部
+        """
+
+    @abstractmethod
+    def reconcile_stats(self) -> Dict[str, int]:
+        """从全部索引条目重新计算统计计数器，返回重算后的各状态记录数"""
+
+    @abstractmethod
+    def find_by_task_id(self, task_id: str) -> Optional[str]:
+        """根据 task_id 反查记录 ID（多条记录共用时取最新创建的一条）"""
+
+    @abstractmethod
+    def referenced_task_ids(self) -> List[str]:
+        """所有记录关联的 task_id（去重，不含空值）"""
+
+    @abstractmethod
+    def replace_all(self, entries: List[Dict]) -> None:
+        """用给定列表整体替换索引（列表顺序为创建时间倒序）"""
+
+    @abstractmethod
+    def load_scan_watermarks(self) -> Dict[str, List]:
+        """读取 scan-all 增量扫描的目录水位线 {task_id: watermark}"""
+
+    @abstractmethod
+    def save_scan_watermarks(self, watermarks: Dict[str, List]) -> None:
+        """整体替换目录水位线"""
+
+    def is_empty(self) -> bool:
+        return not self.query(offset=0, limit=1)[0]
+
+    def close(self) -> None:
+        """释放后端资源"""
+
+
+class JsonIndexStore(HistoryIndexStore):
+    """
+    旧版 index.json 索引
+
+    每次操作都会读取/重写整个文件，记录数较多时开销为 O(总记录数)。
+    读改写在跨进程文件锁（index.json.lock）内完成，写入为临时文件 + os.replace，
+    因此读取无需加锁，多 worker 进程共享同一个 index.json 也不会丢失更新。
+    """
+
+    def __init__(self, index_file: str):
+        self.index_file = index_file
+        self.watermarks_file = os.path.join(os.path.dirname(index_file), "scan_watermarks.json")
+        # 检索文档 {record_id: [标题, 正文]}，倒排索引只在内存中构建
+        self.search_file = os.path.join(os.path.dirname(index_file), "search_index.json")
+        self._lock = FileLock(index_file + ".lock")
+        self._search_index: Optional[InvertedIndex] = None
+        self._search_stamp: Optional[Tuple[int, int]] = None
+        # 只读快照与排序视图，按 index.json 的文件戳失效（其它进程写入后同样会失效）
+        self._snapshot_cache: Optional[Tuple[Tuple, List[Dict]]] = None
+        self._sorted_cache: Dict[str, Tuple[Tuple, List[Tuple[str, str]], List[Dict]]] = {}
+        # (文件戳, 各状态计数, 每天计数)：在每次写入时顺带计算，读取统计时无需再扫描
+        self._stats_cache: Optional[Tuple[Tuple, Dict[str, int], Dict[str, int]]] = None
+        with self._lock:
+            if not os.path.exists(self.index_file):
+                self._write({"records": []})
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if not isinstance(index, dict) or not isinstance(index.get("records"), list):
+                return {"records": []}
+            return index
+        except Exception:
+            return {"records": []}
+
+    def _write(self, index: Dict) -> None:
+        atomic_write_json(self.index_file, index)
+        self._snapshot_cache = None
+        self._sorted_cache = {}
+        # 整文件写入本身就是 O(总记录数)，计数器在此处一并更新
+        self._stats_cache = (self._index_stamp(), *_count_records(index["records"]))
+
+    def _stats(self) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """当前统计计数器；index.json 被其它进程改写过时重新统计"""
+        stamp = self._index_stamp()
+        cached = self._stats_cache
+        if cached is not None and stamp is not None and cached[0] == stamp:
+            return cached[1], cached[2]
+        by_status, by_day = _count_records(self._snapshot())
+        self._stats_cache = (stamp, by_status, by_day)
+        return by_status, by_day
+
+    def _index_stamp(self) -> Optional[Tuple]:
+        try:
+            st = os.stat(self.index_file)
+            return st.st_ino, st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _snapshot(self) -> List[Dict]:
+        """只读的索引条目列表（调用方不得修改），文件未变化时复用上次解析结果"""
+        stamp = self._index_stamp()
+        cached = self._snapshot_cache
+        if cached is not None and stamp is not None and cached[0] == stamp:
+            return cached[1]
+        records = self._read()["records"]
+        self._snapshot_cache = (stamp, records)
+        return records
+
+    def _sorted_view(self, sort: str) -> Tuple[List[Tuple[str, str]], List[Dict]]:
+        """按 (sort 字段, id) 升序排列的键和条目，文件未变化时不重建"""
+        records = self._snapshot()
+        stamp = self._snapshot_cache[0] if self._snapshot_cache else None
+        cached = self._sorted_cache.get(sort)
+        if cached is not None and stamp is not None and cached[0] == stamp:
+            return cached[1], cached[2]
+        entries = sorted(records, key=lambda r: (r.get(sort) or "", r.get("id") or ""))
+        keys = [(r.get(sort) or "", r.get("id") or "") for r in entries]
+        self._sorted_cache[sort] = (stamp, keys, entries)
+        return keys, entries
+
+    def insert(self, entry: Dict) -> None:
+        with self._lock:
+            index = self._read()
+            index["records"].insert(0, _normalize_entry(entry))
+            self._write(index)
+
+    def update(self, record_id: str, fields: Dict) -> bool:
+        with self._lock:
+            index = self._read()
+            for idx_record in index["records"]:
+                if idx_record.get("id") == record_id:
+                    for key, value in fields.items():
+                        if key in UPDATABLE_FIELDS:
+                            idx_record[key] = value
+                    self._write(index)
+                    return True
+            return False
+
+    def update_many(self, updates: Dict[str, Dict]) -> int:
+        # 一次读取 + 一次写入，代替逐条重写整个文件
+        with self._lock:
+            index = self._read()
+            updated = 0
+            for idx_record in index["records"]:
+                fields = updates.get(idx_record.get("id"))
+                if fields is None or _is_stale(idx_record, fields):
+                    continue
+                for key, value in fields.items():
+                    if key in UPDATABLE_FIELDS:
+                        idx_record[key] = value
+                updated += 1
+            if updated:
+                self._write(index)
+            return updated
+
+    def delete(self, record_id: str) -> bool:
+        with self._lock:
+            index = self._read()
+            remaining = [r for r in index["records"] if r.get("id") != record_id]
+            if len(remaining) == len(index["records"]):
+                return False
+            index["records"] = remaining
+            self._write(index)
+            if record_id in self._load_search_index():
+                self._update_search_docs({record_id: None})
+            return True
+
+    def get(self, record_id: str) -> Optional[Dict]:
+        for r in self._read()["records"]:
+            if r.get("id") == record_id:
+                return r
+        return None
+
+    def list_all(self) -> List[Dict]:
+        return self._read()["records"]
+
+    def query(
+        self,
+        status: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 20,
+        sort: str = "created_at",
+        descending: bool = True
+    ) -> Tuple[List[Dict], int]:
+        _check_sort(sort)
+        records = self._snapshot()
+        if sort != "created_at" or not descending:
+            # index.json 本身即创建时间倒序；其它排序为稳定排序，同值保持该顺序
+            records = sorted(records, key=lambda r: r.get(sort) or "", reverse=descending)
+        if status:
+            records = [r for r in records if r.get("status") == status]
+        offset = max(0, offset)
+        return [dict(r) for r in records[offset:offset + max(0, limit)]], len(records)
+
+    def query_after(
+        self,
+        status: Optional[str] = None,
+        sort: str = "created_at",
+        descending: bool = True,
+        after: Optional[Tuple[str, str]] = None,
+        limit: int = 20
+    ) -> List[Dict]:
+        keys, entries = self._sorted_view(_check_sort(sort))
+        if descending:
+            end = bisect.bisect_left(keys, tuple(after)) if after else len(keys)
+            positions = range(end - 1, -1, -1)
+        else:
+            start = bisect.bisect_right(keys, tuple(after)) if after else 0
+            positions = range(start, len(keys))
+
+        page: List[Dict] = []
+        for i in positions:
+            if len(page) >= limit:
+                break
+            entry = entries[i]
+            if status and entry.get("status") != status:
+                continue
+            page.append(dict(entry))
+        return page
+
+    def search_titles(self, keyword: str) -> List[Dict]:
+        keyword_lower = (keyword or "").lower()
+        return [
+            r for r in self._read()["records"]
+            if keyword_lower in (r.get("title") or "").lower()
+        ]
+
+    @staticmethod
+    def _file_stamp(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _read_search_docs(self) -> Dict[str, List[str]]:
+        try:
+            with open(self.search_file, "r", encoding="utf-8") as f:
+                docs = json.load(f)
+            return docs if isinstance(docs, dict) else {}
+        except Exception:
+            return {}
+
+    def _load_search_index(self) -> InvertedIndex:
+        """返回内存倒排索引；检索文件被其它进程改写过时重新构建（调用方需持有 self._lock）"""
+        stamp = self._file_stamp(self.search_file)
+        if self._search_index is None or stamp != self._search_stamp:
+            index = InvertedIndex()
+            for record_id, doc in self._read_search_docs().items():
+                if isinstance(doc, list) and len(doc) == 2:
+                    index.add(record_id, doc[0], doc[1])
+            self._search_index, self._search_stamp = index, stamp
+        return self._search_index
+
+    def _update_search_docs(self, changes: Dict[str, Optional[Tuple[str, str]]]) -> None:
+        """增量修改检索文档（值为 None 表示删除），同时更新内存倒排索引"""
+        with self._lock:
+            index = self._load_search_index()
+            docs = self._read_search_docs()
+            for record_id, doc in changes.items():
+                if doc is None:
+                    docs.pop(record_id, None)
+                    index.remove(record_id)
+                else:
+                    docs[record_id] = list(doc)
+                    index.add(record_id, *doc)
+            atomic_write_json(self.search_file, docs, indent=None)
+            self._search_stamp = self._file_stamp(self.search_file)
+
+    def index_document(self, record_id: str, title: str, body: str) -> None:
+        self._update_search_docs({record_id: (title, body)})
+
+    def search(
+        self,
+        keyword: str,
+        offset: int = 0,
+        limit: Optional[int] = 20
+    ) -> Tuple[List[Dict], int]:
+        terms = parse_query(keyword)
+        if not terms:
+            return [], 0
+        with self._lock:
+            scores = dict(self._load_search_index().search(terms))
+        # index.json 本身按创建时间倒序，稳定排序后同分条目保持该顺序
+        records = [r for r in self._read()["records"] if r.get("id") in scores]
+        records.sort(key=lambda r: -scores[r["id"]])
+        offset = max(0, offset)
+        end = None if limit is None else offset + max(0, limit)
+        return records[offset:end], len(records)
+
+    def unindexed_ids(self) -> List[str]:
+        with self._lock:
+            index = self._load_search_index()
+            return [r["id"] for r in self._read()["records"] if r.get("id") not in index]
+
+    def count_by_status(self) -> Dict[str, int]:
+        return dict(self._stats()[0])
+
+    def count_by_day(self, since: Optional[str] = None) -> Dict[str, int]:
+        by_day = self._stats()[1]
+        return {day: n for day, n in sorted(by_day.items()) if not since or day >= since}
+
+    def reconcile_stats(self) -> Dict[str, int]:
+        self._stats_cache = None
+        return self.count_by_status()
+
+    def find_by_task_id(self, task_id: str) -> Optional[str]:
+        for r in self._read()["records"]:
+            if r.get("task_id") == task_id:
+                return r.get("id")
+        return None
+
+    def referenced_task_ids(self) -> List[str]:
+        return sorted({str(r["task_id"]) for r in self._read()["records"] if r.get("task_id")})
+
+    def replace_all(self, entries: List[Dict]) -> None:
+        with self._lock:
+            normalized = [_normalize_entry(e) for e in entries]
+            self._write({"records": normalized})
+            keep = {e["id"] for e in normalized}
+            stale = [rid for rid in self._read_search_docs() if rid not in keep]
+            if stale:
+                self._update_search_docs({rid: None for rid in stale})
+
+    def load_scan_watermarks(self) -> Dict[str, List]:
+        try:
+            with open(self.watermarks_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception:
+            return {}
+
+    def save_scan_watermarks(self, watermarks: Dict[str, List]) -> None:
+        with self._lock:
+            atomic_write_json(self.watermarks_file, watermarks, indent=None)
+
+
+class SqliteIndexStore(HistoryIndexStore):
+    """
+    SQLite 索引（WAL 模式）
+
+    - status / created_at / updated_at / task_id 均建有索引
+    - WAL 允许读写并发，多进程（多 worker）共享同一个数据库文件也是安全的
+    - 单连接 + 进程内锁，避免跨线程共享游标
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS records (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL DEFAULT '',
+        created_at TEXT NOT NULL DEFAULT '',
+        updated_at TEXT NOT NULL DEFAULT '',
+        status TEXT NOT NULL DEFAULT 'draft',
+        thumbnail TEXT,
+        page_count INTEGER NOT NULL DEFAULT 0,
+        task_id TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_records_status ON records(status, created_at);
+    CREATE INDEX IF NOT EXISTS idx_records_created_at ON records(created_at);
+    CREATE INDEX IF NOT EXISTS idx_records_updated_at ON records(updated_at);
+    CREATE INDEX IF NOT EXISTS idx_records_task_id ON records(task_id);
+    CREATE INDEX IF NOT EXISTS idx_records_created_id ON records(created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_records_updated_id ON records(updated_at, id);
+    CREATE INDEX IF NOT EXISTS idx_records_status_updated ON records(status, updated_at, id);
+    CREATE TABLE IF NOT EXISTS scan_watermarks (
+        task_id TEXT PRIMARY KEY,
+        watermark TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+
+    -- 统计计数器：由触发器随 records 的增删改在同一事务内维护
+    CREATE TABLE IF NOT EXISTS status_counts (
+        status TEXT PRIMARY KEY,
+        n INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS daily_counts (
+        day TEXT PRIMARY KEY,
+        n INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TRIGGER IF NOT EXISTS trg_records_stats_insert AFTER INSERT ON records BEGIN
+        INSERT INTO status_counts (status, n) VALUES (NEW.status, 1)
+            ON CONFLICT(status) DO UPDATE SET n = n + 1;
+        INSERT INTO daily_counts (day, n) VALUES (substr(NEW.created_at, 1, 10), 1)
+            ON CONFLICT(day) DO UPDATE SET n = n + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_records_stats_delete AFTER DELETE ON records BEGIN
+        UPDATE status_counts SET n = n - 1 WHERE status = OLD.status;
+        UPDATE daily_counts SET n = n - 1 WHERE day = substr(OLD.created_at, 1, 10);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_records_stats_status AFTER UPDATE OF status ON records
+    WHEN OLD.status IS NOT NEW.status BEGIN
+        UPDATE status_counts SET n = n - 1 WHERE status = OLD.status;
+        INSERT INTO status_counts (status, n) VALUES (NEW.status, 1)
+            ON CONFLICT(status) DO UPDATE SET n = n + 1;
+    END;
+    """
+
+    # 计数器版本：meta 中缺少该值（旧数据库升级）时在打开时重算一次
+    _STATS_VERSION = "1"
+
+    # 全文检索表：rowid 与 records.rowid 一致，列内容为 history_search.tokenize() 分好的词
+    _FTS_SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(
+        title, body, tokenize = 'unicode61 remove_diacritics 0'
+    );
+    """
+
+    # created_at 相同时按插入顺序（rowid）倒序，与旧版 index.json 的 insert(0) 行为一致
+    _ORDER_BY = "ORDER BY created_at DESC, rowid DESC"
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        with self._conn:
+            self._conn.executescript(self._SCHEMA)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'stats_version'").fetchone()
+        if row is None or row[0] != self._STATS_VERSION:
+            self.reconcile_stats()
+        try:
+            with self._conn:
+                self._conn.executescript(self._FTS_SCHEMA)
+            self._fts = True
+        except sqlite3.OperationalError as e:
+            # 极少数 SQLite 编译时未启用 FTS5，此时退化为标题子串搜索
+            logger.warning(f"SQLite 不支持 FTS5，历史记录搜索退化为标题匹配: {e}")
+            self._fts = False
+
+    @staticmethod
+    def _row_to_entry(row: sqlite3.Row) -> Dict:
+        return {key: row[key] for key in INDEX_FIELDS}
+
+    def _fetch(self, sql: str, params: tuple = ()) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row_to_entry(r) for r in rows]
+
+    def _delete_document(self, record_id: str) -> None:
+        if self._fts:
+            self._conn.execute(
+                "DELETE FROM records_fts WHERE rowid = (SELECT rowid FROM records WHERE id = ?)", (record_id,)
+            )
+
+    def insert(self, entry: Dict) -> None:
+        e = _normalize_entry(entry)
+        with self._lock, self._conn:
+            # INSERT OR REPLACE 会分配新的 rowid，先清掉旧行对应的检索文档；
+            # REPLACE 隐式删除旧行时不会触发 DELETE 触发器，因此显式删除以保持计数器准确
+            self._delete_document(e["id"])
+            self._conn.execute("DELETE FROM records WHERE id = ?", (e["id"],))
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO records ({', '.join(INDEX_FIELDS)}) "
+                f"VALUES ({', '.join('?' for _ in INDEX_FIELDS)})",
+                tuple(e[k] for k in INDEX_FIELDS),
+            )
+
+    def update(self, record_id: str, fields: Dict) -> bool:
+        columns = [k for k in fields if k in UPDATABLE_FIELDS]
+        with self._lock, self._conn:
+            if not columns:
+                row = self._conn.execute("SELECT 1 FROM records WHERE id = ?", (record_id,)).fetchone()
+                return row is not None
+            assignments = ", ".join(f"{c} = ?" for c in columns)
+            cur = self._conn.execute(
+                f"UPDATE records SET {assignments} WHERE id = ?",
+                tuple(fields[c] for c in columns) + (record_id,),
+            )
+            return cur.rowcount > 0
+
+    def update_many(self, updates: Dict[str, Dict]) -> int:
+        # 单个事务内完成，只提交（fsync）一次
+        updated = 0
+        with self._lock, self._conn:
+            for record_id, fields in updates.items():
+                columns = [k for k in fields if k in UPDATABLE_FIELDS]
+                if not columns:
+                    continue
+                assignments = ", ".join(f"{c} = ?" for c in columns)
+                where, params = "id = ?", (record_id,)
+                if fields.get("updated_at"):
+                    where, params = "id = ? AND updated_at <= ?", (record_id, fields["updated_at"])
+                cur = self._conn.execute(
+                    f"UPDATE records SET {assignments} WHERE {where}",
+                    tuple(fields[c] for c in columns) + params,
+                )
+                updated += cur.rowcount
+        return updated
+
+    def delete(self, record_id: str) -> bool:
+        with self._lock, self._conn:
+            self._delete_document(record_id)
+            cur = self._conn.execute("DELETE FROM records WHERE id = ?", (record_id,))
+            return cur.rowcount > 0
+
+    def get(self, record_id: str) -> Optional[Dict]:
+        rows = self._fetch("SELECT * FROM records WHERE id = ?", (record_id,))
+        return rows[0] if rows else None
+
+    def list_all(self) -> List[Dict]:
+        return self._fetch(f"SELECT * FROM records {self._ORDER_BY}")
+
+    def query(
+        self,
+        status: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 20,
+        sort: str = "created_at",
+        descending: bool = True
+    ) -> Tuple[List[Dict], int]:
+        _check_sort(sort)
+        direction = "DESC" if descending else "ASC"
+        where, params = ("WHERE status = ?", (status,)) if status else ("", ())
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM records {where}", params).fetchone()[0]
+        rows = self._fetch(
+            f"SELECT * FROM records {where} ORDER BY {sort} {direction}, rowid {direction} LIMIT ? OFFSET ?",
+            params + (max(0, limit), max(0, offset)),
+        )
+        return rows, total
+
+    def query_after(
+        self,
+        status: Optional[str] = None,
+        sort: str = "created_at",
+        descending: bool = True,
+        after: Optional[Tuple[str, str]] = None,
+        limit: int = 20
+    ) -> List[Dict]:
+        _check_sort(sort)
+        direction, op = ("DESC", "<") if descending else ("ASC", ">")
+        clauses: List[str] = []
+        params: List = []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if after:
+            # 行值比较可直接利用 (sort, id) 复合索引
+            clauses.append(f"({sort}, id) {op} (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._fetch(
+            f"SELECT * FROM records {where} ORDER BY {sort} {direction}, id {direction} LIMIT ?",
+            tuple(params) + (max(0, limit),),
+        )
+
+    def search_titles(self, keyword: str) -> List[Dict]:
+        # SQLite 的 LIKE/lower() 只处理 ASCII 大小写，这里在 Python 侧比较以保持旧行为
+        keyword_lower = (keyword or "").lower()
+        with self._lock:
+            rows = self._conn.execute(f"SELECT id, title FROM records {self._ORDER_BY}").fetchall()
+        ids = [r["id"] for r in rows if keyword_lower in (r["title"] or "").lower()]
+        if not ids:
+            return []
+        by_id = {
+            e["id"]: e for e in self._fetch(
+                f"SELECT * FROM records WHERE id IN ({', '.join('?' for _ in ids)})", tuple(ids)
+            )
+        }
+        return [by_id[i] for i in ids if i in by_id]
+
+    def index_document(self, record_id: str, title: str, body: str) -> None:
+        if not self._fts:
+            return
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT rowid FROM records WHERE id = ?", (record_id,)).fetchone()
+            if row is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO records_fts (rowid, title, body) VALUES (?, ?, ?)",
+                (row[0], " ".join(tokenize(title)), " ".join(tokenize(body))),
+            )
+
+    def search(
+        self,
+        keyword: str,
+        offset: int = 0,
+        limit: Optional[int] = 20
+    ) -> Tuple[List[Dict], int]:
+        if not self._fts:
+            rows = self.search_titles(keyword)
+            offset = max(0, offset)
+            end = None if limit is None else offset + max(0, limit)
+            return rows[offset:end], len(rows)
+
+        terms = parse_query(keyword)
+        if not terms:
+            return [], 0
+        match = fts5_match_expression(terms)
+        with self._lock:
+            total = self._conn.execute(
+                "SELECT COUNT(*) FROM records_fts WHERE records_fts MATCH ?", (match,)
+            ).fetchone()[0]
+        # bm25() 越小越相关；列权重：title 3.0，body 1.0
+        rows = self._fetch(
+            "SELECT r.* FROM records_fts JOIN records r ON r.rowid = records_fts.rowid "
+            "WHERE records_fts MATCH ? "
+            "ORDER BY bm25(records_fts, 3.0, 1.0), r.created_at DESC, r.rowid DESC "
+            "LIMIT ? OFFSET ?",
+            (match, -1 if limit is None else max(0, limit), max(0, offset)),
+        )
+        return rows, total
+
+    def unindexed_ids(self) -> List[str]:
+        if not self._fts:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM records WHERE rowid NOT IN (SELECT rowid FROM records_fts)"
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, n FROM status_counts WHERE n > 0").fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+    def count_by_day(self, since: Optional[str] = None) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT day, n FROM daily_counts WHERE n > 0 AND day >= ? ORDER BY day", (since or "",)
+            ).fetchall()
+        return {r["day"]: r["n"] for r in rows}
+
+    def reconcile_stats(self) -> Dict[str, int]:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM status_counts")
+            self._conn.execute("DELETE FROM daily_counts")
+            self._conn.execute(
+                "INSERT INTO status_counts (status, n) SELECT status, COUNT(*) FROM records GROUP BY status"
+            )
+            self._conn.execute(
+                "INSERT INTO daily_counts (day, n) "
+                "SELECT substr(created_at, 1, 10), COUNT(*) FROM records GROUP BY substr(created_at, 1, 10)"
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('stats_version', ?)", (self._STATS_VERSION,)
+            )
+        return self.count_by_status()
+
+    def find_by_task_id(self, task_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT id FROM records WHERE task_id = ? {self._ORDER_BY} LIMIT 1", (task_id,)
+            ).fetchone()
+        return row["id"] if row else None
+
+    def referenced_task_ids(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT task_id FROM records WHERE task_id IS NOT NULL AND task_id != '' ORDER BY task_id"
+            ).fetchall()
+        return [str(r[0]) for r in rows]
+
+    def replace_all(self, entries: List[Dict]) -> None:
+        normalized = [_normalize_entry(e) for e in entries]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM records")
+            if self._fts:
+                # rowid 会重新分配，检索文档需要由调用方重新写入（见 unindexed_ids）
+                self._conn.execute("DELETE FROM records_fts")
+            # 列表为创建时间倒序，倒序插入使 rowid 与旧版 index.json 的先后顺序一致
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO records ({', '.join(INDEX_FIELDS)}) "
+                f"VALUES ({', '.join('?' for _ in INDEX_FIELDS)})",
+                [tuple(e[k] for k in INDEX_FIELDS) for e in reversed(normalized)],
+            )
+        # 列表中可能有重复 id（REPLACE 不触发删除触发器），整体替换后重算计数器
+        self.reconcile_stats()
+
+    def load_scan_watermarks(self) -> Dict[str, List]:
+        with self._lock:
+            rows = self._conn.execute("SELECT task_id, watermark FROM scan_watermarks").fetchall()
+        result: Dict[str, List] = {}
+        for r in rows:
+            try:
+                result[r["task_id"]] = json.loads(r["watermark"])
+            except Exception:
+                continue
+        return result
+
+    def save_scan_watermarks(self, watermarks: Dict[str, List]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM scan_watermarks")
+            self._conn.executemany(
+                "INSERT INTO scan_watermarks (task_id, watermark) VALUES (?, ?)",
+                [(task_id, json.dumps(wm)) for task_id, wm in watermarks.items()],
+            )
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM records LIMIT 1").fetchone() is None
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+
+
+def create_index_store(backend: str, history_dir: str, index_file: str) -> HistoryIndexStore:
+    """
+    根据后端名称创建索引存储
+
+    Args:
+        backend: sqlite 或 json
+        history_dir: 历史记录目录
+        index_file: 旧版 index.json 路径（json 后端直接使用；sqlite 后端用于迁移）
+    """
+    backend = (backend or "sqlite").strip().lower()
+    if backend == "json":
+        return JsonIndexStore(index_file)
+    if backend != "sqlite":
+        raise ValueError(f"不支持的历史记录存储后端: {backend}（可选：sqlite/json）")
+
+    store = SqliteIndexStore(os.path.join(history_dir, "index.db"))
+    # 多个 worker 同时启动时只允许一个进程执行迁移
+    with FileLock(os.path.join(history_dir, ".index.lock")):
+        migrate_json_index(index_file, store)
+    return store
+
+
+def migrate_json_index(index_file: str, store: HistoryIndexStore) -> int:
+    """
+    将旧版 index.json 一次性导入到新的存储后端
+
+    仅当 index.json 存在且目标存储为空时导入；导入完成后 index.json 会被重命名为
+    index.json.migrated，避免之后（例如记录被全部删除后）重复导入。
+
+    Returns:
+        int: 导入的记录数
+    """
+    if not index_file or not os.path.exists(index_file):
+        return 0
+
+    try:
+        with open(index_file, "r", encoding="utf-8") as f:
+            records = (json.load(f) or {}).get("records", [])
+        if not isinstance(records, list):
+            records = []
+    except Exception as e:
+        logger.error(f"读取旧版索引失败，跳过迁移: {index_file}, {e}")
+        return 0
+
+    imported = 0
+    if store.is_empty():
+        entries = [r for r in records if isinstance(r, dict) and r.get("id")]
+        store.replace_all(entries)
+        imported = len(entries)
+    else:
+        logger.warning(f"索引存储已有数据，跳过导入旧版索引: {index_file}")
+
+    try:
+        os.replace(index_file, index_file + ".migrated")
+    except Exception as e:
+        logger.warning(f"重命名旧版索引失败: {index_file}, {e}")
+
+    logger.info(f"旧版索引迁移完成: {imported} 条记录 ({index_file})")
+    return imported
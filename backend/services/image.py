@@ -5,28 +5,72 @@ import re
 import uuid
 import time
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 from pathlib import Path
 from typing import Dict, Any, Generator, List, Optional, Tuple
 from backend.config import Config
 from backend.generators.factory import ImageGeneratorFactory
+from backend.generators.reference import ReferencePayload
+from backend.services.dir_size_cache import get_dir_size_cache
+from backend.services.generation_scheduler import get_generation_scheduler
+from backend.services.job_runner import get_generation_job_runner
+from backend.services.job_store import (
+    JOB_CANCELLED,
+    JOB_FINISHED,
+    JOB_RUNNING,
+    PAGE_DONE,
+    PAGE_FAILED,
+    PAGE_GENERATING,
+    get_generation_job_store,
+)
+from backend.services.rate_limiter import get_provider_rate_limiter
+from backend.services.reference_store import get_reference_store
+from backend.services.thumbnail_pool import get_thumbnail_pool
+from backend.services.zip_cache import get_zip_bundle_cache
+from backend.utils.atomic_file import atomic_write_bytes
 from backend.utils.image_compressor import compress_image
+from backend.utils.image_variants import generate_variants, remove_variants
 
 logger = logging.getLogger(__name__)
 
 
+def image_version(filepath: str) -> str:
+    """
+    图片版本号（由文件 mtime 和大小计算）
+
+    图片重新生成后版本号随之变化，用作 image_url 中的缓存破坏参数 v。
+
+    Returns:
+        str: 版本号，文件不存在时返回空字符串
+    """
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return ""
+    return f"{st.st_mtime_ns:x}{st.st_size:x}"
+
+
 class ImageService:
     """图片生成服务类"""
 
     _TASK_ID_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]{0,127}")
 
     # 并发配置
-    MAX_CONCURRENT = 15  # 最大并发数
+    MAX_CONCURRENT = 15  # 单个任务最多同时占用的生成槽位（全局上限由 GenerationScheduler 控制）
     AUTO_RETRY_COUNT = 1  # 不自动重试，超时后让用户手动重试
 
+    # 排队中检查排队位置（推送 queue 事件）的间隔（秒）
+    QUEUE_EVENT_INTERVAL = 0.5
+
     # 任务状态保留时间（秒），防止 _task_states 无限增长
     TASK_STATE_TTL_SECONDS = int(os.environ.get("REDINK_TASK_STATE_TTL_SECONDS", str(6 * 60 * 60)))  # 6h
 
+    # 重新连接任务事件流时轮询任务进度的间隔（秒）
+    JOB_FOLLOW_INTERVAL = 1.0
+
+    # 持久化任务队列（None 时不持久化）
+    job_store = None
+
     def __init__(self, provider_name: str = None):
         """
         初始化图片生成服务
@@ -70,6 +114,17 @@ class ImageService:
         self._task_states: Dict[str, Dict] = {}
         self._task_states_lock = threading.Lock()
 
+        # 任务参数和页面状态写入 history/jobs.db，服务重启后继续未完成的任务
+        self.job_store = get_generation_job_store()
+
+        # 进程级共享的生成调度器（全局/服务商并发上限、速率配额、按任务公平排队）
+        self.scheduler = get_generation_scheduler()
+        self.scheduler.set_provider_limit(provider_name, provider_config.get('max_concurrent'))
+        self.scheduler.set_provider_rate_limiter(
+            provider_name,
+            get_provider_rate_limiter("image", provider_name, provider_config)
+        )
+
         logger.info(f"ImageService 初始化完成: provider={provider_name}, type={provider_type}")
 
     @classmethod
@@ -107,6 +162,12 @@ class ImageService:
 
         return str(resolved)
 
+    def _image_url(self, task_id: str, filename: str) -> str:
+        """生成图片访问 URL（附带版本号，浏览器可长期缓存）"""
+        url = f"/api/images/{task_id}/{filename}"
+        version = image_version(os.path.join(self.history_root_dir, task_id, filename))
+        return f"{url}?v={version}" if version else url
+
     def _touch_task_state(self, task_id: str):
         """更新任务状态最后访问时间"""
         with self._task_states_lock:
@@ -143,11 +204,284 @@ class ImageService:
         self._cleanup_expired_task_states()
         with self._task_states_lock:
             state = self._task_states.get(task_id)
-            if state is None:
-                return False
-            state["cancelled"] = True
-            state["updated_at"] = time.time()
+            if state is not None:
+                state["cancelled"] = True
+                state["updated_at"] = time.time()
+        # 持久化的任务同时标记为已取消，避免客户端断开后被重新连接或重启时接管继续
+        # （内存中没有状态时，如服务重启后，以持久化的任务为准）
+        job = self._persist("get_job", task_id)
+        if job and job["status"] == JOB_RUNNING:
+            self._persist("finish_job", task_id, JOB_CANCELLED)
+        elif state is None:
+            return False
+        # 还在排队的页面直接撤出调度器
+        self.scheduler.cancel_task(task_id)
+        return True
+
+    # ==================== 任务持久化 ====================
+
+    def _persist(self, method: str, *args, **kwargs):
+        """调用持久化任务队列（写入失败只记录日志，不影响生成本身）"""
+        if self.job_store is None:
+            return None
+        try:
+            return getattr(self.job_store, method)(*args, **kwargs)
+        except Exception as e:
+            logger.warning(f"任务持久化失败: {method}, args={args[:1]}, err={e}")
+            return None
+
+    def _start_job(
+        self,
+        task_id: str,
+        pages: list,
+        page_indices,
+        full_outline: str,
+        user_images: Optional[List[bytes]],
+        user_topic: str,
+        style_hint: str,
+    ) -> None:
+        """记录任务参数（参考图片存入参考图片库，只记录 ID）"""
+        if self.job_store is None:
+            return
+        user_image_ids = []
+        try:
+            store = get_reference_store()
+            user_image_ids = [store.put(data)["id"] for data in user_images or ()]
+        except Exception as e:
+            logger.warning(f"保存任务参考图片失败: task_id={task_id}, err={e}")
+        self._persist("start_job", task_id, {
+            "pages": pages,
+            "full_outline": full_outline,
+            "user_topic": user_topic,
+            "style_hint": style_hint,
+            "user_image_ids": user_image_ids,
+            "provider": self.provider_name,
+        }, page_indices)
+
+    @staticmethod
+    def _load_reference_images(image_ids) -> Optional[List[bytes]]:
+        """按 ID 从参考图片库取回任务的参考图片（已过期的跳过）"""
+        if not image_ids:
+            return None
+        store = get_reference_store()
+        images = [data for data in (store.get(image_id) for image_id in image_ids) if data]
+        if len(images) < len(image_ids):
+            logger.warning(f"部分参考图片已过期: {len(image_ids) - len(images)} 张")
+        return images or None
+
+    def _restore_task_state(self, task_id: str) -> Optional[Dict]:
+        """内存中没有任务状态时（如服务重启后）从持久化队列恢复"""
+        job = self._persist("get_job", task_id)
+        if not job:
+            return None
+        params = job.get("params") or {}
+        pages = params.get("pages") or []
+        generated = {
+            index: page["filename"]
+            for index, page in job["pages"].items()
+            if page["status"] == PAGE_DONE and page["filename"]
+        }
+        failed = {
+            index: page["error"] or "生成失败"
+            for index, page in job["pages"].items()
+            if page["status"] == PAGE_FAILED
+        }
+
+        # 封面（第一页）作为其余页面重试时的参考图
+        cover_image = None
+        cover_index = next((p.get("index") for p in pages if isinstance(p, dict) and p.get("type") == "cover"), None)
+        if cover_index is None and pages and isinstance(pages[0], dict):
+            cover_index = pages[0].get("index")
+        if cover_index in generated:
+            try:
+                with open(os.path.join(self._get_task_dir(task_id), generated[cover_index]), "rb") as f:
+                    cover_image = compress_image(f.read(), max_size_kb=200)
+            except Exception as e:
+                logger.warning(f"读取已有封面失败: task_id={task_id}, err={e}")
+
+        now = time.time()
+        state = {
+            "created_at": job.get("created_at") or now,
+            "updated_at": now,
+            "pages": pages,
+            "generated": generated,
+            "failed": failed,
+            "cover_image": cover_image,
+            "full_outline": params.get("full_outline", ""),
+            "user_images": self._load_reference_images(params.get("user_image_ids")),
+            "user_topic": params.get("user_topic", ""),
+            "style_hint": params.get("style_hint", ""),
+            "cancelled": job["status"] == JOB_CANCELLED,
+        }
+        with self._task_states_lock:
+            return self._task_states.setdefault(task_id, state)
+
+    def _lookup_task_state(self, task_id: str) -> Optional[Dict]:
+        """取任务状态：先查内存，没有时从持久化队列恢复"""
+        with self._task_states_lock:
+            state = self._task_states.get(task_id)
+        if state is None:
+            state = self._restore_task_state(task_id)
+        return state
+
+    def resume_jobs(self, jobs: List[Dict[str, Any]]) -> List[str]:
+        """
+        由后台执行器继续接管到的任务（已生成的页面会跳过）
+
+        Args:
+            jobs: GenerationJobStore.claim_unfinished() / claim_job() 返回的任务
+
+        Returns:
+            List[str]: 已开始继续生成的任务 ID
+        """
+        runner = get_generation_job_runner()
+        resumed = []
+        for job in jobs:
+            task_id = job["task_id"]
+            if not (job.get("params") or {}).get("pages"):
+                self._persist("finish_job", task_id, JOB_FINISHED)
+                continue
+            runner.start(task_id, lambda job=job: self._resumed_events(job))
+            resumed.append(task_id)
+        if resumed:
+            logger.info(f"继续未完成的生成任务: {resumed}")
+        return resumed
+
+    def _resumed_events(self, job: Dict[str, Any]) -> Generator[Dict[str, Any], None, None]:
+        params = job["params"]
+        yield from self.generate_images(
+            params["pages"],
+            job["task_id"],
+            params.get("full_outline", ""),
+            user_images=self._load_reference_images(params.get("user_image_ids")),
+            user_topic=params.get("user_topic", ""),
+            style_hint=params.get("style_hint", ""),
+        )
+
+    def resume_task(self, task_id: str) -> bool:
+        """
+        确保任务在本进程的后台执行器中运行（用于客户端重新连接）
+
+        Returns:
+            bool: 任务正在本进程中执行（或已接管并开始继续生成）
+        """
+        if get_generation_job_runner().is_running(task_id):
             return True
+        # 本进程中断的任务要等仍在执行的页面结束（结果会写入队列）再接管，避免重复生成
+        if self._inflight_pages(task_id):
+            return False
+        claimed = self._persist("claim_job", task_id)
+        return bool(claimed and self.resume_jobs([claimed]))
+
+    def _inflight_pages(self, task_id: str) -> int:
+        with self._task_states_lock:
+            return (self._task_states.get(task_id) or {}).get("inflight", 0)
+
+    def follow_job(self, task_id: str) -> Generator[Dict[str, Any], None, None]:
+        """
+        重新连接任务的事件流（生成器，事件格式同 generate_images）
+
+        先回放已完成/失败的页面，之后按页面状态变化推送事件，任务结束时推送 finish。
+        任务因客户端断开或进程退出而中断时，接管任务并在后台继续生成。
+
+        Raises:
+            ValueError: 任务不存在
+        """
+        job = self._persist("get_job", task_id)
+        if job is None:
+            raise ValueError(f"任务不存在：{task_id}")
+
+        sent: Dict[int, Tuple[str, Optional[str]]] = {}
+        while True:
+            # 所属进程已退出或已放弃的任务：接管后在后台继续生成
+            if job["status"] == JOB_RUNNING:
+                self.resume_task(task_id)
+
+            yield from self._job_page_events(task_id, job, sent)
+
+            if job["status"] != JOB_RUNNING:
+                yield {"event": "finish", "data": self._job_finish_data(job)}
+                return
+
+            time.sleep(self.JOB_FOLLOW_INTERVAL)
+            job = self._persist("get_job", task_id)
+            if job is None:
+                return
+
+    def _job_page_events(
+        self,
+        task_id: str,
+        job: Dict[str, Any],
+        sent: Dict[int, Tuple[str, Optional[str]]],
+    ) -> Generator[Dict[str, Any], None, None]:
+        """按持久化的页面状态产出事件（sent 记录已推送的状态，只推送变化）"""
+        total = len((job.get("params") or {}).get("pages") or [])
+        done_count = sum(1 for page in job["pages"].values() if page["status"] == PAGE_DONE)
+        for index, page in sorted(job["pages"].items()):
+            key = (page["status"], page["filename"])
+            if sent.get(index) == key:
+                continue
+            sent[index] = key
+            if page["status"] == PAGE_DONE and page["filename"]:
+                yield {
+                    "event": "complete",
+                    "data": {
+                        "index": index,
+                        "status": "done",
+                        "image_url": self._image_url(task_id, page["filename"]),
+                        "phase": "reattach"
+                    }
+                }
+            elif page["status"] == PAGE_FAILED:
+                yield {
+                    "event": "error",
+                    "data": {
+                        "index": index,
+                        "status": "error",
+                        "message": page["error"] or "生成失败",
+                        "retryable": True,
+                        "phase": "reattach"
+                    }
+                }
+            elif page["status"] == PAGE_GENERATING:
+                yield {
+                    "event": "progress",
+                    "data": {
+                        "index": index,
+                        "status": "generating",
+                        "current": done_count + 1,
+                        "total": total,
+                        "phase": "reattach"
+                    }
+                }
+
+    def task_snapshot_events(self, task_id: str) -> List[Dict[str, Any]]:
+        """任务当前各页面状态对应的事件（客户端错过的事件已被挤出事件日志时补发）"""
+        job = self._persist("get_job", task_id)
+        return list(self._job_page_events(task_id, job, {})) if job else []
+
+    def _job_finish_data(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """按持久化的任务状态构建 finish 事件（字段同 generate_images 的 finish 事件）"""
+        pages = (job.get("params") or {}).get("pages") or []
+        indices = sorted(job["pages"]) or list(range(len(pages)))
+        expected_len = max([len(pages)] + [i + 1 for i in indices])
+        images: List[Optional[str]] = [None] * expected_len
+        for index, page in job["pages"].items():
+            if page["status"] == PAGE_DONE and 0 <= index < expected_len:
+                images[index] = page["filename"]
+        remaining_indices = [i for i in indices if i >= 0 and images[i] is None]
+        cancelled = job["status"] == JOB_CANCELLED
+        return {
+            "success": (not cancelled) and not remaining_indices,
+            "task_id": job["task_id"],
+            "images": images,
+            "total": len(pages),
+            "completed": sum(1 for x in images if x),
+            "failed": len(remaining_indices),
+            "failed_indices": [i for i, page in sorted(job["pages"].items()) if page["status"] == PAGE_FAILED],
+            "cancelled": cancelled,
+            "remaining_indices": remaining_indices,
+        }
 
     def _load_prompt_template(self, short: bool = False) -> str:
         """加载 Prompt 模板"""
@@ -178,19 +512,49 @@ class ImageService:
         if not task_dir:
             raise ValueError("任务目录未设置")
 
+        # 先删除旧图的缩略图和变体：新的编码失败（只记录日志）时不能继续提供旧图的派生文件，
+        # 版本号与新原图一致的请求还会把它们当作不可变内容长期缓存
+        try:
+            os.remove(os.path.join(task_dir, f"thumb_{filename}"))
+        except OSError:
+            pass
+        remove_variants(task_dir, filename)
+
         # 保存原图
         filepath = os.path.join(task_dir, filename)
-        with open(filepath, "wb") as f:
-            f.write(image_data)
+        atomic_write_bytes(filepath, image_data)
 
+        # 缩略图和尺寸变体交给后台编码池，不阻塞生成线程
+        get_thumbnail_pool().submit(
+            filepath,
+            lambda: self._write_thumbnails(image_data, filename, task_dir)
+        )
+
+        # 覆盖已有图片不会改变目录 mtime，主动使目录大小缓存失效
+        get_dir_size_cache().invalidate(os.path.basename(task_dir))
+        # 图片重新生成后旧的 ZIP 打包缓存不再有效
+        get_zip_bundle_cache().invalidate(os.path.basename(task_dir))
+
+        return filepath
+
+    def _write_thumbnails(self, image_data: bytes, filename: str, task_dir: str) -> None:
+        """
+        编码并写入缩略图和多尺寸变体（在缩略图编码池中执行）
+
+        Args:
+            image_data: 原图二进制数据
+            filename: 原图文件名
+            task_dir: 任务目录
+        """
         # 生成缩略图（50KB左右）
         thumbnail_data = compress_image(image_data, max_size_kb=50)
-        thumbnail_filename = f"thumb_{filename}"
-        thumbnail_path = os.path.join(task_dir, thumbnail_filename)
-        with open(thumbnail_path, "wb") as f:
-            f.write(thumbnail_data)
+        atomic_write_bytes(os.path.join(task_dir, f"thumb_{filename}"), thumbnail_data)
 
-        return filepath
+        # 生成多尺寸 WebP/AVIF 变体（失败不影响主流程，仍可回退到缩略图）
+        try:
+            generate_variants(image_data, task_dir, filename)
+        except Exception as e:
+            logger.warning(f"生成图片变体失败: {filename}, {e}")
 
     def _generate_single_image(
         self,
@@ -203,6 +567,7 @@ class ImageService:
         user_images: Optional[List[bytes]] = None,
         user_topic: str = "",
         style_hint: str = "",
+        reference_payload: Optional[ReferencePayload] = None,
     ) -> Tuple[int, bool, Optional[str], Optional[str]]:
         """
         生成单张图片（带自动重试）
@@ -216,6 +581,8 @@ class ImageService:
             full_outline: 完整的大纲文本
             user_images: 用户上传的参考图片列表
             user_topic: 用户原始输入
+            reference_payload: 预处理好的参考图（批量生成时整个任务共享一份；
+                未提供时由 reference_image / user_images 现场构造）
 
         Returns:
             (index, success, filename, error_message)
@@ -247,41 +614,17 @@ class ImageService:
             if style_hint:
                 prompt = f"{prompt}\n\n风格偏好：\n{style_hint}\n"
 
-            # 调用生成器生成图片
-            if self.provider_config.get('type') == 'google_genai':
-                logger.debug(f"  使用 Google GenAI 生成器")
-                image_data = self.generator.generate_image(
-                    prompt=prompt,
-                    aspect_ratio=self.provider_config.get('default_aspect_ratio', '3:4'),
-                    temperature=self.provider_config.get('temperature', 1.0),
-                    model=self.provider_config.get('model', 'gemini-3-pro-image-preview'),
-                    reference_image=reference_image,
-                )
-            elif self.provider_config.get('type') == 'image_api':
-                logger.debug(f"  使用 Image API 生成器")
-                # Image API 支持多张参考图片
-                # 组合参考图片：用户上传的图片 + 封面图
-                reference_images = []
-                if user_images:
-                    reference_images.extend(user_images)
-                if reference_image:
-                    reference_images.append(reference_image)
-
-                image_data = self.generator.generate_image(
-                    prompt=prompt,
-                    aspect_ratio=self.provider_config.get('default_aspect_ratio', '3:4'),
-                    temperature=self.provider_config.get('temperature', 1.0),
-                    model=self.provider_config.get('model', 'nano-banana-2'),
-                    reference_images=reference_images if reference_images else None,
-                )
-            else:
-                logger.debug(f"  使用 OpenAI 兼容生成器")
-                image_data = self.generator.generate_image(
-                    prompt=prompt,
-                    size=self.provider_config.get('default_size', '1024x1024'),
-                    model=self.provider_config.get('model'),
-                    quality=self.provider_config.get('quality', 'standard'),
-                )
+            if reference_payload is None:
+                reference_payload = ReferencePayload.prepare(reference_image, user_images)
+
+            # 调用生成器生成图片（耗时和 429/503 反馈给调度器，用于自适应调整并发）
+            started = time.monotonic()
+            try:
+                image_data = self._call_generator(prompt, reference_payload)
+            except Exception as e:
+                self.scheduler.record_result(self.provider_name, started, e)
+                raise
+            self.scheduler.record_result(self.provider_name, started)
 
             # 保存图片
             filename = f"{index}.png"
@@ -295,6 +638,111 @@ class ImageService:
             logger.error(f"❌ 图片 [{index}] 生成失败: {error_msg[:200]}")
             return (index, False, None, error_msg)
 
+    def _call_generator(self, prompt: str, reference_payload: ReferencePayload) -> bytes:
+        """按服务商类型调用生成器，返回图片数据"""
+        if self.provider_config.get('type') == 'google_genai':
+            logger.debug(f"  使用 Google GenAI 生成器")
+            return self.generator.generate_image(
+                prompt=prompt,
+                aspect_ratio=self.provider_config.get('default_aspect_ratio', '3:4'),
+                temperature=self.provider_config.get('temperature', 1.0),
+                model=self.provider_config.get('model', 'gemini-3-pro-image-preview'),
+                reference_payload=reference_payload,
+            )
+        elif self.provider_config.get('type') == 'image_api':
+            logger.debug(f"  使用 Image API 生成器")
+            # Image API 支持多张参考图片：用户上传的图片 + 封面图
+            return self.generator.generate_image(
+                prompt=prompt,
+                aspect_ratio=self.provider_config.get('default_aspect_ratio', '3:4'),
+                temperature=self.provider_config.get('temperature', 1.0),
+                model=self.provider_config.get('model', 'nano-banana-2'),
+                reference_payload=reference_payload,
+            )
+        else:
+            logger.debug(f"  使用 OpenAI 兼容生成器")
+            return self.generator.generate_image(
+                prompt=prompt,
+                size=self.provider_config.get('default_size', '1024x1024'),
+                model=self.provider_config.get('model'),
+                quality=self.provider_config.get('quality', 'standard'),
+            )
+
+    def _submit_page(
+        self,
+        task_id: str,
+        page: Dict,
+        task_dir: str,
+        *args,
+        task_limit: Optional[int] = None,
+    ) -> Future:
+        """
+        把单页生成提交给调度器（task_dir 之后的参数原样传给 _generate_single_image）
+
+        页面开始生成和生成结果在执行线程中写入持久化队列，客户端中途断开也不会丢失。
+        """
+        def run():
+            self._count_inflight(task_id, 1)
+            try:
+                self._persist("set_page", task_id, page["index"], PAGE_GENERATING)
+                result = self._generate_single_image(page, task_id, task_dir, *args)
+                index, success, filename, error = result
+                if success:
+                    self._persist("set_page", task_id, index, PAGE_DONE, filename=filename)
+                else:
+                    self._persist("set_page", task_id, index, PAGE_FAILED, error=error)
+                return result
+            finally:
+                self._count_inflight(task_id, -1)
+
+        return self.scheduler.submit(task_id, self.provider_name, run, task_limit=task_limit)
+
+    def _count_inflight(self, task_id: str, delta: int) -> None:
+        with self._task_states_lock:
+            state = self._task_states.get(task_id)
+            if state is not None:
+                state["inflight"] = state.get("inflight", 0) + delta
+
+    def _wait_scheduled(
+        self,
+        task_id: str,
+        futures,
+    ) -> Generator[Tuple[Optional[Dict[str, Any]], Optional[Future]], None, None]:
+        """
+        等待调度中的调用，按完成顺序产出 (None, future)；
+        任务仍在排队且排队位置变化时产出 (queue 事件, None)
+        """
+        pending = set(futures)
+        last_position = None
+        while pending:
+            done, pending = wait(pending, timeout=self.QUEUE_EVENT_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield None, future
+
+            position = self.scheduler.queue_position(task_id) if pending else None
+            if position is None:
+                continue
+            key = (position["ahead"], position["waiting"])
+            if key == last_position:
+                continue
+            last_position = key
+            if position["ahead"]:
+                message = f"排队中：前面还有 {position['ahead']} 个任务"
+            else:
+                message = "排队中：等待空闲的生成槽位"
+            yield {
+                "event": "queue",
+                "data": {**position, "status": "queued", "message": message},
+            }, None
+
+    @staticmethod
+    def _page_result(future: Future, page: Dict) -> Tuple[int, bool, Optional[str], Optional[str]]:
+        """取调度结果（调用被取消或意外抛错时转换为失败结果）"""
+        try:
+            return future.result()
+        except Exception as e:
+            return (page["index"], False, None, str(e) or "已取消")
+
     def generate_images(
         self,
         pages: list,
@@ -307,6 +755,7 @@ class ImageService:
         """
         生成图片（生成器，支持 SSE 流式返回）
         优化版本：先生成封面，然后并发生成其他页面
+        任务参数和页面状态写入持久化队列；中途断开时任务保留为未完成，可通过 follow_job 重新连接并继续
 
         Args:
             pages: 页面列表
@@ -318,8 +767,6 @@ class ImageService:
         Yields:
             进度事件字典
         """
-        self._cleanup_expired_task_states()
-
         if not task_id:
             task_id = f"task_{uuid.uuid4().hex[:8]}"
         else:
@@ -327,6 +774,31 @@ class ImageService:
             if not self._is_safe_task_id(task_id):
                 raise ValueError("参数错误：task_id 不安全")
 
+        try:
+            yield from self._generate_images(
+                pages, task_id, full_outline, user_images, user_topic, style_hint
+            )
+        except GeneratorExit:
+            # 客户端断开：排队中的页面撤出调度器，任务交还给持久化队列，重新连接或重启后继续
+            self.scheduler.cancel_task(task_id)
+            self._persist("release_job", task_id)
+            raise
+        except Exception:
+            self._persist("finish_job", task_id, JOB_FINISHED)
+            raise
+
+    def _generate_images(
+        self,
+        pages: list,
+        task_id: str,
+        full_outline: str,
+        user_images: Optional[List[bytes]],
+        user_topic: str,
+        style_hint: str,
+    ) -> Generator[Dict[str, Any], None, None]:
+        """generate_images 的实现（task_id 已校验）"""
+        self._cleanup_expired_task_states()
+
         logger.info(f"开始图片生成任务: task_id={task_id}, pages={len(pages)}")
 
         # 创建任务专属目录
@@ -403,6 +875,14 @@ class ImageService:
         except Exception:
             existing_generated = {}
 
+        # 记录任务参数和页面列表；磁盘上已有的页面直接记为完成
+        self._start_job(
+            task_id, pages, expected_indices, full_outline,
+            compressed_user_images, user_topic, style_hint
+        )
+        for idx, fname in existing_generated.items():
+            self._persist("set_page", task_id, idx, PAGE_DONE, filename=fname)
+
         if existing_generated:
             with self._task_states_lock:
                 state = self._task_states.get(task_id) or {}
@@ -427,7 +907,7 @@ class ImageService:
                     "data": {
                         "index": idx,
                         "status": "done",
-                        "image_url": f"/api/images/{task_id}/{fname}",
+                        "image_url": self._image_url(task_id, fname),
                         "phase": "resume"
                     }
                 }
@@ -502,10 +982,14 @@ class ImageService:
                 }
 
                 # 生成封面（使用用户上传的图片作为参考）
-                index, success, filename, error = self._generate_single_image(
-                    cover_page, task_id, task_dir, reference_image=None, full_outline=full_outline,
-                    user_images=compressed_user_images, user_topic=user_topic, style_hint=style_hint
+                future = self._submit_page(
+                    task_id, cover_page, task_dir, None, 0, full_outline,
+                    compressed_user_images, user_topic, style_hint
                 )
+                for queue_event, _ in self._wait_scheduled(task_id, [future]):
+                    if queue_event:
+                        yield queue_event
+                index, success, filename, error = self._page_result(future, cover_page)
 
                 if success:
                     generated_images.append(filename)
@@ -529,7 +1013,7 @@ class ImageService:
                         "data": {
                             "index": index,
                             "status": "done",
-                            "image_url": f"/api/images/{task_id}/{filename}",
+                            "image_url": self._image_url(task_id, filename),
                             "phase": "cover"
                         }
                     }
@@ -552,6 +1036,9 @@ class ImageService:
 
         # ==================== 第二阶段：生成其他页面 ====================
         if other_pages and not cancelled:
+            # 参考图（封面 + 用户图片）只压缩/编码一次，各页面线程只读共享
+            reference_payload = ReferencePayload.prepare(cover_image_data, compressed_user_images)
+
             # 检查是否启用高并发模式
             high_concurrency = self.provider_config.get('high_concurrency', False)
 
@@ -568,107 +1055,89 @@ class ImageService:
                     }
                 }
 
-                # 使用线程池并发生成
-                with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT) as executor:
-                    # 提交任务（支持取消：尽量不提交剩余页面）
-                    future_to_page = {}
-                    for page in other_pages:
-                        if self._is_task_cancelled(task_id):
-                            cancelled = True
-                            break
-
-                        future = executor.submit(
-                            self._generate_single_image,
-                            page,
-                            task_id,
-                            task_dir,
-                            cover_image_data,  # 使用封面作为参考
-                            0,  # retry_count
-                            full_outline,  # 传入完整大纲
-                            compressed_user_images,  # 用户上传的参考图片（已压缩）
-                            user_topic,  # 用户原始输入
-                            style_hint,  # 风格偏好
-                        )
-                        future_to_page[future] = page
-
-                    # 发送每个页面的进度（仅对已提交的页面）
-                    for page in future_to_page.values():
+                # 提交给共享调度器（支持取消：尽量不提交剩余页面）
+                future_to_page = {}
+                for page in other_pages:
+                    if self._is_task_cancelled(task_id):
+                        cancelled = True
+                        break
+
+                    future = self._submit_page(
+                        task_id,
+                        page,
+                        task_dir,
+                        cover_image_data,  # 使用封面作为参考
+                        0,  # retry_count
+                        full_outline,  # 传入完整大纲
+                        compressed_user_images,  # 用户上传的参考图片（已压缩）
+                        user_topic,  # 用户原始输入
+                        style_hint,  # 风格偏好
+                        reference_payload,  # 预处理好的参考图
+                        task_limit=self.MAX_CONCURRENT,
+                    )
+                    future_to_page[future] = page
+
+                # 发送每个页面的进度（仅对已提交的页面）
+                for page in future_to_page.values():
+                    yield {
+                        "event": "progress",
+                        "data": {
+                            "index": page["index"],
+                            "status": "generating",
+                            "current": len(generated_images) + 1,
+                            "total": total,
+                            "phase": "content"
+                        }
+                    }
+
+                # 收集结果（排队期间推送排队位置）
+                for queue_event, future in self._wait_scheduled(task_id, future_to_page):
+                    if queue_event:
+                        yield queue_event
+                        continue
+
+                    if self._is_task_cancelled(task_id):
+                        cancelled = True
+                        # 尽量取消还未开始的调用
+                        self.scheduler.cancel_task(task_id)
+                        for f in future_to_page.keys():
+                            f.cancel()
+                        break
+
+                    page = future_to_page[future]
+                    index, success, filename, error = self._page_result(future, page)
+
+                    if success:
+                        generated_images.append(filename)
+                        with self._task_states_lock:
+                            self._task_states[task_id]["generated"][index] = filename
+                            self._task_states[task_id]["updated_at"] = time.time()
+
                         yield {
-                            "event": "progress",
+                            "event": "complete",
                             "data": {
-                                "index": page["index"],
-                                "status": "generating",
-                                "current": len(generated_images) + 1,
-                                "total": total,
+                                "index": index,
+                                "status": "done",
+                                "image_url": self._image_url(task_id, filename),
                                 "phase": "content"
                             }
                         }
+                    else:
+                        failed_pages.append(page)
+                        with self._task_states_lock:
+                            self._task_states[task_id]["failed"][index] = error
+                            self._task_states[task_id]["updated_at"] = time.time()
 
-                    # 收集结果
-                    for future in as_completed(future_to_page):
-                        if self._is_task_cancelled(task_id):
-                            cancelled = True
-                            # 尽量取消还未开始的任务
-                            for f in future_to_page.keys():
-                                try:
-                                    f.cancel()
-                                except Exception:
-                                    pass
-                            break
-
-                        page = future_to_page[future]
-                        try:
-                            index, success, filename, error = future.result()
-
-                            if success:
-                                generated_images.append(filename)
-                                with self._task_states_lock:
-                                    self._task_states[task_id]["generated"][index] = filename
-                                    self._task_states[task_id]["updated_at"] = time.time()
-
-                                yield {
-                                    "event": "complete",
-                                    "data": {
-                                        "index": index,
-                                        "status": "done",
-                                        "image_url": f"/api/images/{task_id}/{filename}",
-                                        "phase": "content"
-                                    }
-                                }
-                            else:
-                                failed_pages.append(page)
-                                with self._task_states_lock:
-                                    self._task_states[task_id]["failed"][index] = error
-                                    self._task_states[task_id]["updated_at"] = time.time()
-
-                                yield {
-                                    "event": "error",
-                                    "data": {
-                                        "index": index,
-                                        "status": "error",
-                                        "message": error,
-                                        "retryable": True,
-                                        "phase": "content"
-                                    }
-                                }
-
-                        except Exception as e:
-                            failed_pages.append(page)
-                            error_msg = str(e)
-                            with self._task_states_lock:
-                                self._task_states[task_id]["failed"][page["index"]] = error_msg
-                                self._task_states[task_id]["updated_at"] = time.time()
-
-                            yield {
-                                "event": "error",
-                                "data": {
-                                    "index": page["index"],
-                                    "status": "error",
-                                    "message": error_msg,
-                                    "retryable": True,
-                                    "phase": "content"
-                                }
+                        yield {
+                            "event": "error",
+                            "data": {
+                                "index": index,
+                                "status": "error",
+                                "message": error,
+                                "retryable": True,
+                                "phase": "content"
                             }
+                        }
             else:
                 # 顺序模式：逐个生成
                 yield {
@@ -699,10 +1168,10 @@ class ImageService:
                         }
                     }
 
-                    # 生成单张图片
-                    index, success, filename, error = self._generate_single_image(
-                        page,
+                    # 生成单张图片（同样经过调度器，计入全局并发）
+                    future = self._submit_page(
                         task_id,
+                        page,
                         task_dir,
                         cover_image_data,
                         0,
@@ -710,7 +1179,13 @@ class ImageService:
                         compressed_user_images,
                         user_topic,
                         style_hint,
+                        reference_payload,
+                        task_limit=1,
                     )
+                    for queue_event, _ in self._wait_scheduled(task_id, [future]):
+                        if queue_event:
+                            yield queue_event
+                    index, success, filename, error = self._page_result(future, page)
 
                     if success:
                         generated_images.append(filename)
@@ -723,7 +1198,7 @@ class ImageService:
                             "data": {
                                 "index": index,
                                 "status": "done",
-                                "image_url": f"/api/images/{task_id}/{filename}",
+                                "image_url": self._image_url(task_id, filename),
                                 "phase": "content"
                             }
                         }
@@ -782,6 +1257,8 @@ class ImageService:
             if isinstance(p, dict) and "index" in p:
                 failed_indices.append(p["index"])
 
+        self._persist("finish_job", task_id, JOB_CANCELLED if cancelled_final else JOB_FINISHED)
+
         yield {
             "event": "finish",
             "data": {
@@ -827,8 +1304,7 @@ class ImageService:
         user_images = None
 
         # 首先尝试从任务状态中获取上下文
-        with self._task_states_lock:
-            task_state = self._task_states.get(task_id)
+        task_state = self._lookup_task_state(task_id)
 
         if task_state:
             if use_reference:
@@ -852,9 +1328,9 @@ class ImageService:
                 # 压缩封面图到 200KB
                 reference_image = compress_image(cover_data, max_size_kb=200)
 
-        index, success, filename, error = self._generate_single_image(
-            page,
+        future = self._submit_page(
             task_id,
+            page,
             task_dir,
             reference_image,
             0,
@@ -863,6 +1339,7 @@ class ImageService:
             user_topic,
             style_hint,
         )
+        index, success, filename, error = self._page_result(future, page)
 
         if success:
             with self._task_states_lock:
@@ -875,7 +1352,7 @@ class ImageService:
             return {
                 "success": True,
                 "index": index,
-                "image_url": f"/api/images/{task_id}/{filename}"
+                "image_url": self._image_url(task_id, filename)
             }
         else:
             return {
@@ -908,8 +1385,7 @@ class ImageService:
         cached_user_topic = ""
         full_outline = ""
         style_hint = ""
-        with self._task_states_lock:
-            task_state = self._task_states.get(task_id)
+        task_state = self._lookup_task_state(task_id)
         if task_state:
             reference_image = task_state.get("cover_image")
             user_images = task_state.get("user_images")
@@ -930,70 +1406,64 @@ class ImageService:
             }
         }
 
-        # 并发重试
-        with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT) as executor:
-            task_dir = self._get_task_dir(task_id, create=True)
-            future_to_page = {
-                executor.submit(
-                    self._generate_single_image,
-                    page,
-                    task_id,
-                    task_dir,
-                    reference_image,
-                    0,  # retry_count
-                    full_outline,  # 传入完整大纲
-                    user_images,
-                    cached_user_topic,
-                    style_hint,  # 风格偏好
-                ): page
-                for page in pages
-            }
+        # 参考图只预处理一次，所有重试页面共享
+        reference_payload = ReferencePayload.prepare(reference_image, user_images)
 
-            for future in as_completed(future_to_page):
-                page = future_to_page[future]
-                try:
-                    index, success, filename, error = future.result()
+        # 并发重试（经共享调度器，与其它任务公平排队）
+        task_dir = self._get_task_dir(task_id, create=True)
+        future_to_page = {
+            self._submit_page(
+                task_id,
+                page,
+                task_dir,
+                reference_image,
+                0,  # retry_count
+                full_outline,  # 传入完整大纲
+                user_images,
+                cached_user_topic,
+                style_hint,  # 风格偏好
+                reference_payload,
+                task_limit=self.MAX_CONCURRENT,
+            ): page
+            for page in pages
+        }
 
-                    if success:
-                        success_count += 1
-                        with self._task_states_lock:
-                            if task_id in self._task_states:
-                                self._task_states[task_id]["generated"][index] = filename
-                                if index in self._task_states[task_id]["failed"]:
-                                    del self._task_states[task_id]["failed"][index]
-                                self._task_states[task_id]["updated_at"] = time.time()
+        for queue_event, future in self._wait_scheduled(task_id, future_to_page):
+            if queue_event:
+                yield queue_event
+                continue
 
-                        yield {
-                            "event": "complete",
-                            "data": {
-                                "index": index,
-                                "status": "done",
-                                "image_url": f"/api/images/{task_id}/{filename}"
-                            }
-                        }
-                    else:
-                        failed_count += 1
-                        yield {
-                            "event": "error",
-                            "data": {
-                                "index": index,
-                                "status": "error",
-                                "message": error,
-                                "retryable": True
-                            }
-                        }
+            page = future_to_page[future]
+            index, success, filename, error = self._page_result(future, page)
 
-                except Exception as e:
-                    failed_count += 1
-                    yield {
-                        "event": "error",
-                        "data": {
-                            "index": page["index"],
-                            "status": "error",
-                            "message": str(e),
-                            "retryable": True
-                        }
+            if success:
+                success_count += 1
+                with self._task_states_lock:
+                    if task_id in self._task_states:
+                        self._task_states[task_id]["generated"][index] = filename
+                        if index in self._task_states[task_id]["failed"]:
+                            del self._task_states[task_id]["failed"][index]
+                        self._task_states[task_id]["updated_at"] = time.time()
+
+                yield {
+                    "event": "complete",
+                    "data": {
+                        "index": index,
+                        "status": "done",
+                        "image_url": self._image_url(task_id, filename)
                     }
+                }
+            else:
+                failed_count += 1
+                yield {
+                    "event": "error",
+                    "data": {
+                        "index": index,
+                        "status": "error",
+                        "message": error,
+                        "retryable": True
+                    }
+                }
 
         yield {
             "event": "retry_finish",
@@ -1051,8 +1521,7 @@ class ImageService:
     def get_task_state(self, task_id: str) -> Optional[Dict]:
         """获取任务状态"""
         self._cleanup_expired_task_states()
-        with self._task_states_lock:
-            state = self._task_states.get(task_id)
+        state = self._lookup_task_state(task_id)
         if state:
             self._touch_task_state(task_id)
         return state
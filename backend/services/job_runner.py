@@ -0,0 +1,236 @@
+"""
+后台生成任务执行器与可续传的事件日志
+
+以前 /api/generate 的 SSE 响应直接驱动 generate_images()，生成跑在 HTTP 工作线程里：
+客户端断开时生成随之中断，重新连接只能重新提交、靠扫描任务目录回放已生成的页面。
+现在生成由 GenerationJobRunner 在后台线程中执行，事件写入每个任务的环形缓冲（TaskEventLog）：
+
+- 每个事件带递增序号，SSE 以 `id: <run>:<seq>` 下发；run 区分同一任务的不同次执行
+- SSE 接口只读取缓冲（从 Last-Event-ID 之后开始），断开、重连都不影响生成，也不会触发重复生成
+- 同一任务正在执行时再次提交只会连接到已有的事件流
+- 缓冲最多保留 REDINK_EVENT_LOG_SIZE 个事件；客户端落后太多时由调用方补发任务快照
+- 任务结束后事件日志保留 REDINK_EVENT_LOG_TTL_SECONDS 秒，供稍后重连的客户端读取
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (序号, 事件类型, 事件数据)
+LoggedEvent = Tuple[int, str, Dict[str, Any]]
+
+
+class TaskEventLog:
+    """单个任务一次执行的事件环形缓冲"""
+
+    # 每个任务最多缓存的事件数
+    SIZE = int(os.environ.get("REDINK_EVENT_LOG_SIZE", "512"))
+
+    def __init__(self, task_id: str, size: Optional[int] = None):
+        self.task_id = task_id
+        self.run_id = uuid.uuid4().hex[:8]
+        self._events = deque(maxlen=max(1, self.SIZE if size is None else size))
+        self._cond = threading.Condition()
+        self._last_seq = 0
+        self.closed = False
+        self.closed_at: Optional[float] = None
+
+    @property
+    def last_seq(self) -> int:
+        with self._cond:
+            return self._last_seq
+
+    def event_id(self, seq: int) -> str:
+        """SSE 的事件 ID"""
+        return f"{self.run_id}:{seq}"
+
+    def parse_event_id(self, event_id: Optional[str]) -> int:
+        """
+        解析客户端的 Last-Event-ID
+
+        Returns:
+            int: 已收到的最后一个序号；ID 属于其它执行（或无法解析）时返回 0，从头读取
+        """
+        run_id, _, seq = str(event_id or "").partition(":")
+        if run_id != self.run_id:
+            return 0
+        try:
+            return max(0, int(seq))
+        except ValueError:
+            return 0
+
+    def append(self, event: str, data: Dict[str, Any]) -> int:
+        """追加事件，返回序号"""
+        with self._cond:
+            self._last_seq += 1
+            self._events.append((self._last_seq, event, data))
+            self._cond.notify_all()
+            return self._last_seq
+
+    def close(self) -> None:
+        """执行结束（之后不会再有新事件）"""
+        with self._cond:
+            self.closed = True
+            self.closed_at = time.time()
+            self._cond.notify_all()
+
+    def read(self, after: int, timeout: Optional[float] = None) -> Tuple[List[LoggedEvent], bool, bool]:
+        """
+        读取序号大于 after 的事件，没有新事件时最多等待 timeout 秒
+
+        Returns:
+            Tuple[List, bool, bool]: (事件列表, 是否有事件已被挤出缓冲而缺失, 是否已读到结尾)
+        """
+        with self._cond:
+            if self._last_seq <= after and not self.closed:
+                self._cond.wait(timeout)
+            events = [item for item in self._events if item[0] > after]
+            gap = bool(self._events) and self._events[0][0] > after + 1
+            return events, gap, self.closed
+
+    def tail(
+        self,
+        after: int = 0,
+        heartbeat: float = 15.0,
+        snapshot: Optional[Callable[[], Iterable[Dict[str, Any]]]] = None,
+    ) -> Iterable[Optional[Tuple[Optional[str], str, Dict[str, Any]]]]:
+        """
+        持续读取事件直到执行结束（生成器）
+
+        Args:
+            after: 客户端已收到的最后一个序号
+            heartbeat: 没有新事件时每隔多少秒产出一次 None（调用方据此发送心跳、发现断开的连接）
+            snapshot: 事件缺失时调用，返回用于补齐客户端状态的事件（不带 ID）
+
+        Yields:
+            (事件 ID, 事件类型, 事件数据)，或心跳 None
+        """
+        while True:
+            events, gap, closed = self.read(after, heartbeat)
+            if gap and snapshot is not None:
+                for event in snapshot():
+                    yield None, event["event"], event["data"]
+            for seq, event, data in events:
+                after = seq
+                yield self.event_id(seq), event, data
+            if closed and after >= self.last_seq:
+                return
+            if not events:
+                yield None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "events": len(self._events),
+                "last_seq": self._last_seq,
+                "closed": self.closed,
+            }
+
+
+class GenerationJobRunner:
+    """在后台线程中执行生成任务，并把事件写入任务的事件日志"""
+
+    # 任务结束后事件日志的保留时间（秒）
+    LOG_TTL_SECONDS = int(os.environ.get("REDINK_EVENT_LOG_TTL_SECONDS", "600"))
+
+    def __init__(self):
+        self._logs: Dict[str, TaskEventLog] = {}
+        self._lock = threading.Lock()
+
+    def _cleanup_locked(self) -> None:
+        cutoff = time.time() - self.LOG_TTL_SECONDS
+        for task_id, log in list(self._logs.items()):
+            if log.closed and (log.closed_at or 0) < cutoff:
+                del self._logs[task_id]
+
+    def start(
+        self,
+        task_id: str,
+        events_factory: Callable[[], Iterable[Dict[str, Any]]],
+    ) -> Tuple[TaskEventLog, bool]:
+        """
+        在后台执行任务（同一任务正在执行时不重复执行）
+
+        Args:
+            task_id: 任务 ID
+            events_factory: 返回事件迭代器（如 generate_images(...)），在后台线程中调用
+
+        Returns:
+            Tuple[TaskEventLog, bool]: (事件日志, 是否新开始执行)
+        """
+        with self._lock:
+            self._cleanup_locked()
+            log = self._logs.get(task_id)
+            if log is not None and not log.closed:
+                return log, False
+            log = self._logs[task_id] = TaskEventLog(task_id)
+
+        threading.Thread(
+            target=self._run,
+            args=(log, events_factory),
+            name=f"generate-{task_id}",
+            daemon=True,
+        ).start()
+        return log, True
+
+    def _run(self, log: TaskEventLog, events_factory: Callable[[], Iterable[Dict[str, Any]]]) -> None:
+        try:
+            for event in events_factory():
+                log.append(event["event"], event["data"])
+        except Exception as e:
+            logger.error(f"后台生成任务失败: task_id={log.task_id}, err={e}", exc_info=True)
+            log.append("error", {
+                "status": "error",
+                "message": f"图片生成异常。\n错误详情: {e}",
+                "retryable": True,
+            })
+        finally:
+            log.close()
+
+    def get(self, task_id: str) -> Optional[TaskEventLog]:
+        """取任务最近一次执行的事件日志（已过保留期时返回 None）"""
+        with self._lock:
+            self._cleanup_locked()
+            return self._logs.get(task_id)
+
+    def is_running(self, task_id: str) -> bool:
+        log = self.get(task_id)
+        return log is not None and not log.closed
+
+    def stats(self) -> Dict[str, int]:
+        """执行中的任务数与缓存的事件数（管理面板健康检查）"""
+        with self._lock:
+            self._cleanup_locked()
+            logs = list(self._logs.values())
+        snapshots = [log.stats() for log in logs]
+        return {
+            "running": sum(1 for s in snapshots if not s["closed"]),
+            "logs": len(snapshots),
+            "buffered_events": sum(s["events"] for s in snapshots),
+        }
+
+
+# 全局实例
+_runner_instance: Optional[GenerationJobRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_generation_job_runner() -> GenerationJobRunner:
+    """
+    获取生成任务执行器（单例模式）
+
+    Returns:
+        GenerationJobRunner: 执行器实例
+    """
+    global _runner_instance
+    if _runner_instance is None:
+        with _runner_lock:
+            if _runner_instance is None:
+                _runner_instance = GenerationJobRunner()
+    return _runner_instance
@@ -0,0 +1,389 @@
+"""
+生成任务持久化队列
+
+以前任务进度只保存在 ImageService._task_states（内存）中，服务重启后查询任务状态返回 404，
+进行到一半的任务只能靠扫描任务目录恢复。这里把任务参数和每一页的状态变化写入
+history/jobs.db（SQLite，WAL 模式）：
+
+- jobs：任务参数（页面、大纲、用户主题、风格、参考图片 ID）和任务状态
+  running → finished / cancelled
+- job_pages：每一页的状态 pending → generating → done / failed
+
+进程启动时 claim_unfinished() 接管仍处于 running、但所属进程已经退出的任务，由 ImageService 继续生成。
+客户端断开导致生成中途停止时 release_job() 放弃所有权，客户端重新连接（GET /api/task/<id>/events）时
+由 claim_job() 接管继续。
+每个进程持有一把以自身 owner 命名的文件锁（history/.jobs-<owner>.lock），进程退出后锁由内核释放，
+其它进程据此判断任务的所属进程是否还活着（不依赖 pid，容器重启后 pid 复用也不会误判）。
+"""
+
+import os
+import json
+import atexit
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from backend.utils.file_lock import ProcessFileLock
+
+logger = logging.getLogger(__name__)
+
+JOB_RUNNING = "running"
+JOB_FINISHED = "finished"
+JOB_CANCELLED = "cancelled"
+
+PAGE_PENDING = "pending"
+PAGE_GENERATING = "generating"
+PAGE_DONE = "done"
+PAGE_FAILED = "failed"
+
+# 本进程创建的 owner（本进程持有的锁文件再次加锁也会失败，不能用 try_acquire 判断）
+_local_owners = set()
+
+
+class GenerationJobStore:
+    """生成任务与页面状态的持久化存储"""
+
+    # 已结束任务的保留时间（秒）
+    RETENTION_SECONDS = int(os.environ.get("REDINK_JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        task_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        params TEXT NOT NULL DEFAULT '{}',
+        owner TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, updated_at);
+    CREATE TABLE IF NOT EXISTS job_pages (
+        task_id TEXT NOT NULL,
+        page_index INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        filename TEXT,
+        error TEXT,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (task_id, page_index)
+    );
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        with self._conn:
+            self._conn.executescript(self._SCHEMA)
+        self._owner: Optional[str] = None
+        self._owner_pid: Optional[int] = None
+        self._owner_lock: Optional[ProcessFileLock] = None
+
+    # ==================== 所属进程 ====================
+
+    def _owner_lock_path(self, owner: str) -> str:
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_path)), f".jobs-{owner}.lock")
+
+    @property
+    def owner(self) -> str:
+        """本进程的 owner 标识（fork 出的子进程会重新生成）"""
+        with self._lock:
+            if self._owner is None or self._owner_pid != os.getpid():
+                owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+                # 锁直接持有文件描述符，不绑定首次读取 owner 的线程，close() 可在任意线程释放
+                lock = ProcessFileLock(self._owner_lock_path(owner))
+                lock.acquire()
+                _local_owners.add(owner)
+                if self._owner_lock is None:
+                    # 正常退出时释放锁并删除锁文件（被 kill 时由其它进程的 prune 清理）
+                    atexit.register(self.close)
+                self._owner, self._owner_pid, self._owner_lock = owner, os.getpid(), lock
+            return self._owner
+
+    def _owner_alive(self, owner: Optional[str]) -> bool:
+        if not owner:
+            return False
+        if owner in _local_owners:
+            return True
+        path = self._owner_lock_path(owner)
+        if not os.path.exists(path):
+            return False
+        lock = ProcessFileLock(path)
+        if not lock.try_acquire():
+            return True
+        lock.release()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return False
+
+    # ==================== 写入 ====================
+
+    def start_job(self, task_id: str, params: Dict[str, Any], page_indices: Iterable[int]) -> None:
+        """
+        开始（或重新开始）一个任务：记录参数，未完成的页面重置为 pending
+
+        已完成（done）的页面保持不变，便于断点续生成。
+        """
+        now = time.time()
+        owner = self.owner
+        indices = sorted({int(index) for index in page_indices})
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (task_id, status, params, owner, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(task_id) DO UPDATE SET status = excluded.status, params = excluded.params, "
+                "owner = excluded.owner, updated_at = excluded.updated_at",
+                (task_id, JOB_RUNNING, json.dumps(params, ensure_ascii=False), owner, now, now),
+            )
+            self._conn.executemany(
+                "INSERT INTO job_pages (task_id, page_index, status, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(task_id, page_index) DO UPDATE SET status = excluded.status, "
+                "error = NULL, updated_at = excluded.updated_at WHERE job_pages.status != ?",
+                [(task_id, index, PAGE_PENDING, now, PAGE_DONE) for index in indices],
+            )
+            # 页面列表变化时去掉已不存在的页面
+            keep = set(indices)
+            stale = [
+                r[0] for r in self._conn.execute("SELECT page_index FROM job_pages WHERE task_id = ?", (task_id,))
+                if r[0] not in keep
+            ]
+            self._conn.executemany(
+                "DELETE FROM job_pages WHERE task_id = ? AND page_index = ?",
+                [(task_id, index) for index in stale],
+            )
+
+    def set_page(
+        self,
+        task_id: str,
+        index: int,
+        status: str,
+        filename: Optional[str] = None,
+        error: Optional[str] = None,
+    ) -> bool:
+        """记录页面状态变化（任务不存在时忽略，返回 False）"""
+        now = time.time()
+        with self._lock, self._conn:
+            if self._conn.execute("SELECT 1 FROM jobs WHERE task_id = ?", (task_id,)).fetchone() is None:
+                return False
+            self._conn.execute(
+                "INSERT INTO job_pages (task_id, page_index, status, filename, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(task_id, page_index) DO UPDATE SET status = excluded.status, "
+                "filename = COALESCE(excluded.filename, job_pages.filename), "
+                "error = excluded.error, updated_at = excluded.updated_at",
+                (task_id, int(index), status, filename, error, now),
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE task_id = ?", (now, task_id))
+        return True
+
+    def finish_job(self, task_id: str, status: str = JOB_FINISHED) -> bool:
+        """标记任务结束（finished / cancelled），之后不会再被自动恢复"""
+        now = time.time()
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE task_id = ?",
+                (status, now, task_id),
+            )
+            # 未执行完的页面不再处于 generating
+            self._conn.execute(
+                "UPDATE job_pages SET status = ?, updated_at = ? WHERE task_id = ? AND status IN (?, ?)",
+                (PAGE_FAILED if status == JOB_FINISHED else PAGE_PENDING, now, task_id, PAGE_PENDING, PAGE_GENERATING),
+            )
+        return cur.rowcount > 0
+
+    def release_job(self, task_id: str) -> bool:
+        """
+        放弃本进程对 running 任务的所有权（如客户端断开导致生成中途停止）
+
+        任务保持 running，重新连接的客户端或其它进程可以通过 claim_job / claim_unfinished 接管继续生成。
+        """
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET owner = NULL, updated_at = ? WHERE task_id = ? AND status = ? AND owner = ?",
+                (time.time(), task_id, JOB_RUNNING, self.owner),
+            )
+        return cur.rowcount > 0
+
+    def delete_job(self, task_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM job_pages WHERE task_id = ?", (task_id,))
+            self._conn.execute("DELETE FROM jobs WHERE task_id = ?", (task_id,))
+
+    # ==================== 查询 ====================
+
+    def _job_from_row(self, row: sqlite3.Row) -> Dict[str, Any]:
+        try:
+            params = json.loads(row["params"] or "{}")
+        except ValueError:
+            params = {}
+        pages = {
+            r["page_index"]: {
+                "status": r["status"],
+                "filename": r["filename"],
+                "error": r["error"],
+                "updated_at": r["updated_at"],
+            }
+            for r in self._conn.execute(
+                "SELECT page_index, status, filename, error, updated_at FROM job_pages "
+                "WHERE task_id = ? ORDER BY page_index",
+                (row["task_id"],),
+            )
+        }
+        return {
+            "task_id": row["task_id"],
+            "status": row["status"],
+            "params": params,
+            "owner": row["owner"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+            "pages": pages,
+        }
+
+    def get_job(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        取任务
+
+        Returns:
+            Optional[Dict]: {task_id, status, params, owner, created_at, updated_at,
+                pages: {index: {status, filename, error, updated_at}}}
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE task_id = ?", (task_id,)).fetchone()
+            return self._job_from_row(row) if row is not None else None
+
+    def claim_unfinished(self) -> List[Dict[str, Any]]:
+        """
+        接管所属进程已退出的 running 任务（多进程同时启动时每个任务只会被一个进程接管）
+
+        Returns:
+            List[Dict]: 接管到的任务（格式同 get_job），generating 的页面已重置为 pending
+        """
+        self.prune()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT task_id, owner FROM jobs WHERE status = ? ORDER BY created_at",
+                (JOB_RUNNING,),
+            ).fetchall()
+
+        claimed = []
+        for row in rows:
+            job = self._claim(row["task_id"], row["owner"])
+            if job is not None:
+                claimed.append(job)
+        return claimed
+
+    def claim_job(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        接管单个 running 任务（所属进程已退出或已放弃所有权时）
+
+        Returns:
+            Optional[Dict]: 接管到的任务；任务不存在、已结束或仍由其它进程执行时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT owner FROM jobs WHERE task_id = ? AND status = ?",
+                (task_id, JOB_RUNNING),
+            ).fetchone()
+        if row is None:
+            return None
+        return self._claim(task_id, row["owner"])
+
+    def _claim(self, task_id: str, previous_owner: Optional[str]) -> Optional[Dict[str, Any]]:
+        owner = self.owner
+        if previous_owner == owner or self._owner_alive(previous_owner):
+            return None
+        now = time.time()
+        with self._lock, self._conn:
+            # 以原 owner 做条件更新，多个进程同时接管时只有一个成功
+            cur = self._conn.execute(
+                "UPDATE jobs SET owner = ?, updated_at = ? WHERE task_id = ? AND status = ? AND owner IS ?",
+                (owner, now, task_id, JOB_RUNNING, previous_owner),
+            )
+            if cur.rowcount != 1:
+                return None
+            self._conn.execute(
+                "UPDATE job_pages SET status = ?, updated_at = ? WHERE task_id = ? AND status = ?",
+                (PAGE_PENDING, now, task_id, PAGE_GENERATING),
+            )
+        return self.get_job(task_id)
+
+    def prune(self, retention: Optional[float] = None) -> int:
+        """删除结束超过保留时间的任务和已退出进程遗留的锁文件，返回删除的任务数量"""
+        cutoff = time.time() - (self.RETENTION_SECONDS if retention is None else retention)
+        with self._lock, self._conn:
+            task_ids = [
+                r[0] for r in self._conn.execute(
+                    "SELECT task_id FROM jobs WHERE status != ? AND updated_at < ?",
+                    (JOB_RUNNING, cutoff),
+                )
+            ]
+            for task_id in task_ids:
+                self._conn.execute("DELETE FROM job_pages WHERE task_id = ?", (task_id,))
+                self._conn.execute("DELETE FROM jobs WHERE task_id = ?", (task_id,))
+
+        # 被 kill 的进程不会删除自己的锁文件；_owner_alive 能拿到锁时顺带删除
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            names = []
+        for name in names:
+            if name.startswith(".jobs-") and name.endswith(".lock"):
+                self._owner_alive(name[len(".jobs-"):-len(".lock")])
+        return len(task_ids)
+
+    def stats(self) -> Dict[str, int]:
+        """各状态任务数（管理面板健康检查）"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: n for status, n in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            if self._owner_lock is not None and self._owner_pid == os.getpid():
+                self._owner_lock.release()
+                _local_owners.discard(self._owner)
+                try:
+                    os.remove(self._owner_lock_path(self._owner))
+                except OSError:
+                    pass
+                self._owner_lock = None
+
+
+# 全局实例
+_store_instance: Optional[GenerationJobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_generation_job_store() -> GenerationJobStore:
+    """
+    获取生成任务存储（单例模式）
+
+    数据库默认为项目根目录下的 history/jobs.db，可用 REDINK_JOB_STORE_PATH 覆盖。
+
+    Returns:
+        GenerationJobStore: 存储实例
+    """
+    global _store_instance
+    if _store_instance is None:
+        with _store_lock:
+            if _store_instance is None:
+                db_path = os.environ.get("REDINK_JOB_STORE_PATH") or os.path.join(
+                    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                    "history",
+                    "jobs.db"
+                )
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+                _store_instance = GenerationJobStore(db_path)
+    return _store_instance
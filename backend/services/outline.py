@@ -23,7 +23,7 @@ class OutlineService:
         active_provider = Config.get_active_text_provider()
         provider_config = Config.get_text_provider_config(active_provider)
         logger.info(f"使用文本服务商: {active_provider} (type={provider_config.get('type')})")
-        return get_text_chat_client(provider_config)
+        return get_text_chat_client(provider_config, active_provider)
 
     def _load_prompt_template(self) -> str:
         prompt_path = os.path.join(
@@ -0,0 +1,268 @@
+"""
+服务商速率限制（令牌桶）
+
+服务商的配额通常按每分钟请求数（RPM）和每分钟 token 数（TPM）计算。以前客户端不知道这些配额，
+突发请求很容易触发 429，然后只能在 retry_on_429 里盲目 sleep。这里在发出请求之前按配额排队：
+
+- 在 text_providers.yaml / image_providers.yaml 的服务商配置中设置 rate_limit：
+    rate_limit:
+      rpm: 60        # 每分钟请求数
+      tpm: 200000    # 每分钟 token 数（仅文本；请求前按字符数估算，响应后按实际用量校正）
+      burst: 10      # 可选：允许的突发请求数，默认 10 秒的 RPM 配额
+- 同一服务商的所有调用（大纲、文案、图片生成）共享同一组令牌桶，配置更新后保留已用配额
+- 图片生成由 GenerationScheduler 在派发前检查，配额不足时调用留在队列中，不占用 worker
+- 文本调用在 REDINK_RATE_LIMIT_MAX_WAIT 秒的期限内等待配额，预计超过期限时直接报错，不做无意义的等待
+- 遇到 429 时 penalize() 暂停该服务商的令牌发放，重试的请求按 Retry-After 排队
+"""
+
+import math
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitTimeout(Exception):
+    """在期限内等不到服务商配额"""
+
+    def __init__(self, provider: str, wait_seconds: float):
+        super().__init__(
+            f"⏳ 服务商 {provider} 的请求速率已达配置上限，预计 {math.ceil(wait_seconds)} 秒后才有配额\n\n"
+            "【解决方案】\n"
+            "1. 稍后再试\n"
+            "2. 如果服务商配额已提升，调整配置中的 rate_limit"
+        )
+        self.provider = provider
+        self.wait_seconds = wait_seconds
+
+
+class TokenBucket:
+    """令牌桶：以 rate_per_minute 的速度补充，最多积攒 capacity 个令牌"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.rate_per_minute = 0.0
+        self.capacity = 0.0
+        self.tokens = 0.0
+        self._updated = clock()
+        self.configure(rate_per_minute, capacity)
+        self.tokens = self.capacity
+
+    def configure(self, rate_per_minute: float, capacity: Optional[float] = None) -> None:
+        """调整速率和容量（保留当前已积攒的令牌，但不超过新容量）"""
+        self._refill()
+        self.rate_per_minute = max(float(rate_per_minute), 1e-9)
+        self.capacity = max(1.0, float(capacity if capacity else rate_per_minute))
+        self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self) -> None:
+        now = self._clock()
+        if self.rate_per_minute:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate_per_minute / 60.0)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """取出 amount 个令牌还需要等待的秒数（0 表示现在就可以）"""
+        self._refill()
+        # 单次请求超过容量时，桶满即可放行（之后令牌为负，后续请求相应等待）
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) * 60.0 / self.rate_per_minute
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= amount
+
+    def give_back(self, amount: float) -> None:
+        """归还多扣的令牌（按实际用量校正估算值）"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def estimate_tokens(texts: Iterable[Optional[str]] = (), images: int = 0, max_output_tokens: int = 0) -> int:
+    """
+    粗略估算一次文本请求占用的 token 数（用于 TPM 配额）
+
+    ASCII 约 4 个字符一个 token，中文等非 ASCII 字符约一个字符一个 token；
+    每张图片按 1000 token 计；最大输出 token 也计入（多数服务商按此预扣配额）。
+    """
+    total = 0
+    for text in texts:
+        if not text:
+            continue
+        non_ascii = sum(1 for ch in text if ord(ch) > 127)
+        total += non_ascii + math.ceil((len(text) - non_ascii) / 4)
+    return total + images * 1000 + max(0, int(max_output_tokens or 0))
+
+
+class ProviderRateLimiter:
+    """单个服务商的 RPM/TPM 令牌桶"""
+
+    # 文本调用等待配额的最长时间（秒）
+    MAX_WAIT = float(os.environ.get("REDINK_RATE_LIMIT_MAX_WAIT", "60"))
+
+    def __init__(self, name: str, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._requests: Optional[TokenBucket] = None
+        self._tokens: Optional[TokenBucket] = None
+        self._blocked_until = float("-inf")
+        self._acquired = 0
+        self._waited = 0.0
+        self._timeouts = 0
+
+    def configure(self, rpm: Optional[float] = None, tpm: Optional[float] = None, burst: Optional[float] = None) -> None:
+        """设置配额（None 或 <= 0 表示不限制该项）"""
+        with self._lock:
+            self._requests = self._configure_bucket(self._requests, rpm, burst or (rpm or 0) / 6)
+            self._tokens = self._configure_bucket(self._tokens, tpm, tpm)
+
+    def _configure_bucket(self, bucket: Optional[TokenBucket], rate, capacity) -> Optional[TokenBucket]:
+        if not rate or rate <= 0:
+            return None
+        if bucket is None:
+            return TokenBucket(rate, capacity, clock=self._clock)
+        bucket.configure(rate, capacity)
+        return bucket
+
+    @property
+    def enabled(self) -> bool:
+        return self._requests is not None or self._tokens is not None
+
+    def try_acquire(self, tokens: int = 0) -> float:
+        """
+        尝试立即取得一次调用的配额（不阻塞）
+
+        Returns:
+            float: 0 表示已取得；否则为还需等待的秒数（此时不扣配额）
+        """
+        with self._lock:
+            wait = max(0.0, self._blocked_until - self._clock())
+            if self._requests is not None:
+                wait = max(wait, self._requests.wait_time(1))
+            if self._tokens is not None and tokens:
+                wait = max(wait, self._tokens.wait_time(tokens))
+            if wait > 0:
+                return wait
+            if self._requests is not None:
+                self._requests.take(1)
+            if self._tokens is not None and tokens:
+                self._tokens.take(tokens)
+            self._acquired += 1
+            return 0.0
+
+    def acquire(self, tokens: int = 0, timeout: Optional[float] = None) -> float:
+        """
+        等待并取得一次调用的配额
+
+        Args:
+            tokens: 预计占用的 token 数（TPM）
+            timeout: 最长等待秒数，默认 REDINK_RATE_LIMIT_MAX_WAIT
+
+        Returns:
+            float: 实际等待的秒数
+
+        Raises:
+            RateLimitTimeout: 预计在期限内等不到配额
+        """
+        started = self._clock()
+        deadline = started + (self.MAX_WAIT if timeout is None else timeout)
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                if waited > 0:
+                    with self._lock:
+                        self._waited += waited
+                    logger.debug(f"服务商 {self.name} 等待配额 {waited:.1f} 秒")
+                return waited
+            if self._clock() + wait > deadline:
+                with self._lock:
+                    self._timeouts += 1
+                raise RateLimitTimeout(self.name, wait)
+            time.sleep(wait)
+            waited = self._clock() - started
+
+    def settle(self, estimated: int, actual: Optional[int]) -> None:
+        """请求完成后按实际 token 用量校正 TPM 预扣"""
+        if actual is None or self._tokens is None:
+            return
+        with self._lock:
+            if actual < estimated:
+                self._tokens.give_back(estimated - actual)
+            elif actual > estimated:
+                self._tokens.take(actual - estimated)
+
+    def penalize(self, seconds: float) -> None:
+        """上游返回 429 时暂停发放配额"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, self._clock() + max(0.0, seconds))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rpm": self._requests.rate_per_minute if self._requests else None,
+                "tpm": self._tokens.rate_per_minute if self._tokens else None,
+                "available_requests": None if self._requests is None else int(max(0.0, self._requests.tokens)),
+                "blocked_for": round(max(0.0, self._blocked_until - self._clock()), 1),
+                "acquired": self._acquired,
+                "waited_seconds": round(self._waited, 1),
+                "timeouts": self._timeouts,
+            }
+
+
+# 全局限流器（按 "text:<服务商>" / "image:<服务商>" 区分）
+_limiters: Dict[str, ProviderRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _number(value: Union[int, float, str, None]) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        logger.warning(f"无效的 rate_limit 配置值: {value!r}")
+        return None
+
+
+def get_provider_rate_limiter(kind: str, provider_name: Optional[str], provider_config: Dict) -> Optional[ProviderRateLimiter]:
+    """
+    获取服务商的限流器（单例，按配置更新配额）
+
+    Args:
+        kind: "text" 或 "image"
+        provider_name: 服务商名称（配置中 providers 下的键）
+        provider_config: 服务商配置，读取其中的 rate_limit
+
+    Returns:
+        Optional[ProviderRateLimiter]: 未配置 rate_limit 时返回 None
+    """
+    rate_limit = (provider_config or {}).get("rate_limit") or {}
+    if not isinstance(rate_limit, dict):
+        rate_limit = {}
+    key = f"{kind}:{provider_name or provider_config.get('type', 'default')}"
+    rpm = _number(rate_limit.get("rpm"))
+    tpm = _number(rate_limit.get("tpm")) if kind == "text" else None
+    burst = _number(rate_limit.get("burst"))
+
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if not (rpm or tpm):
+            if limiter is not None:
+                limiter.configure()
+            return None
+        if limiter is None:
+            limiter = _limiters[key] = ProviderRateLimiter(key)
+        limiter.configure(rpm, tpm, burst)
+        return limiter
+
+
+def rate_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    """所有已配置限流器的统计（管理面板健康检查）"""
+    with _limiters_lock:
+        limiters = [limiter for limiter in _limiters.values() if limiter.enabled]
+    return {limiter.name: limiter.stats() for limiter in limiters}
@@ -0,0 +1,223 @@
+"""
+参考图片存储
+
+用户参考图片上传一次后保存在这里，后续的大纲生成、图片生成和重试请求只需传递图片 ID，
+不必每次重新上传 base64 数据再解码、压缩。
+
+- 图片 ID 即内容的 SHA-256，相同图片（不论来自哪个会话）只保存一份
+- 保存在磁盘（按 ID 前两位分子目录），多 worker 部署时各进程共享
+- 每张图片在最后一次上传/使用后 REDINK_REFERENCE_IMAGE_TTL 秒过期（文件 mtime 即最近使用时间）
+- 总大小受 REDINK_REFERENCE_IMAGES_MAX_BYTES 限制，超出时按最近使用时间淘汰
+- 取不到（ID 无效、已过期或已被淘汰）时抛出 ValueError，由路由返回 400，客户端重新上传即可
+"""
+
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from backend.utils.atomic_file import atomic_write_bytes
+from backend.utils.image_variants import mimetype_from_bytes
+
+logger = logging.getLogger(__name__)
+
+_IMAGE_ID_RE = re.compile(r"[0-9a-f]{64}")
+
+
+def reference_image_id(data: bytes) -> str:
+    """参考图片的内容 ID（SHA-256 十六进制）"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ReferenceImageStore:
+    """按内容哈希保存已上传的参考图片，带过期时间和字节预算"""
+
+    # 总大小上限（字节）
+    MAX_BYTES = int(os.environ.get("REDINK_REFERENCE_IMAGES_MAX_BYTES", str(256 * 1024 * 1024)))
+    # 最后一次使用后的保留时间（秒）
+    TTL = float(os.environ.get("REDINK_REFERENCE_IMAGE_TTL", str(24 * 3600)))
+
+    def __init__(self, root: str, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        self.root = root
+        self.max_bytes = self.MAX_BYTES if max_bytes is None else max_bytes
+        self.ttl = self.TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._deduplicated = 0
+
+    def _path(self, image_id: str) -> str:
+        return os.path.join(self.root, image_id[:2], image_id)
+
+    def put(self, data: bytes, mime_type: Optional[str] = None) -> Dict:
+        """
+        保存一张图片（内容相同则复用已有文件并刷新过期时间）
+
+        Returns:
+            Dict: {"id", "bytes", "mime_type", "deduplicated", "expires_in"}
+        """
+        image_id = reference_image_id(data)
+        path = self._path(image_id)
+        deduplicated = False
+        try:
+            os.utime(path)
+            deduplicated = True
+        except OSError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write_bytes(path, data)
+
+        if deduplicated:
+            with self._lock:
+                self._deduplicated += 1
+        else:
+            self._evict(keep=path)
+
+        return {
+            "id": image_id,
+            "bytes": len(data),
+            "mime_type": mime_type or mimetype_from_bytes(data[:16]),
+            "deduplicated": deduplicated,
+            "expires_in": int(self.ttl),
+        }
+
+    def get(self, image_id: str) -> Optional[bytes]:
+        """按 ID 取图片数据并刷新过期时间；不存在或已过期时返回 None"""
+        if not isinstance(image_id, str) or not _IMAGE_ID_RE.fullmatch(image_id):
+            return None
+        path = self._path(image_id)
+        try:
+            if os.stat(path).st_mtime + self.ttl < time.time():
+                self._remove(path)
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def resolve(self, image_ids, field: str = "image_ids", max_total_bytes: Optional[int] = None) -> List[bytes]:
+        """
+        把请求中的图片 ID 列表解析为图片数据
+
+        Args:
+            image_ids: 图片 ID 列表（调用方应先检查数量，再调用本方法读取）
+            field: 错误信息中使用的参数名
+            max_total_bytes: 解析出的图片总字节数上限（与同一请求中其它来源的图片共用预算时传入剩余额度）
+
+        Raises:
+            ValueError: 参数格式错误、有 ID 不存在或总大小超过限制
+        """
+        if not image_ids:
+            return []
+        if not isinstance(image_ids, list):
+            raise ValueError(f"参数错误：{field} 必须是数组")
+        # 先校验全部 ID 的格式，再读取文件
+        for image_id in image_ids:
+            if not isinstance(image_id, str) or not _IMAGE_ID_RE.fullmatch(image_id):
+                raise ValueError(f"参数错误：{field} 中存在无效的图片 ID")
+
+        images = []
+        total_bytes = 0
+        for image_id in image_ids:
+            data = self.get(image_id)
+            if data is None:
+                raise ValueError(f"参数错误：参考图片 {image_id[:12]} 不存在或已过期，请重新上传")
+            total_bytes += len(data)
+            if max_total_bytes is not None and total_bytes > max_total_bytes:
+                raise ValueError("参数错误：参考图片总大小超过限制")
+            images.append(data)
+        return images
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        # 顺带清理空的子目录
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
+
+    def _list_entries(self) -> List[Tuple[float, int, str]]:
+        entries: List[Tuple[float, int, str]] = []
+        try:
+            with os.scandir(self.root) as shards:
+                shard_dirs = [e.path for e in shards if e.is_dir(follow_symlinks=False)]
+        except OSError:
+            return entries
+        for shard in shard_dirs:
+            try:
+                with os.scandir(shard) as it:
+                    for entry in it:
+                        if not _IMAGE_ID_RE.fullmatch(entry.name):
+                            continue
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+            except OSError:
+                continue
+        return entries
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """删除过期图片，并按最近使用时间淘汰直到总大小不超过预算"""
+        with self._lock:
+            entries = self._list_entries()
+            deadline = time.time() - self.ttl
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, path in sorted(entries):
+                if path == keep:
+                    continue
+                if mtime >= deadline and total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    def cleanup(self) -> None:
+        """删除过期图片（管理面板/定时任务可调用）"""
+        self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        """存储统计（管理面板健康检查）"""
+        entries = self._list_entries()
+        with self._lock:
+            deduplicated = self._deduplicated
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "ttl": int(self.ttl),
+            "deduplicated": deduplicated,
+        }
+
+
+# 全局实例
+_store_instance: Optional[ReferenceImageStore] = None
+_store_lock = threading.Lock()
+
+
+def get_reference_store() -> ReferenceImageStore:
+    """
+    获取参考图片存储（单例模式）
+
+    存储目录默认为项目根目录下的 cache/reference_images，可用 REDINK_REFERENCE_IMAGES_DIR 覆盖。
+
+    Returns:
+        ReferenceImageStore: 存储实例
+    """
+    global _store_instance
+    if _store_instance is None:
+        with _store_lock:
+            if _store_instance is None:
+                root = os.environ.get("REDINK_REFERENCE_IMAGES_DIR") or os.path.join(
+                    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                    "cache",
+                    "reference_images"
+                )
+                _store_instance = ReferenceImageStore(root)
+    return _store_instance
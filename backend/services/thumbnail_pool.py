@@ -0,0 +1,183 @@
+"""
+缩略图后台编码池
+
+原图保存后，缩略图（JPEG 压缩循环）和 WebP/AVIF 变体的编码交给有界线程池完成，
+生成线程可以立即推送 SSE complete 事件，不必等待编码。
+
+- 同一张图片被重新生成时，排队中的旧任务会被跳过，避免旧缩略图覆盖新缩略图
+- 队列已满（REDINK_THUMBNAIL_QUEUE_MAX）或未配置 worker 时在调用线程同步编码（反压）
+- 获取图片时若缩略图仍在编码，可短暂等待（REDINK_THUMBNAIL_WAIT 秒），超时则回退到原图
+- 队列深度等统计通过 stats() 暴露给管理面板健康检查
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    """一次缩略图编码任务"""
+
+    __slots__ = ("seq", "done")
+
+    def __init__(self, seq: int):
+        self.seq = seq
+        self.done = threading.Event()
+
+
+class ThumbnailPool:
+    """有界的缩略图编码线程池，按原图路径跟踪进行中的任务"""
+
+    # 编码线程数（<= 0 表示全部同步编码）
+    WORKERS = int(os.environ.get("REDINK_THUMBNAIL_WORKERS", "2"))
+    # 最多允许排队/进行中的任务数，超出时同步编码
+    MAX_QUEUE = int(os.environ.get("REDINK_THUMBNAIL_QUEUE_MAX", "64"))
+    # 获取图片时等待缩略图编码完成的最长时间（秒）
+    WAIT_TIMEOUT = float(os.environ.get("REDINK_THUMBNAIL_WAIT", "2"))
+
+    def __init__(self, workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.workers = self.WORKERS if workers is None else workers
+        self.max_queue = self.MAX_QUEUE if max_queue is None else max_queue
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Dict[str, _Job] = {}
+        self._queued = 0
+        self._seq = 0
+        self._submitted = 0
+        self._completed = 0
+        self._superseded = 0
+        self._failed = 0
+        self._inline = 0
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.abspath(path)
+
+    def submit(self, path: str, work: Callable[[], Any]) -> bool:
+        """
+        提交某张原图的缩略图编码任务
+
+        Args:
+            path: 原图路径（用于跟踪与去重）
+            work: 实际的编码函数
+
+        Returns:
+            bool: 是否进入后台队列（False 表示已在当前线程同步完成）
+        """
+        key = self._key(path)
+        with self._lock:
+            background = self.workers > 0 and self._queued < self.max_queue
+            self._seq += 1
+            job = _Job(self._seq)
+            self._pending[key] = job
+            self._submitted += 1
+            if background:
+                self._queued += 1
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix="thumbnail"
+                    )
+                executor = self._executor
+            else:
+                self._inline += 1
+
+        if background:
+            executor.submit(self._run, key, job, work)
+        else:
+            self._run(key, job, work, queued=False)
+        return background
+
+    def _run(self, key: str, job: _Job, work: Callable[[], Any], queued: bool = True) -> None:
+        try:
+            with self._lock:
+                latest = self._pending.get(key) is job
+            if not latest:
+                # 同一张图片已被重新生成，由更新的任务负责
+                with self._lock:
+                    self._superseded += 1
+                return
+            work()
+            with self._lock:
+                self._completed += 1
+        except Exception as e:
+            with self._lock:
+                self._failed += 1
+            logger.warning(f"缩略图编码失败: {key}, {e}")
+        finally:
+            with self._lock:
+                if queued:
+                    self._queued -= 1
+                if self._pending.get(key) is job:
+                    del self._pending[key]
+            job.done.set()
+
+    def is_pending(self, path: str) -> bool:
+        """该原图的缩略图是否仍在排队/编码中"""
+        with self._lock:
+            return self._key(path) in self._pending
+
+    def wait(self, path: str, timeout: Optional[float] = None) -> bool:
+        """
+        等待该原图的缩略图编码完成
+
+        Returns:
+            bool: 是否已完成（超时返回 False）
+        """
+        key = self._key(path)
+        timeout = self.WAIT_TIMEOUT if timeout is None else timeout
+        while True:
+            with self._lock:
+                job = self._pending.get(key)
+            if job is None:
+                return True
+            if not job.done.wait(timeout):
+                return False
+            # 等待期间可能又提交了更新的任务，继续等待最新的那个（不额外延长超时）
+            timeout = 0
+
+    def stats(self) -> Dict[str, int]:
+        """队列统计（管理面板健康检查）"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "pending": len(self._pending),
+                "queued": self._queued,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "superseded": self._superseded,
+                "failed": self._failed,
+                "inline": self._inline,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """关闭线程池"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+# 全局线程池实例
+_pool_instance: Optional[ThumbnailPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_thumbnail_pool() -> ThumbnailPool:
+    """
+    获取缩略图编码池（单例模式）
+
+    Returns:
+        ThumbnailPool: 线程池实例
+    """
+    global _pool_instance
+    if _pool_instance is None:
+        with _pool_lock:
+            if _pool_instance is None:
+                _pool_instance = ThumbnailPool()
+    return _pool_instance
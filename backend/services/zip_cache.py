@@ -0,0 +1,280 @@
+"""
+历史记录 ZIP 打包缓存
+
+同一组已完成的图片常被反复下载，每次都重新读取并打包所有 PNG 很浪费。
+这里把打好的 ZIP 缓存到磁盘（按任务目录分子目录）：
+
+- 缓存键 = 任务目录指纹（文件名、大小、mtime）+ 记录的 updated_at，
+  图片重新生成或记录被修改后指纹变化，自动使用新的缓存文件
+- 图片写入/任务目录删除时调用 invalidate() 主动清理该任务的全部缓存
+- 总大小受 REDINK_ZIP_CACHE_MAX_BYTES 限制，超出时按最近使用时间（文件 mtime）淘汰
+- 未命中时边向客户端输出边写入缓存文件（open_bundle），首字节不必等整个归档写完
+- 单个归档超出预算时记住该记录的指纹，之后的下载直接流式打包，不再重复写盘
+- 预算 <= 0 表示禁用缓存，下载接口退回流式打包
+"""
+
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def task_dir_fingerprint(task_dir: str, updated_at: str = "") -> str:
+    """
+    计算任务目录的内容指纹（只看任务目录下的文件名、大小和 mtime，不读取文件内容；
+    忽略缩略图和尺寸变体）
+
+    Args:
+        task_dir: 任务目录
+        updated_at: 记录的更新时间（元信息文本随记录变化）
+
+    Returns:
+        str: 十六进制指纹
+    """
+    entries: List[Tuple[str, int, int]] = []
+    try:
+        with os.scandir(task_dir) as it:
+            for entry in it:
+                # 缩略图/尺寸变体不进入 ZIP，后台编码写入它们时不应使缓存失效
+                if entry.name.startswith(("thumb_", "var_")):
+                    continue
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                entries.append((entry.name, st.st_size, st.st_mtime_ns))
+    except OSError:
+        pass
+
+    h = hashlib.sha256()
+    h.update(str(updated_at or "").encode("utf-8"))
+    for name, size, mtime_ns in sorted(entries):
+        h.update(f"\0{name}\0{size}\0{mtime_ns}".encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+class ZipBundleCache:
+    """按记录缓存 ZIP 打包结果，LRU 字节预算"""
+
+    # 缓存总大小上限（字节），<= 0 表示禁用
+    MAX_BYTES = int(os.environ.get("REDINK_ZIP_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+    def __init__(self, root: str, max_bytes: Optional[int] = None):
+        self.root = root
+        self.max_bytes = self.MAX_BYTES if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        # (task_id, record_id) -> 超出预算的归档指纹
+        self._oversize: Dict[Tuple[str, str], str] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _bundle_path(self, task_id: str, record_id: str, digest: str) -> str:
+        return os.path.join(self.root, task_id, f"{record_id}-{digest}.zip")
+
+    def _locate(self, task_id: str, record_id: str, updated_at: str, task_dir: str) -> Tuple[str, str, bool]:
+        """计算指纹与缓存路径，返回 (指纹, 路径, 是否命中)"""
+        digest = task_dir_fingerprint(task_dir, updated_at)
+        path = self._bundle_path(task_id, record_id, digest)
+        if os.path.isfile(path):
+            try:
+                # 命中时刷新 mtime，作为 LRU 的最近使用时间
+                os.utime(path)
+                return digest, path, True
+            except OSError:
+                pass
+        return digest, path, False
+
+    def _is_oversize(self, task_id: str, record_id: str, digest: str) -> bool:
+        with self._lock:
+            return self._oversize.get((task_id, record_id)) == digest
+
+    def open_bundle(
+        self,
+        task_id: str,
+        record_id: str,
+        updated_at: str,
+        task_dir: str,
+        build: Callable[[], Iterable[bytes]],
+    ) -> Tuple[Optional[str], Optional[Iterator[bytes]]]:
+        """
+        获取记录的 ZIP：命中缓存时返回缓存文件，否则返回数据块迭代器
+
+        未命中时迭代器边输出边写入缓存文件，完整输出后缓存生效（客户端中途断开则丢弃）；
+        缓存被禁用或该记录已知超出预算时直接返回 build() 的数据块。
+
+        Args:
+            task_id: 任务 ID（缓存子目录）
+            record_id: 记录 ID
+            updated_at: 记录更新时间
+            task_dir: 任务目录
+            build: 返回 ZIP 数据块迭代器的函数
+
+        Returns:
+            Tuple[Optional[str], Optional[Iterator[bytes]]]: (缓存文件路径, None) 或 (None, 数据块迭代器)
+        """
+        if not self.enabled:
+            return None, iter(build())
+        digest, path, hit = self._locate(task_id, record_id, updated_at, task_dir)
+        if hit:
+            return path, None
+        if self._is_oversize(task_id, record_id, digest):
+            return None, iter(build())
+        return None, self._write_through(task_id, record_id, digest, path, build)
+
+    def _write_through(
+        self,
+        task_id: str,
+        record_id: str,
+        digest: str,
+        path: str,
+        build: Callable[[], Iterable[bytes]],
+    ) -> Iterator[bytes]:
+        """输出 build() 的数据块，同时写入缓存文件；超出预算时停止写入并记住该指纹"""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{record_id}.", suffix=".tmp")
+        f = os.fdopen(fd, "wb")
+        size = 0
+        try:
+            for chunk in build():
+                if f is not None:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        f.close()
+                        f = None
+                        os.remove(tmp_path)
+                        with self._lock:
+                            self._oversize[(task_id, record_id)] = digest
+                        logger.info(f"ZIP 大小超出缓存预算，跳过缓存: record={record_id}")
+                    else:
+                        f.write(chunk)
+                yield chunk
+            if f is None:
+                return
+            f.close()
+            f = None
+            os.replace(tmp_path, path)
+        except BaseException:
+            # 打包出错或客户端中途断开：丢弃未完成的缓存文件
+            if f is not None:
+                f.close()
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        self._remove_stale(directory, record_id, keep=path)
+        self._evict(keep=path)
+        logger.debug(f"已缓存 ZIP: record={record_id}, size={size}")
+
+    def _remove_stale(self, directory: str, record_id: str, keep: str) -> None:
+        """删除同一记录旧指纹的缓存文件"""
+        prefix = f"{record_id}-"
+        try:
+            with os.scandir(directory) as it:
+                stale = [e.path for e in it if e.name.startswith(prefix) and e.name.endswith(".zip") and e.path != keep]
+        except OSError:
+            return
+        for stale_path in stale:
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass
+
+    def _list_bundles(self) -> List[Tuple[float, int, str]]:
+        bundles: List[Tuple[float, int, str]] = []
+        try:
+            with os.scandir(self.root) as tasks:
+                task_dirs = [e.path for e in tasks if e.is_dir(follow_symlinks=False)]
+        except OSError:
+            return bundles
+        for task_path in task_dirs:
+            try:
+                with os.scandir(task_path) as it:
+                    for entry in it:
+                        if not entry.name.endswith(".zip"):
+                            continue
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        bundles.append((st.st_mtime, st.st_size, entry.path))
+            except OSError:
+                continue
+        return bundles
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """按最近使用时间淘汰缓存，直到总大小不超过预算"""
+        with self._lock:
+            bundles = self._list_bundles()
+            total = sum(size for _, size, _ in bundles)
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(bundles):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+                # 顺带清理空的任务子目录
+                try:
+                    os.rmdir(os.path.dirname(path))
+                except OSError:
+                    pass
+
+    def total_bytes(self) -> int:
+        """当前缓存占用的总字节数"""
+        return sum(size for _, size, _ in self._list_bundles())
+
+    def invalidate(self, task_id: str) -> None:
+        """删除某个任务的全部 ZIP 缓存（图片重新生成或任务目录删除后调用）"""
+        if not task_id:
+            return
+        with self._lock:
+            for key in [key for key in self._oversize if key[0] == task_id]:
+                del self._oversize[key]
+        path = os.path.join(self.root, task_id)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# 全局缓存实例
+_cache_instance: Optional[ZipBundleCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_zip_bundle_cache() -> ZipBundleCache:
+    """
+    获取 ZIP 打包缓存（单例模式）
+
+    缓存目录默认为项目根目录下的 cache/zip_bundles，可用 REDINK_ZIP_CACHE_DIR 覆盖。
+    （不放在 history 目录下，避免被当作任务目录扫描/清理）
+
+    Returns:
+        ZipBundleCache: 缓存实例
+    """
+    global _cache_instance
+    if _cache_instance is None:
+        with _cache_lock:
+            if _cache_instance is None:
+                root = os.environ.get("REDINK_ZIP_CACHE_DIR") or os.path.join(
+                    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                    "cache",
+                    "zip_bundles"
+                )
+                _cache_instance = ZipBundleCache(root)
+    return _cache_instance
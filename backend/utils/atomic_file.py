@@ -0,0 +1,54 @@
+"""
+原子文件写入
+
+先写入同目录下的临时文件并 fsync，再用 os.replace 覆盖目标文件。
+读者要么看到旧内容、要么看到完整的新内容，进程中途崩溃也不会留下半截 JSON。
+mkstemp 创建的临时文件权限为 0600，替换前改为目标文件原有的权限（新文件按 umask 默认权限），
+与直接 open() 写入时一致，其它用户/静态文件服务器仍可读取。
+"""
+
+import os
+import json
+import tempfile
+from typing import Any
+
+# 进程的 umask（只能通过设置再恢复的方式读取，导入时读取一次）
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _target_mode(path: str) -> int:
+    """目标文件已存在时沿用其权限，否则为 0666 去掉 umask"""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except OSError:
+        return 0o666 & ~_UMASK
+
+
+def atomic_write_bytes(path: str, data: bytes) -> None:
+    """原子地把 data 写入 path"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory,
+        prefix=f".{os.path.basename(path)}.",
+        suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, _target_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path: str, obj: Any, indent: int = 2) -> None:
+    """原子地把 obj 以 UTF-8 JSON 写入 path（保留中文，不转义）"""
+    data = json.dumps(obj, ensure_ascii=False, indent=indent).encode("utf-8")
+    atomic_write_bytes(path, data)
@@ -0,0 +1,201 @@
+"""
+跨进程文件锁
+
+多 worker 部署（如 gunicorn -w N）时，各进程共享同一个 history 目录，
+仅靠 threading.Lock 无法阻止其它进程同时读改写同一个文件。
+
+FileLock 在锁文件上加排他锁：
+- POSIX：fcntl.flock（进程退出时由内核自动释放，不会留下死锁）
+- Windows：msvcrt.locking
+同一进程内按锁文件路径共享一把可重入线程锁，因此同一线程可以嵌套获取。
+
+ProcessFileLock 是不绑定线程的版本：在进程生命周期内持有（如标记进程存活），任意线程都可以释放。
+"""
+
+import os
+import threading
+from typing import Dict
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+
+class _LockState:
+    """同一锁文件在本进程内的共享状态"""
+
+    def __init__(self):
+        self.thread_lock = threading.RLock()
+        self.fd = None
+        self.depth = 0
+
+
+_states: Dict[str, _LockState] = {}
+_states_guard = threading.Lock()
+
+
+def _state_for(path: str) -> _LockState:
+    with _states_guard:
+        state = _states.get(path)
+        if state is None:
+            state = _LockState()
+            _states[path] = state
+        return state
+
+
+def _lock_fd(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return
+    # msvcrt.locking 的 LK_LOCK 最多重试 10 秒，超时抛 OSError，这里一直等到拿到锁
+    while True:  # pragma: no cover - Windows
+        try:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+
+def _try_lock_fd(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:  # pragma: no cover - Windows
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock_fd(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        return
+    os.lseek(fd, 0, os.SEEK_SET)  # pragma: no cover - Windows
+    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)  # pragma: no cover - Windows
+
+
+class FileLock:
+    """
+    基于锁文件的跨进程 + 跨线程排他锁
+
+    用法：
+        with FileLock("/path/to/index.json.lock"):
+            ...  # 读改写
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self._state = _state_for(self.path)
+
+    def acquire(self) -> None:
+        state = self._state
+        state.thread_lock.acquire()
+        if state.depth == 0:
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    _lock_fd(fd)
+                except BaseException:
+                    os.close(fd)
+                    raise
+            except BaseException:
+                state.thread_lock.release()
+                raise
+            state.fd = fd
+        state.depth += 1
+
+    def try_acquire(self) -> bool:
+        """非阻塞获取：锁已被其它进程/线程持有时立即返回 False"""
+        state = self._state
+        if not state.thread_lock.acquire(blocking=False):
+            return False
+        if state.depth == 0:
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            except BaseException:
+                state.thread_lock.release()
+                raise
+            if not _try_lock_fd(fd):
+                os.close(fd)
+                state.thread_lock.release()
+                return False
+            state.fd = fd
+        state.depth += 1
+        return True
+
+    def release(self) -> None:
+        state = self._state
+        state.depth -= 1
+        if state.depth == 0:
+            fd, state.fd = state.fd, None
+            try:
+                _unlock_fd(fd)
+            finally:
+                os.close(fd)
+        state.thread_lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
+class ProcessFileLock:
+    """
+    不绑定线程的进程级文件锁（直接持有加锁的文件描述符）
+
+    同一进程内对同一路径再次加锁也会失败（flock 按打开的文件描述符区分），
+    调用方需要自行区分本进程持有的锁。
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self._fd = None
+        self._guard = threading.Lock()
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self) -> None:
+        """阻塞获取"""
+        with self._guard:
+            if self._fd is not None:
+                return
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                _lock_fd(fd)
+            except BaseException:
+                os.close(fd)
+                raise
+            self._fd = fd
+
+    def try_acquire(self) -> bool:
+        """非阻塞获取：锁已被持有时立即返回 False"""
+        with self._guard:
+            if self._fd is not None:
+                return True
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if not _try_lock_fd(fd):
+                os.close(fd)
+                return False
+            self._fd = fd
+            return True
+
+    def release(self) -> None:
+        """释放（未持有时忽略）"""
+        with self._guard:
+            fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            _unlock_fd(fd)
+        finally:
+            os.close(fd)
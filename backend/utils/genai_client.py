@@ -8,12 +8,19 @@ from google.genai import types
 
 # 导入统一的错误解析函数
 from ..generators.google_genai import parse_genai_error
+from backend.services.adaptive_limiter import retry_after_seconds
+from backend.services.rate_limiter import RateLimitTimeout, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
 
 def retry_on_429(max_retries=3, base_delay=2):
-    """429 错误自动重试装饰器（带智能错误解析）"""
+    """
+    429 错误自动重试装饰器（带智能错误解析）
+
+    客户端配置了限流器时，429 不在当前线程 sleep，而是暂停该服务商的配额发放，
+    重试请求在限流器中按期限排队。
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
@@ -21,6 +28,8 @@ def retry_on_429(max_retries=3, base_delay=2):
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
+                except RateLimitTimeout:
+                    raise
                 except Exception as e:
                     last_error = e
                     error_str = str(e).lower()
@@ -46,9 +55,15 @@ def retry_on_429(max_retries=3, base_delay=2):
 
                     # 可重试的错误
                     if attempt < max_retries - 1:
+                        rate_limiter = getattr(args[0], "rate_limiter", None) if args else None
                         if "429" in error_str or "resource_exhausted" in error_str:
-                            wait_time = (base_delay ** attempt) + random.uniform(0, 1)
+                            wait_time = retry_after_seconds(e)
+                            if wait_time is None:
+                                wait_time = (base_delay ** attempt) + random.uniform(0, 1)
                             logger.warning(f"遇到资源限制，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
+                            if rate_limiter is not None:
+                                rate_limiter.penalize(wait_time)
+                                continue
                         else:
                             wait_time = min(2 ** attempt, 10) + random.uniform(0, 1)
                             logger.warning(f"请求失败，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
@@ -67,8 +82,9 @@ def retry_on_429(max_retries=3, base_delay=2):
 class GenAIClient:
     """GenAI 客户端封装类（已弃用，请使用 GoogleGenAIGenerator）"""
 
-    def __init__(self, api_key: str = None, base_url: str = None):
+    def __init__(self, api_key: str = None, base_url: str = None, rate_limiter=None):
         self.api_key = api_key
+        self.rate_limiter = rate_limiter
         if not self.api_key:
             raise ValueError(
                 "Google Cloud API Key 未配置。\n"
@@ -164,16 +180,29 @@ class GenAIClient:
 
         generate_content_config = types.GenerateContentConfig(**config_kwargs)
 
+        estimated_tokens = estimate_tokens(
+            (prompt,),
+            images=sum(1 for img in images or () if isinstance(img, bytes)),
+            max_output_tokens=max_output_tokens
+        )
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(estimated_tokens)
+
         result = ""
+        usage = None
         for chunk in self.client.models.generate_content_stream(
             model=model,
             contents=contents,
             config=generate_content_config,
         ):
+            usage = getattr(chunk, "usage_metadata", None) or usage
             if not chunk.candidates or not chunk.candidates[0].content or not chunk.candidates[0].content.parts:
                 continue
             result += chunk.text
 
+        if self.rate_limiter is not None:
+            self.rate_limiter.settle(estimated_tokens, getattr(usage, "total_token_count", None))
+
         return result
 
     @retry_on_429(max_retries=5, base_delay=3)  # 图片生成重试更多次
@@ -215,6 +244,9 @@ class GenAIClient:
             ),
         )
 
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
         image_data = None
         for chunk in self.client.models.generate_content_stream(
             model=model,
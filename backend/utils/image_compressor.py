@@ -1,11 +1,237 @@
 """图片压缩工具"""
 import io
+import os
+import math
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 from PIL import Image
-from typing import Optional
+from typing import Callable, Dict, Hashable, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# 质量阶梯的档距
+_QUALITY_STEP = 5
+# 缩小尺寸时长边的下限（像素）
+_MIN_DIMENSION = 512
+# 按字节/像素比估算缩放比例时的安全系数
+_SCALE_MARGIN = 0.95
+# 缩小后的体积达到目标的该比例即认为足够接近，不再向上修正
+_FILL_RATIO = 0.8
+# 缩放比例区间的相对宽度收敛到该值以内即停止修正
+_SCALE_TOLERANCE = 0.02
+# 缩小尺寸的轮数安全上限（正常情况下由 _FILL_RATIO / _SCALE_TOLERANCE 提前结束）
+_MAX_SCALE_PASSES = 16
+# 大图降采样解码（JPEG draft + reduce），基准测试中可关闭以对比
+_FAST_DECODE = True
+
+
+class _CompressCache:
+    """
+    compress_image 结果的 LRU 缓存（按结果字节数限制总大小）
+
+    键为 (内容哈希, 压缩参数)，值为不可变的 bytes，可在线程间安全共享。
+    并发请求同一个键时只有一个线程执行压缩，其余线程等待结果。
+    """
+
+    # 缓存结果总字节数上限，<= 0 表示禁用
+    MAX_BYTES = int(os.environ.get("REDINK_COMPRESS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = self.MAX_BYTES if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._inflight: Dict[Hashable, threading.Event] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], bytes]) -> bytes:
+        if self.max_bytes <= 0:
+            return compute()
+
+        while True:
+            with self._lock:
+                cached = self._entries.get(key)
+                if cached is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return cached
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    self._inflight[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # 其它线程正在压缩同一张图片，等它完成后再查缓存
+            waiter.wait()
+
+        try:
+            result = compute()
+            self._put(key, result)
+            return result
+        finally:
+            with self._lock:
+                event = self._inflight.pop(key)
+            event.set()
+
+    def _put(self, key: Hashable, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = value
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+_compress_cache = _CompressCache()
+
+
+def compress_cache_stats() -> Dict[str, int]:
+    """压缩结果缓存的统计信息"""
+    return _compress_cache.stats()
+
+
+def _decode_reduced(image_data: bytes, max_dimension: int) -> Image.Image:
+    """
+    解码图片，并在不低于 max_dimension 的前提下尽量缩小解码尺寸
+
+    - JPEG：用 draft() 让解码器直接按 1/2、1/4、1/8 比例解码，内存和耗时都随之下降
+    - 其它格式：完整解码后先用 reduce()（整数倍盒式降采样，很快）缩到不足两倍目标边长，
+      之后再由调用方做高质量的 LANCZOS 缩放，重采样的像素量大幅减少
+    """
+    img = Image.open(io.BytesIO(image_data))
+    if not _FAST_DECODE:
+        return img
+
+    width, height = img.size
+    long_side = max(width, height)
+    if long_side <= max_dimension:
+        return img
+
+    if img.format == "JPEG":
+        ratio = max_dimension / long_side
+        img.draft("RGB", (math.ceil(width * ratio), math.ceil(height * ratio)))
+
+    factor = max(img.size) // max_dimension
+    if factor >= 2:
+        if img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("P", "PA") else "RGB")
+        img = img.reduce(factor)
+    return img
+
+
+def _encode_jpeg(img: Image.Image, quality: int) -> bytes:
+    """以指定质量编码为 JPEG"""
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def _search_quality(img: Image.Image, max_size_bytes: int, quality_start: int, quality_min: int) -> bytes:
+    """
+    在质量阶梯 quality_start, quality_start-5, ..., >= quality_min 上查找满足大小要求的最高质量
+
+    体积随质量单调增长：先从高质量端按 1, 2, 4... 档跳跃探测，找到满足要求的区间后二分，
+    接近起始质量即可满足时只需一两次编码，最坏情况也只需 O(log n) 次。
+
+    Returns:
+        最高可行质量的编码结果；全部不满足时返回最低质量的编码结果
+    """
+    ladder = list(range(quality_start, quality_min - 1, -_QUALITY_STEP)) or [quality_start]
+    encoded: Dict[int, bytes] = {}
+
+    def fits(i: int) -> bool:
+        if i not in encoded:
+            encoded[i] = _encode_jpeg(img, ladder[i])
+        return len(encoded[i]) <= max_size_bytes
+
+    # 跳跃探测：找到第一个满足要求的档位 hi（之前的 lo 不满足）
+    lo, hi, step = -1, 0, 1
+    while not fits(hi):
+        if hi == len(ladder) - 1:
+            return encoded[hi]
+        lo, hi = hi, min(hi + step, len(ladder) - 1)
+        step *= 2
+
+    # 二分：(lo, hi] 区间内 hi 满足、lo 不满足
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if fits(mid):
+            hi = mid
+        else:
+            lo = mid
+    return encoded[hi]
+
+
+def _search_scale(img: Image.Image, max_size_bytes: int, quality: int, full_data: bytes) -> bytes:
+    """
+    缩小尺寸直到满足大小要求（长边不小于 _MIN_DIMENSION）
+
+    JPEG 体积与像素数并不成正比，单点估算常常一步缩得过小。这里维护一个区间：
+    fit 为已知满足要求的最大比例，too_big 为已知超出的最小比例，
+    用两端的实测体积在对数空间做割线估算（同一端连续更新两次时改用几何二分，避免停滞），
+    直到结果达到目标的 _FILL_RATIO，或区间宽度不超过 _SCALE_TOLERANCE。
+    只有一端时按面积比的平方根估算。
+    无法再缩小（长边已不超过 _MIN_DIMENSION）时返回原尺寸的编码结果 full_data。
+    """
+    width, height = img.size
+    floor = min(1.0, _MIN_DIMENSION / max(width, height))
+    if floor >= 1.0:
+        return full_data
+
+    target = max_size_bytes * _SCALE_MARGIN
+    # (比例, 体积, 编码结果)
+    too_big: Tuple[float, int, bytes] = (1.0, len(full_data), full_data)
+    fit: Optional[Tuple[float, int, bytes]] = None
+    last_side = None
+
+    for _ in range(_MAX_SCALE_PASSES):
+        if fit is None:
+            if too_big[0] <= floor:
+                break
+            scale = max(floor, too_big[0] * math.sqrt(target / too_big[1]))
+        else:
+            if fit[1] >= max_size_bytes * _FILL_RATIO or too_big[0] <= fit[0] * (1 + _SCALE_TOLERANCE):
+                break
+            lo, hi = math.log(fit[0]), math.log(too_big[0])
+            slope = (math.log(too_big[1]) - math.log(fit[1])) / (hi - lo)
+            estimate = lo + (math.log(target) - math.log(fit[1])) / slope if slope > 0 else hi
+            if last_side == "repeat" or not lo < estimate < hi:
+                estimate = (lo + hi) / 2
+            scale = math.exp(estimate)
+
+        resized = img.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.Resampling.LANCZOS)
+        result = _encode_jpeg(resized, quality)
+        side = "fit" if len(result) <= max_size_bytes else "too_big"
+        last_side = "repeat" if side == last_side else side
+        if side == "fit":
+            fit = (scale, len(result), result)
+        else:
+            too_big = (scale, len(result), result)
+
+    return fit[2] if fit is not None else too_big[2]
+
 
 def compress_image(
     image_data: bytes,
@@ -33,65 +259,66 @@ def compress_image(
     if len(image_data) <= max_size_bytes:
         return image_data
 
+    # 相同内容 + 相同参数只压缩一次（同一任务的封面/参考图会被每一页反复压缩）
+    key = (
+        hashlib.blake2b(image_data, digest_size=20).digest(),
+        max_size_kb, quality_start, quality_min, max_dimension
+    )
     try:
-        # 打开图片
-        img = Image.open(io.BytesIO(image_data))
-
-        # 转换为 RGB（处理 RGBA 等格式）
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        # 如果图片尺寸过大，先缩小
-        width, height = img.size
-        if width > max_dimension or height > max_dimension:
-            ratio = min(max_dimension / width, max_dimension / height)
-            new_width = int(width * ratio)
-            new_height = int(height * ratio)
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-        # 逐步降低质量直到满足大小要求
-        quality = quality_start
-        compressed_data = None
-
-        while quality >= quality_min:
-            output = io.BytesIO()
-            img.save(output, format='JPEG', quality=quality, optimize=True)
-            compressed_data = output.getvalue()
-
-            if len(compressed_data) <= max_size_bytes:
-                break
+        return _compress_cache.get_or_compute(
+            key,
+            lambda: _compress_uncached(image_data, max_size_bytes, quality_start, quality_min, max_dimension)
+        )
+    except Exception as e:
+        # 失败结果不进入缓存
+        logger.warning(f"图片压缩失败，返回原图: {e}")
+        return image_data
 
-            quality -= 5
 
-        # 如果还是太大，进一步缩小尺寸
-        if len(compressed_data) > max_size_bytes:
-            width, height = img.size
-            while len(compressed_data) > max_size_bytes and max(width, height) > 512:
-                width = int(width * 0.9)
-                height = int(height * 0.9)
-                img_resized = img.resize((width, height), Image.Resampling.LANCZOS)
+def _compress_uncached(
+    image_data: bytes,
+    max_size_bytes: int,
+    quality_start: int,
+    quality_min: int,
+    max_dimension: int
+) -> bytes:
+    """compress_image 的实际压缩过程（不经过缓存，失败时抛出异常）"""
+    # 打开图片（大图按目标边长降采样解码）
+    img = _decode_reduced(image_data, max_dimension)
 
-                output = io.BytesIO()
-                img_resized.save(output, format='JPEG', quality=quality_min, optimize=True)
-                compressed_data = output.getvalue()
+    # 转换为 RGB（处理 RGBA 等格式）
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
 
-        original_size_kb = len(image_data) / 1024
-        compressed_size_kb = len(compressed_data) / 1024
-        compression_ratio = (1 - compressed_size_kb / original_size_kb) * 100
+    # 如果图片尺寸过大，先缩小
+    width, height = img.size
+    if width > max_dimension or height > max_dimension:
+        ratio = min(max_dimension / width, max_dimension / height)
+        new_width = int(width * ratio)
+        new_height = int(height * ratio)
+        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
 
-        logger.info(f"图片压缩: {original_size_kb:.1f}KB → {compressed_size_kb:.1f}KB (压缩 {compression_ratio:.1f}%)")
+    # 按质量阶梯（每档 5）查找满足大小要求的最高质量
+    compressed_data = _search_quality(img, max_size_bytes, quality_start, quality_min)
 
-        return compressed_data
+    # 最低质量仍然太大：按字节/像素比估算缩放比例，再缩小尺寸
+    if len(compressed_data) > max_size_bytes:
+        compressed_data = _search_scale(img, max_size_bytes, quality_min, compressed_data)
+
+    original_size_kb = len(image_data) / 1024
+    compressed_size_kb = len(compressed_data) / 1024
+    compression_ratio = (1 - compressed_size_kb / original_size_kb) * 100
+
+    logger.info(f"图片压缩: {original_size_kb:.1f}KB → {compressed_size_kb:.1f}KB (压缩 {compression_ratio:.1f}%)")
+
+    return compressed_data
 
-    except Exception as e:
-        logger.warning(f"图片压缩失败，返回原图: {e}")
-        return image_data
 
 
 def compress_images(images: list[bytes], max_size_kb: int = 200) -> list[bytes]:
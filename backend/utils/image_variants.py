@@ -0,0 +1,199 @@
+"""
+图片多尺寸变体
+
+为每张生成的图片输出若干尺寸（gallery / card / preview）的 WebP 变体，
+Pillow 支持 AVIF 时额外输出 AVIF。获取图片时根据 Accept 头和期望宽度选择最合适的变体，
+历史画廊等场景的流量因此大幅下降。
+
+变体文件与原图放在同一任务目录，命名为 var_<序号>_<尺寸>.<格式>，
+扩展名不是 png/jpg，不会被当作生成结果扫描或打包。
+"""
+
+import io
+import os
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, features
+
+from backend.utils.atomic_file import atomic_write_bytes
+
+logger = logging.getLogger(__name__)
+
+# 尺寸名称 -> 最大宽度（像素），按宽度升序
+VARIANT_WIDTHS: Dict[str, int] = {
+    "gallery": 320,
+    "card": 640,
+    "preview": 1080,
+}
+
+# 未指定宽度时使用的尺寸
+DEFAULT_SIZE = "card"
+
+# 格式 -> (扩展名, MIME 类型, Pillow 保存参数)，按优先级排序
+_FORMATS: Dict[str, Tuple[str, str, Dict]] = {
+    "AVIF": ("avif", "image/avif", {"quality": 60, "speed": 8}),
+    "WEBP": ("webp", "image/webp", {"quality": 80, "method": 4}),
+}
+
+VARIANT_FILENAME_RE = re.compile(r"var_(\d+)_(" + "|".join(VARIANT_WIDTHS) + r")\.(avif|webp)")
+
+_MAGIC_MIMETYPES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+)
+
+
+def _feature_available(name: str) -> bool:
+    try:
+        return bool(features.check(name))
+    except Exception:
+        return False
+
+
+def supported_formats() -> List[str]:
+    """当前 Pillow 可编码的变体格式（按优先级排序）"""
+    return [fmt for fmt in _FORMATS if _feature_available(fmt.lower())]
+
+
+def variant_filename(filename: str, size: str, fmt: str) -> str:
+    """原图文件名对应的变体文件名，如 ("0.png", "card", "WEBP") -> "var_0_card.webp" """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return f"var_{stem}_{size}.{_FORMATS[fmt][0]}"
+
+
+def remove_variants(task_dir: str, filename: str) -> None:
+    """删除一张图片的全部尺寸变体（图片重新生成前调用，避免新变体编码失败时继续提供旧图的变体）"""
+    for size in VARIANT_WIDTHS:
+        for fmt in _FORMATS:
+            try:
+                os.remove(os.path.join(task_dir, variant_filename(filename, size, fmt)))
+            except OSError:
+                pass
+
+
+def variant_mimetype(filename: str) -> str:
+    """变体文件的 MIME 类型"""
+    ext = os.path.splitext(filename)[1].lstrip(".").lower()
+    for file_ext, mimetype, _ in _FORMATS.values():
+        if file_ext == ext:
+            return mimetype
+    return "application/octet-stream"
+
+
+def sniff_mimetype(path: str, default: str = "image/png") -> str:
+    """按文件头判断图片的真实 MIME 类型（缩略图虽然叫 .png，实际是 JPEG）"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(16)
+    except OSError:
+        return default
+    return mimetype_from_bytes(head, default)
+
+
+def mimetype_from_bytes(head: bytes, default: str = "image/png") -> str:
+    """按数据头（前 16 字节即可）判断图片的 MIME 类型"""
+    for magic, mimetype in _MAGIC_MIMETYPES:
+        if head.startswith(magic):
+            return mimetype
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    return default
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    if img.mode in ("RGBA", "LA", "P"):
+        if img.mode == "P":
+            img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    return img
+
+
+def generate_variants(image_data: bytes, task_dir: str, filename: str) -> List[str]:
+    """
+    生成并写入一张图片的全部尺寸变体
+
+    Args:
+        image_data: 原图数据
+        task_dir: 任务目录
+        filename: 原图文件名（如 0.png）
+
+    Returns:
+        List[str]: 已写入的变体文件名
+    """
+    formats = supported_formats()
+    if not formats:
+        return []
+
+    written: List[str] = []
+    with Image.open(io.BytesIO(image_data)) as src:
+        img = _to_rgb(src)
+        img.load()
+
+    for size, width in VARIANT_WIDTHS.items():
+        resized = img
+        if img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            resized = img.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt in formats:
+            output = io.BytesIO()
+            try:
+                resized.save(output, format=fmt, **_FORMATS[fmt][2])
+            except Exception as e:
+                logger.warning(f"生成图片变体失败: {filename} {size} {fmt}: {e}")
+                continue
+            name = variant_filename(filename, size, fmt)
+            atomic_write_bytes(os.path.join(task_dir, name), output.getvalue())
+            written.append(name)
+
+    return written
+
+
+def accepted_formats(accept_header: str) -> List[str]:
+    """Accept 头中客户端明确支持的变体格式（按优先级排序）"""
+    accept = (accept_header or "").lower()
+    accepted = []
+    for fmt, (_, mimetype, _) in _FORMATS.items():
+        match = re.search(re.escape(mimetype) + r"\s*(;\s*q\s*=\s*([0-9.]+))?", accept)
+        if not match:
+            continue
+        try:
+            if match.group(2) is not None and float(match.group(2)) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.append(fmt)
+    return accepted
+
+
+def choose_size(width: Optional[int]) -> str:
+    """按期望宽度选择尺寸：不小于期望宽度的最小尺寸，未指定时使用 DEFAULT_SIZE"""
+    if not width or width <= 0:
+        return DEFAULT_SIZE
+    for size, max_width in VARIANT_WIDTHS.items():
+        if max_width >= width:
+            return size
+    return next(reversed(VARIANT_WIDTHS))
+
+
+def find_variant(task_dir: str, filename: str, accept_header: str, width: Optional[int]) -> Optional[str]:
+    """
+    查找最适合客户端的已生成变体
+
+    Returns:
+        Optional[str]: 变体文件名；客户端不支持任何变体格式或变体尚未生成时返回 None
+    """
+    size = choose_size(width)
+    for fmt in accepted_formats(accept_header):
+        name = variant_filename(filename, size, fmt)
+        if os.path.isfile(os.path.join(task_dir, name)):
+            return name
+    return None
@@ -6,6 +6,8 @@ import base64
 import requests
 from functools import wraps
 from typing import List, Optional, Union
+from backend.services.adaptive_limiter import retry_after_seconds
+from backend.services.rate_limiter import ProviderRateLimiter, RateLimitTimeout, estimate_tokens, get_provider_rate_limiter
 from .image_compressor import compress_image
 from .url import normalize_openai_base_url
 
@@ -13,20 +15,33 @@ logger = logging.getLogger(__name__)
 
 
 def retry_on_429(max_retries=3, base_delay=2):
-    """429 错误自动重试装饰器"""
+    """
+    429 错误自动重试装饰器
+
+    客户端配置了限流器时不在当前线程 sleep，而是暂停该服务商的配额发放，
+    重试请求（以及同一服务商的其他请求）在限流器中按期限排队。
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
+                except RateLimitTimeout:
+                    raise
                 except Exception as e:
                     error_str = str(e)
                     if "429" in error_str or "rate" in error_str.lower():
                         if attempt < max_retries - 1:
-                            wait_time = (base_delay ** attempt) + random.uniform(0, 1)
+                            wait_time = retry_after_seconds(e)
+                            if wait_time is None:
+                                wait_time = (base_delay ** attempt) + random.uniform(0, 1)
                             logger.warning(f"遇到限流，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
-                            time.sleep(wait_time)
+                            rate_limiter = getattr(args[0], "rate_limiter", None) if args else None
+                            if rate_limiter is not None:
+                                rate_limiter.penalize(wait_time)
+                            else:
+                                time.sleep(wait_time)
                             continue
                     raise
             raise Exception(
@@ -44,8 +59,15 @@ def retry_on_429(max_retries=3, base_delay=2):
 class TextChatClient:
     """Text API 客户端封装类"""
 
-    def __init__(self, api_key: str = None, base_url: str = None, endpoint_type: str = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        base_url: str = None,
+        endpoint_type: str = None,
+        rate_limiter: Optional[ProviderRateLimiter] = None,
+    ):
         self.api_key = api_key
+        self.rate_limiter = rate_limiter
         if not self.api_key:
             raise ValueError(
                 "Text API Key 未配置。\n"
@@ -158,6 +180,14 @@ class TextChatClient:
             "Authorization": f"Bearer {self.api_key}"
         }
 
+        estimated_tokens = estimate_tokens(
+            (system_prompt, prompt),
+            images=len(images or ()),
+            max_output_tokens=max_output_tokens
+        )
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(estimated_tokens)
+
         response = requests.post(
             self.chat_endpoint,
             json=payload,
@@ -237,6 +267,8 @@ class TextChatClient:
                 )
 
         result = response.json()
+        if self.rate_limiter is not None:
+            self.rate_limiter.settle(estimated_tokens, (result.get("usage") or {}).get("total_tokens"))
 
         # 提取生成的文本
         if "choices" in result and len(result["choices"]) > 0:
@@ -253,7 +285,7 @@ class TextChatClient:
             )
 
 
-def get_text_chat_client(provider_config: dict):
+def get_text_chat_client(provider_config: dict, provider_name: str = None):
     """
     获取 Text Chat 客户端实例（根据 type 返回对应客户端）
 
@@ -263,6 +295,8 @@ def get_text_chat_client(provider_config: dict):
             - api_key: API密钥
             - base_url: API基础URL（可选）
             - endpoint_type: 自定义端点路径（可选）
+            - rate_limit: RPM/TPM 配额（可选）
+        provider_name: 服务商名称（同名服务商的客户端共享速率配额）
 
     Returns:
         GenAIClient 或 TextChatClient
@@ -271,9 +305,15 @@ def get_text_chat_client(provider_config: dict):
     api_key = provider_config.get('api_key')
     base_url = provider_config.get('base_url')
     endpoint_type = provider_config.get('endpoint_type')
+    rate_limiter = get_provider_rate_limiter("text", provider_name, provider_config)
 
     if provider_type == 'google_gemini':
         from .genai_client import GenAIClient
-        return GenAIClient(api_key=api_key, base_url=base_url)
+        return GenAIClient(api_key=api_key, base_url=base_url, rate_limiter=rate_limiter)
     else:
-        return TextChatClient(api_key=api_key, base_url=base_url, endpoint_type=endpoint_type)
+        return TextChatClient(
+            api_key=api_key,
+            base_url=base_url,
+            endpoint_type=endpoint_type,
+            rate_limiter=rate_limiter
+        )
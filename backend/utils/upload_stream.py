@@ -0,0 +1,218 @@
+"""
+参考图片流式上传解析
+
+JSON + base64 的上传方式需要先把整个请求体（连同全部 base64 字符串）读入内存再逐张解码，
+单个请求的峰值内存约为负载的 2.3 倍。这里改为直接解析 multipart/form-data 或二进制请求体：
+
+- 上传文件边接收边写入 SpooledTemporaryFile（小文件留在内存，大文件落到临时文件）
+- 写入过程中增量校验：文件数量、单张大小、总大小，以及文件头是否为支持的图片格式，
+  不合规的上传在读完之前就会被拒绝
+- 非文件字段仍由 werkzeug 按 max_form_memory_size 限制读入内存
+"""
+
+import tempfile
+from typing import IO, List, Optional, Tuple
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.formparser import FormDataParser
+
+from backend.config import Config
+from backend.utils.image_variants import mimetype_from_bytes
+
+# 允许上传的参考图片格式
+ALLOWED_IMAGE_MIMETYPES = ("image/png", "image/jpeg", "image/webp", "image/gif")
+
+# 判断格式需要的文件头长度
+_SNIFF_BYTES = 16
+
+# 单个文件留在内存中的上限，超过后写入临时文件
+_SPOOL_MAX_MEMORY = 512 * 1024
+
+# 读取二进制请求体的块大小
+_CHUNK_SIZE = 64 * 1024
+
+# 非文件字段（如 topic、payload JSON）允许的最大字节数
+MAX_FORM_FIELD_BYTES = 2 * 1024 * 1024
+
+
+class UploadedImage:
+    """一张已接收并校验过的上传图片"""
+
+    __slots__ = ("data", "mime_type", "filename")
+
+    def __init__(self, data: bytes, mime_type: str, filename: str = ""):
+        self.data = data
+        self.mime_type = mime_type
+        self.filename = filename
+
+
+class _UploadBudget:
+    """一次请求内所有上传文件共享的数量/总大小预算"""
+
+    def __init__(self, field: str, max_files: int, max_file_bytes: int, max_total_bytes: int):
+        self.field = field
+        self.max_files = max_files
+        self.max_file_bytes = max_file_bytes
+        self.max_total_bytes = max_total_bytes
+        self.files = 0
+        self.total_bytes = 0
+
+    def open_file(self) -> None:
+        self.files += 1
+        if self.files > self.max_files:
+            raise ValueError(f"参数错误：{self.field} 最多允许 {self.max_files} 张图片")
+
+    def consume(self, size: int) -> None:
+        self.total_bytes += size
+        if self.total_bytes > self.max_total_bytes:
+            raise ValueError(f"参数错误：{self.field} 总大小超过限制")
+
+
+class _ValidatingSpool:
+    """写入时增量校验大小和图片格式的临时文件"""
+
+    def __init__(self, budget: _UploadBudget):
+        self._budget = budget
+        self._file: IO[bytes] = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_MEMORY)
+        self._head = b""
+        self.size = 0
+        self.mime_type: Optional[str] = None
+
+    def write(self, data: bytes) -> int:
+        if not data:
+            return 0
+        if self.mime_type is None and len(self._head) < _SNIFF_BYTES:
+            self._head += data[:_SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= _SNIFF_BYTES:
+                self._check_format()
+
+        self.size += len(data)
+        if self.size > self._budget.max_file_bytes:
+            raise ValueError(f"参数错误：{self._budget.field} 中存在过大的图片数据")
+        self._budget.consume(len(data))
+        return self._file.write(data)
+
+    def _check_format(self) -> None:
+        mime_type = mimetype_from_bytes(self._head, default="")
+        if mime_type not in ALLOWED_IMAGE_MIMETYPES:
+            raise ValueError(f"参数错误：{self._budget.field} 中存在不支持的图片格式（仅支持 PNG/JPEG/WebP/GIF）")
+        self.mime_type = mime_type
+
+    def finish(self) -> Optional[bytes]:
+        """校验结束并返回文件内容；空文件返回 None"""
+        if self.size == 0:
+            return None
+        if self.mime_type is None:
+            # 不足 16 字节的文件
+            self._check_format()
+        self._file.seek(0)
+        return self._file.read()
+
+    # FileStorage / werkzeug 需要的文件接口
+    def seek(self, *args) -> int:
+        return self._file.seek(*args)
+
+    def read(self, *args) -> bytes:
+        return self._file.read(*args)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def parse_multipart_images(
+    request,
+    field: str,
+    max_files: Optional[int] = None,
+    max_file_bytes: Optional[int] = None,
+    max_total_bytes: Optional[int] = None,
+) -> Tuple[MultiDict, List[UploadedImage]]:
+    """
+    流式解析 multipart/form-data 请求中的图片文件
+
+    Args:
+        request: Flask 请求对象（请求体尚未被读取）
+        field: 图片文件字段名（其它字段名的文件会被忽略，但同样计入预算）
+        max_files: 最多文件数（默认 Config.MAX_BASE64_IMAGES）
+        max_file_bytes: 单张最大字节数（默认 Config.MAX_BASE64_IMAGE_BYTES）
+        max_total_bytes: 总字节数上限（默认 Config.MAX_BASE64_TOTAL_BYTES）
+
+    Returns:
+        Tuple[MultiDict, List[UploadedImage]]: (非文件字段, 按上传顺序排列的图片)
+
+    Raises:
+        ValueError: 数量/大小/格式不合规，或请求体不是合法的 multipart 数据
+    """
+    budget = _UploadBudget(
+        field,
+        Config.MAX_BASE64_IMAGES if max_files is None else max_files,
+        Config.MAX_BASE64_IMAGE_BYTES if max_file_bytes is None else max_file_bytes,
+        Config.MAX_BASE64_TOTAL_BYTES if max_total_bytes is None else max_total_bytes,
+    )
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        budget.open_file()
+        return _ValidatingSpool(budget)
+
+    parser = FormDataParser(
+        stream_factory=stream_factory,
+        max_form_memory_size=MAX_FORM_FIELD_BYTES,
+        silent=False,
+    )
+    try:
+        _, form, files = parser.parse(
+            request.stream,
+            request.mimetype,
+            request.content_length,
+            request.mimetype_params,
+        )
+    except ValueError as e:
+        if str(e).startswith("参数错误"):
+            raise
+        raise ValueError("参数错误：multipart 请求体格式无效") from e
+
+    images: List[UploadedImage] = []
+    try:
+        for storage in files.getlist(field):
+            spool = storage.stream
+            data = spool.finish()
+            if data:
+                images.append(UploadedImage(data, spool.mime_type, storage.filename or ""))
+    finally:
+        for _, storage in files.items(multi=True):
+            storage.stream.close()
+    return form, images
+
+
+def read_binary_image(
+    request,
+    field: str = "image",
+    max_file_bytes: Optional[int] = None,
+) -> UploadedImage:
+    """
+    流式读取二进制请求体（Content-Type: image/*）中的单张图片
+
+    Raises:
+        ValueError: 请求体为空、过大或不是支持的图片格式
+    """
+    max_file_bytes = Config.MAX_BASE64_IMAGE_BYTES if max_file_bytes is None else max_file_bytes
+    if request.content_length is not None and request.content_length > max_file_bytes:
+        # 声明的长度已超限，无需读取
+        raise ValueError(f"参数错误：{field} 中存在过大的图片数据")
+
+    budget = _UploadBudget(field, 1, max_file_bytes, max_file_bytes)
+    budget.open_file()
+    spool = _ValidatingSpool(budget)
+    try:
+        stream = request.stream
+        while True:
+            chunk = stream.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            spool.write(chunk)
+        data = spool.finish()
+    finally:
+        spool.close()
+
+    if not data:
+        raise ValueError(f"参数错误：{field} 不能为空")
+    return UploadedImage(data, spool.mime_type)
@@ -1,5 +1,5 @@
 import { isAxiosError } from 'axios'
-import { consumeSSE } from './sse'
+import { consumeSSE, type SSEHandlers } from './sse'
 import http, { getAuthToken } from './http'
 
 const API_BASE_URL = '/api'
@@ -26,6 +26,16 @@ export interface ProgressEvent {
   message?: string
 }
 
+export interface QueueEvent {
+  status: 'queued'
+  ahead: number
+  waiting: number
+  queued_tasks: number
+  running: number
+  max_concurrent: number
+  message: string
+}
+
 export interface FinishEvent {
   success: boolean
   task_id: string
@@ -38,11 +48,41 @@ export interface FinishEvent {
   remaining_indices?: number[]
 }
 
-// 生成大纲（支持图片上传）
+// 上传参考图片，返回图片 ID（后续生成大纲/图片时只需传 ID）
+export async function uploadReferenceImages(files: File[]): Promise<string[]> {
+  const formData = new FormData()
+  files.forEach((file) => {
+    formData.append('images', file)
+  })
+  const response = await http.post<{ success: boolean; images?: Array<{ id: string }>; error?: string }>(
+    `${API_BASE_URL}/reference-images`,
+    formData,
+    {
+      headers: {
+        'Content-Type': 'multipart/form-data'
+      }
+    }
+  )
+  if (!response.data.success || !response.data.images) {
+    throw new Error(response.data.error || '上传参考图片失败')
+  }
+  return response.data.images.map((img) => img.id)
+}
+
+// 生成大纲（支持图片上传，或引用已上传的参考图片 ID）
 export async function generateOutline(
   topic: string,
-  images?: File[]
+  images?: File[],
+  imageIds?: string[]
 ): Promise<OutlineResponse & { has_images?: boolean }> {
+  if (imageIds && imageIds.length > 0) {
+    const response = await http.post<OutlineResponse>(`${API_BASE_URL}/outline`, {
+      topic,
+      image_ids: imageIds
+    })
+    return response.data
+  }
+
   // 如果有图片，使用 FormData
   if (images && images.length > 0) {
     const formData = new FormData()
@@ -525,20 +565,30 @@ export async function deleteHistory(recordId: string): Promise<{
 /**
  * 搜索历史记录
  *
- * 根据关键词搜索历史记录标题
+ * 全文检索标题、大纲和生成的文案/标签，结果按相关度排序
  *
  * @param keyword - 搜索关键词
+ * @param page - 页码，从 1 开始
+ * @param pageSize - 每页数量
  *
- * @returns Promise 包含匹配的历史记录列表
+ * @returns Promise 包含当前页匹配的历史记录和分页信息
  */
-export async function searchHistory(keyword: string): Promise<{
+export async function searchHistory(
+  keyword: string,
+  page: number = 1,
+  pageSize: number = 20
+): Promise<{
   success: boolean
   records: HistoryRecord[]
+  total?: number
+  page?: number
+  page_size?: number
+  total_pages?: number
   error?: string
 }> {
   try {
     const response = await http.get(`${API_BASE_URL}/history/search`, {
-      params: { keyword },
+      params: { keyword, page, page_size: pageSize },
       timeout: 10000 // 10秒超时
     })
     return response.data
@@ -602,58 +652,165 @@ export async function generateImagesPost(
   onStreamError: (error: Error) => void,
   userImages?: File[],
   userTopic?: string,
-  styleHint?: string
+  styleHint?: string,
+  userImageIds?: string[],
+  onQueue?: (event: QueueEvent) => void
 ) {
   try {
-    // 将用户图片转换为 base64
-    let userImagesBase64: string[] = []
-    if (userImages && userImages.length > 0) {
-      userImagesBase64 = await Promise.all(
-        userImages.map(file => {
-          return new Promise<string>((resolve, reject) => {
-            const reader = new FileReader()
-            reader.onload = () => resolve(reader.result as string)
-            reader.onerror = reject
-            reader.readAsDataURL(file)
-          })
-        })
-      )
-    }
-
     const token = getAuthToken()
-    const headers: Record<string, string> = {
-      'Content-Type': 'application/json',
-    }
+    const headers: Record<string, string> = {}
     if (token) {
       headers.Authorization = `Bearer ${token}`
     }
 
-    const response = await fetch(`${API_BASE_URL}/generate`, {
-      method: 'POST',
-      headers,
-      body: JSON.stringify({
-        pages,
-        task_id: taskId,
-        full_outline: fullOutline,
-        user_images: userImagesBase64.length > 0 ? userImagesBase64 : undefined,
-        user_topic: userTopic || '',
-        style_hint: styleHint || ''
+    const payload = {
+      pages,
+      task_id: taskId,
+      full_outline: fullOutline,
+      user_topic: userTopic || '',
+      style_hint: styleHint || ''
+    }
+
+    // 参考图片文件直接 multipart 上传（服务端流式解析），不再转 base64
+    const postWithFiles = () => {
+      const formData = new FormData()
+      formData.append('payload', JSON.stringify(payload))
+      userImages?.forEach((file) => {
+        formData.append('user_images', file)
+      })
+      return fetch(`${API_BASE_URL}/generate`, { method: 'POST', headers, body: formData })
+    }
+
+    let response: Response
+    if (userImageIds && userImageIds.length > 0) {
+      response = await fetch(`${API_BASE_URL}/generate`, {
+        method: 'POST',
+        headers: { ...headers, 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ...payload, user_image_ids: userImageIds })
+      })
+      // 已上传的图片过期时改为直接上传文件
+      if (response.status === 400 && userImages && userImages.length > 0) {
+        response = await postWithFiles()
+      }
+    } else if (userImages && userImages.length > 0) {
+      response = await postWithFiles()
+    } else {
+      response = await fetch(`${API_BASE_URL}/generate`, {
+        method: 'POST',
+        headers: { ...headers, 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload)
       })
+    }
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+
+    await consumeTaskStream(response, taskId, {
+      progress: (data: any) => onProgress(data),
+      complete: (data: any) => onComplete(data),
+      error: (data: any) => onError(data),
+      finish: (data: any) => onFinish(data),
+      queue: (data: any) => onQueue?.(data),
     })
+  } catch (error) {
+    onStreamError(error as Error)
+  }
+}
+
+// 事件流中断后重新连接的次数（生成在服务端后台进行，重连不会重复生成）
+const TASK_STREAM_RECONNECT_ATTEMPTS = 3
+
+function openTaskEvents(taskId: string, lastEventId?: string): Promise<Response> {
+  const token = getAuthToken()
+  const headers: Record<string, string> = {}
+  if (token) {
+    headers.Authorization = `Bearer ${token}`
+  }
+  if (lastEventId) {
+    headers['Last-Event-ID'] = lastEventId
+  }
+  return fetch(`${API_BASE_URL}/task/${encodeURIComponent(taskId)}/events`, { headers })
+}
+
+/**
+ * 读取生成任务的事件流；连接在 finish 之前中断时，带 Last-Event-ID 重新连接任务事件流继续读取
+ */
+async function consumeTaskStream(
+  first: Response,
+  taskId: string | null,
+  handlers: SSEHandlers,
+  lastEventId = ''
+) {
+  let finished = false
+  const tracked: SSEHandlers = {
+    ...handlers,
+    finish: (data: any) => {
+      finished = true
+      handlers.finish?.(data)
+    }
+  }
+
+  let response: Response | null = first
+  for (let attempt = 0; ; attempt++) {
+    let failure: unknown = null
+    try {
+      if (!response) {
+        response = await openTaskEvents(taskId!, lastEventId)
+        if (!response.ok) {
+          throw new Error(`HTTP error! status: ${response.status}`)
+        }
+      }
+      await consumeSSE(response, tracked, (id) => {
+        lastEventId = id
+      })
+    } catch (error) {
+      failure = error
+    }
+
+    if (finished || (!failure && !taskId)) return
+    if (!taskId || attempt >= TASK_STREAM_RECONNECT_ATTEMPTS) {
+      throw failure || new Error('与服务器的连接已断开，生成仍在后台进行，可刷新页面查看进度')
+    }
+    response = null
+    await new Promise((resolve) => setTimeout(resolve, 1000 * (attempt + 1)))
+  }
+}
 
+/**
+ * 重新连接任务的事件流（页面刷新或断线后继续查看进度，不会重复提交生成）
+ *
+ * @returns 是否已连接；服务端没有该任务（未持久化或已过期）时返回 false，调用方可改为重新提交生成
+ */
+export async function followTaskEvents(
+  taskId: string,
+  onProgress: (event: ProgressEvent) => void,
+  onComplete: (event: ProgressEvent) => void,
+  onError: (event: ProgressEvent) => void,
+  onFinish: (event: FinishEvent) => void,
+  onStreamError: (error: Error) => void,
+  onQueue?: (event: QueueEvent) => void
+): Promise<boolean> {
+  try {
+    const response = await openTaskEvents(taskId)
+    if (response.status === 404) {
+      return false
+    }
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`)
     }
 
-    await consumeSSE(response, {
+    await consumeTaskStream(response, taskId, {
       progress: (data: any) => onProgress(data),
       complete: (data: any) => onComplete(data),
       error: (data: any) => onError(data),
       finish: (data: any) => onFinish(data),
+      queue: (data: any) => onQueue?.(data),
     })
   } catch (error) {
     onStreamError(error as Error)
   }
+  return true
 }
 
 export async function cancelTask(taskId: string): Promise<{ success: boolean; task_id?: string; error?: string }> {
@@ -669,17 +826,22 @@ export async function cancelTask(taskId: string): Promise<{ success: boolean; ta
   }
 }
 
-// 扫描所有任务并同步图片列表
-export async function scanAllTasks(): Promise<{
+// 扫描所有任务并同步图片列表（incremental 为 true 时跳过未变化的任务目录）
+export async function scanAllTasks(incremental = false): Promise<{
   success: boolean
+  incremental?: boolean
   total_tasks?: number
+  scanned?: number
+  skipped?: number
   synced?: number
+  updated?: number
+  elapsed_ms?: number
   failed?: number
   orphan_tasks?: string[]
   results?: any[]
   error?: string
 }> {
-  const response = await http.post(`${API_BASE_URL}/history/scan-all`)
+  const response = await http.post(`${API_BASE_URL}/history/scan-all`, { incremental })
   return response.data
 }
 
@@ -777,6 +939,17 @@ export interface AdminHealthResponse {
     image: { active_provider?: string; type?: string; model?: string; base_url?: string }
   }
   probes?: Record<string, any>
+  thumbnail_pool?: {
+    workers: number
+    max_queue: number
+    pending: number
+    queued: number
+    submitted: number
+    completed: number
+    superseded: number
+    failed: number
+    inline: number
+  }
   error?: string
 }
 
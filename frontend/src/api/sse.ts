@@ -7,8 +7,13 @@ export type SSEHandlers = Record<string, (data: any) => void>
  * - multi-line `data:` (joined with '\n')
  * - chunk boundaries splitting lines/events
  * - optional `event:` type (defaults to 'message')
+ * - optional `id:` (reported through onEventId after the event is handled, for Last-Event-ID resumption)
  */
-export async function consumeSSE(response: Response, handlers: SSEHandlers) {
+export async function consumeSSE(
+  response: Response,
+  handlers: SSEHandlers,
+  onEventId?: (id: string) => void
+) {
   const reader = response.body?.getReader()
   if (!reader) throw new Error('无法读取响应流')
 
@@ -17,10 +22,12 @@ export async function consumeSSE(response: Response, handlers: SSEHandlers) {
   let buffer = ''
   let eventType = 'message'
   let dataLines: string[] = []
+  let eventId: string | null = null
 
   const dispatch = () => {
     if (dataLines.length === 0) {
       eventType = 'message'
+      eventId = null
       return
     }
 
@@ -36,8 +43,10 @@ export async function consumeSSE(response: Response, handlers: SSEHandlers) {
 
     const handler = handlers[eventType] || handlers['message']
     if (handler) handler(data)
+    if (eventId !== null) onEventId?.(eventId)
 
     eventType = 'message'
+    eventId = null
   }
 
   const handleLine = (line: string) => {
@@ -54,6 +63,11 @@ export async function consumeSSE(response: Response, handlers: SSEHandlers) {
       return
     }
 
+    if (line.startsWith('id:')) {
+      eventId = line.slice('id:'.length).trim()
+      return
+    }
+
     if (line.startsWith('data:')) {
       // Keep spaces after "data:" per SSE spec
       const v = line.slice('data:'.length)
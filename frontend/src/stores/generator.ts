@@ -73,6 +73,9 @@ export interface GeneratorState {
   // 用户上传的参考图片（File对象，不会被持久化）
   userImages: File[]
 
+  // 参考图片在服务端登记后的 ID（生成图片时优先传 ID，不重复上传）
+  userImageIds: string[]
+
   // 生成的内容数据（标题、文案、标签）
   content: GeneratedContent
 
@@ -121,6 +124,13 @@ function saveState(state: GeneratorState) {
   }
 }
 
+// 图片 URL 缓存破坏：后端返回的 URL 已带版本号 v（可长期缓存），否则追加时间戳避免命中旧图/旧的 404
+function withCacheBuster(url: string): string {
+  if (/[?&]v=/.test(url)) return url
+  const sep = url.includes('?') ? '&' : '?'
+  return `${url}${sep}t=${Date.now()}`
+}
+
 export const useGeneratorStore = defineStore('generator', {
   state: (): GeneratorState => {
     const saved = loadState()
@@ -158,6 +168,7 @@ export const useGeneratorStore = defineStore('generator', {
 
       // 用户上传的参考图片（不从 localStorage 恢复）
       userImages: [],
+      userImageIds: [],
 
       // 生成的内容数据
       content: saved.content || {
@@ -325,10 +336,7 @@ export const useGeneratorStore = defineStore('generator', {
       if (image) {
         image.status = status
         if (url) {
-          // Add a cache-busting param so the browser refetches even after a previous 404.
-          const timestamp = Date.now()
-          const sep = url.includes('?') ? '&' : '?'
-          image.url = `${url}${sep}t=${timestamp}`
+          image.url = withCacheBuster(url)
         }
         if (error) image.error = error
       }
@@ -343,9 +351,7 @@ export const useGeneratorStore = defineStore('generator', {
     updateImage(index: number, newUrl: string) {
       const image = this.images.find(img => img.index === index)
       if (image) {
-        // 添加时间戳避免缓存
-        const timestamp = Date.now()
-        image.url = `${newUrl}?t=${timestamp}`
+        image.url = withCacheBuster(newUrl)
         image.status = 'done'
         delete image.error
       }
@@ -438,6 +444,7 @@ export const useGeneratorStore = defineStore('generator', {
 
       // 清空用户上传的参考图片
       this.userImages = []
+      this.userImageIds = []
 
       // 重置生成的内容数据
       this.content = {
@@ -0,0 +1,128 @@
+"""
+compress_image benchmark.
+
+Compares the current compress_image (binary search on quality + scale estimate)
+with the previous linear search (quality -5 per step, then 10% downscale per pass)
+on synthetic PNGs of the size our image providers typically return (1-8 MB).
+
+Reports JPEG encode counts, wall time and output size for the targets we use
+(50 KB thumbnails, 200 KB reference images).
+
+Usage:
+  cd RedInk
+  python scripts/bench_compress_image.py
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+from PIL import Image, ImageFilter
+
+
+def _legacy_compress(image_data: bytes, max_size_kb: int, counter: List[int],
+                     quality_start: int = 85, quality_min: int = 20, max_dimension: int = 2048) -> bytes:
+    """Previous implementation, kept here for comparison only."""
+    max_size_bytes = max_size_kb * 1024
+    if len(image_data) <= max_size_bytes:
+        return image_data
+
+    img = Image.open(io.BytesIO(image_data)).convert("RGB")
+    width, height = img.size
+    if width > max_dimension or height > max_dimension:
+        ratio = min(max_dimension / width, max_dimension / height)
+        img = img.resize((int(width * ratio), int(height * ratio)), Image.Resampling.LANCZOS)
+
+    quality = quality_start
+    compressed_data = b""
+    while quality >= quality_min:
+        output = io.BytesIO()
+        img.save(output, format="JPEG", quality=quality, optimize=True)
+        counter[0] += 1
+        compressed_data = output.getvalue()
+        if len(compressed_data) <= max_size_bytes:
+            break
+        quality -= 5
+
+    if len(compressed_data) > max_size_bytes:
+        width, height = img.size
+        while len(compressed_data) > max_size_bytes and max(width, height) > 512:
+            width = int(width * 0.9)
+            height = int(height * 0.9)
+            output = io.BytesIO()
+            img.resize((width, height), Image.Resampling.LANCZOS).save(
+                output, format="JPEG", quality=quality_min, optimize=True
+            )
+            counter[0] += 1
+            compressed_data = output.getvalue()
+    return compressed_data
+
+
+def _make_png(width: int, height: int, noise: float) -> bytes:
+    """Gradient + blurred noise: compresses like a generated illustration."""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    base = Image.merge("RGB", (gradient, gradient.rotate(90).resize((width, height)), gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+    grain = Image.effect_noise((width, height), noise).filter(ImageFilter.GaussianBlur(0.6)).convert("RGB")
+    img = Image.blend(base, grain, 0.35)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _run(fn: Callable[[], bytes], repeat: int) -> Tuple[float, bytes]:
+    best = float("inf")
+    result = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main() -> int:
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+
+    import backend.utils.image_compressor as ic
+
+    encode_calls = [0]
+    original_encode = ic._encode_jpeg
+
+    def counting_encode(img, quality):
+        encode_calls[0] += 1
+        return original_encode(img, quality)
+
+    ic._encode_jpeg = counting_encode
+
+    samples: Dict[str, bytes] = {
+        "1024x1536 low-noise": _make_png(1024, 1536, 24),
+        "1024x1536 high-noise": _make_png(1024, 1536, 96),
+        "2048x2048 high-noise": _make_png(2048, 2048, 96),
+    }
+
+    print(f"{'image':<24}{'png':>8}{'target':>8} | {'old enc':>7}{'old ms':>9}{'old kb':>8} | {'new enc':>7}{'new ms':>9}{'new kb':>8}")
+    for name, data in samples.items():
+        for target_kb in (50, 200):
+            legacy_calls = [0]
+            old_time, old_out = _run(lambda: _legacy_compress(data, target_kb, legacy_calls), repeat=1)
+
+            encode_calls[0] = 0
+            new_time, new_out = _run(lambda: ic.compress_image(data, max_size_kb=target_kb), repeat=1)
+
+            print(
+                f"{name:<24}{len(data) / 1048576:>7.1f}M{target_kb:>7}K | "
+                f"{legacy_calls[0]:>7}{old_time * 1000:>9.0f}{len(old_out) / 1024:>8.1f} | "
+                f"{encode_calls[0]:>7}{new_time * 1000:>9.0f}{len(new_out) / 1024:>8.1f}"
+            )
+
+    ic._encode_jpeg = original_encode
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
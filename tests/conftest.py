@@ -10,6 +10,26 @@ import shutil
 # 添加项目根目录到 Python 路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# 测试中反复 create_app，不接管任务库中未完成的任务
+os.environ.setdefault("REDINK_RESUME_JOBS", "0")
+
+# 测试不读写项目的 history/ 目录：任务库和默认历史记录服务都放在会话临时目录
+_SESSION_DIR = tempfile.mkdtemp(prefix="redink-tests-")
+os.environ.setdefault("REDINK_JOB_STORE_PATH", os.path.join(_SESSION_DIR, "jobs.db"))
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _session_history_service():
+    """create_app 的路由通过 get_history_service() 取到的是临时目录上的服务"""
+    import backend.services.history as history_module
+    import backend.services.job_store as job_store_module
+    history_module._service_instance = history_module.HistoryService(os.path.join(_SESSION_DIR, "history"))
+    yield
+    history_module._service_instance.flush()
+    if job_store_module._store_instance is not None:
+        job_store_module._store_instance.close()
+    shutil.rmtree(_SESSION_DIR, ignore_errors=True)
+
 
 @pytest.fixture
 def app():
@@ -38,11 +58,7 @@ def temp_history_dir():
 def history_service(temp_history_dir):
     """Create a HistoryService that writes to a temp directory."""
     from backend.services.history import HistoryService
-    service = HistoryService()
-    service.history_dir = temp_history_dir
-    service.index_file = os.path.join(temp_history_dir, "index.json")
-    service._init_index()
-    return service
+    return HistoryService(temp_history_dir)
 
 
 @pytest.fixture
@@ -0,0 +1,128 @@
+import time
+from email.utils import formatdate
+
+from backend.generators.base import ProviderHTTPError
+from backend.services.adaptive_limiter import (
+    AdaptiveLimiter,
+    is_throttle_error,
+    parse_retry_after,
+    retry_after_seconds,
+)
+from backend.services.generation_scheduler import GenerationScheduler
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_limiter_grows_while_healthy_and_halves_on_throttle():
+    clock = _Clock()
+    limiter = AdaptiveLimiter(max_limit=8, initial_limit=2, enabled=True, clock=clock)
+
+    def call(latency):
+        started = clock.now
+        clock.now += latency
+        limiter.on_success(started)
+
+    for _ in range(2 + 3 + 4):
+        call(1.0)
+    assert limiter.limit == 5
+
+    # 明显变慢的调用不计入连续成功
+    for _ in range(10):
+        call(5.0)
+    assert limiter.limit == 5
+
+    # 同一批并发中的多个 429 只减半一次
+    started = clock.now
+    clock.now += 1
+    limiter.on_throttle(started, retry_after=10)
+    limiter.on_throttle(started)
+    assert limiter.limit == 2
+    assert limiter.blocked_for() == 10
+    clock.now += 10
+    assert limiter.blocked_for() == 0
+
+    limiter.on_throttle(clock.now)
+    assert limiter.limit == 1
+    assert limiter.snapshot()["throttled"] == 3
+
+
+def test_throttle_detection_and_retry_after():
+    http_date = formatdate(time.time() + 30, usegmt=True)
+    assert 25 < parse_retry_after(http_date) <= 30
+    assert parse_retry_after("7") == 7
+    assert parse_retry_after("soon") is None
+
+    error = ProviderHTTPError("⏳ API 配额或速率限制", 429, "12")
+    assert is_throttle_error(error) and retry_after_seconds(error) == 12
+    assert not is_throttle_error(ProviderHTTPError("❌ API Key 认证失败", 401))
+
+    class _GenAIError(Exception):
+        code = 503
+
+        class response:
+            headers = {"Retry-After": "3"}
+
+    assert is_throttle_error(_GenAIError()) and retry_after_seconds(_GenAIError()) == 3
+    assert is_throttle_error(Exception("429 RESOURCE_EXHAUSTED"))
+    assert not is_throttle_error(Exception("下载图片超时"))
+
+
+def test_scheduler_backs_off_provider_on_throttle():
+    scheduler = GenerationScheduler(max_concurrent=4)
+    scheduler.set_provider_limit("p", 4)
+    try:
+        assert scheduler.provider_limit("p") == 4
+
+        scheduler.record_result("p", time.monotonic(), ProviderHTTPError("限流", 429, "0.3"))
+        stats = scheduler.stats()["providers"]["p"]
+        assert stats["limit"] == 2 and stats["blocked_for"] > 0
+
+        # Retry-After 期间不派发，到期后自动继续
+        started = time.monotonic()
+        assert scheduler.submit("t", "p", time.monotonic).result(5) - started >= 0.25
+
+        # 其他服务商不受影响
+        assert scheduler.submit("t", "q", lambda: "ok").result(5) == "ok"
+        assert scheduler.provider_limit("p") == 2
+    finally:
+        scheduler.shutdown()
+
+
+def test_generation_reports_results_to_scheduler(tmp_path):
+    from backend.services.image import ImageService
+
+    recorded = []
+
+    class _Scheduler:
+        def record_result(self, provider, started, error=None):
+            recorded.append((provider, error))
+
+    service = ImageService.__new__(ImageService)
+    service.provider_name = "fake"
+    service.provider_config = {"type": "image_api"}
+    service.scheduler = _Scheduler()
+    service.use_short_prompt = True
+    service.prompt_template_short = "{page_type}: {page_content}"
+    service._save_image = lambda data, filename, task_dir: filename
+
+    throttled = ProviderHTTPError("⏳ API 配额或速率限制", 429)
+    outcomes = iter([throttled, b"png"])
+
+    class _Generator:
+        def generate_image(self, **kwargs):
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+    service.generator = _Generator()
+    page = {"index": 0, "type": "content", "content": "a"}
+    assert service._generate_single_image(page, "t", str(tmp_path))[1] is False
+    assert service._generate_single_image(page, "t", str(tmp_path))[1] is True
+    assert recorded == [("fake", throttled), ("fake", None)]
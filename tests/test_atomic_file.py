@@ -0,0 +1,31 @@
+import os
+import stat
+
+import pytest
+
+from backend.utils.atomic_file import atomic_write_bytes, atomic_write_json
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX file modes")
+def test_new_file_gets_umask_default_mode(tmp_path):
+    old_umask = os.umask(0o022)
+    os.umask(old_umask)
+    path = tmp_path / "record.json"
+
+    atomic_write_json(str(path), {"title": "标题"})
+
+    assert stat.S_IMODE(path.stat().st_mode) == 0o666 & ~old_umask
+    assert path.read_text(encoding="utf-8").count("标题") == 1
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX file modes")
+def test_replace_keeps_existing_mode(tmp_path):
+    path = tmp_path / "0.png"
+    path.write_bytes(b"old")
+    os.chmod(path, 0o640)
+
+    atomic_write_bytes(str(path), b"new")
+
+    assert path.read_bytes() == b"new"
+    assert stat.S_IMODE(path.stat().st_mode) == 0o640
+    assert os.listdir(tmp_path) == ["0.png"]
@@ -0,0 +1,97 @@
+import os
+import time
+
+import backend.services.dir_size_cache as dsc
+from backend.services.dir_size_cache import DirSizeCache
+
+
+def _write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+
+
+def _count_scans(monkeypatch):
+    scans = []
+    original = dsc.scan_dir_size
+
+    def counting(path):
+        scans.append(os.path.basename(path))
+        return original(path)
+
+    monkeypatch.setattr(dsc, "scan_dir_size", counting)
+    return scans
+
+
+def test_unchanged_dirs_are_not_rescanned(tmp_path, monkeypatch):
+    _write(str(tmp_path / "task_a" / "0.png"), 100)
+    _write(str(tmp_path / "task_b" / "0.png"), 50)
+    _write(str(tmp_path / "task_b" / "nested" / "1.png"), 25)
+    scans = _count_scans(monkeypatch)
+
+    cache = DirSizeCache(str(tmp_path))
+    first = {d["task_id"]: d["bytes"] for d in cache.snapshot()}
+    assert first == {"task_a": 100, "task_b": 75}
+    assert sorted(scans) == ["task_a", "task_b"]
+
+    scans.clear()
+    cache.snapshot()
+    assert scans == []
+
+
+def test_new_files_and_nested_changes_invalidate(tmp_path, monkeypatch):
+    _write(str(tmp_path / "task_a" / "0.png"), 100)
+    _write(str(tmp_path / "task_a" / "sub" / "x.png"), 10)
+    cache = DirSizeCache(str(tmp_path))
+    cache.snapshot()
+
+    # Ensure a distinct mtime even on coarse-grained filesystems.
+    time.sleep(0.01)
+    _write(str(tmp_path / "task_a" / "sub" / "y.png"), 5)
+
+    assert cache.get("task_a")["bytes"] == 115
+
+
+def test_invalidate_after_in_place_overwrite(tmp_path):
+    path = str(tmp_path / "task_a" / "0.png")
+    _write(path, 100)
+    cache = DirSizeCache(str(tmp_path))
+    assert cache.get("task_a")["bytes"] == 100
+
+    # Overwriting an existing file leaves the directory mtime untouched.
+    _write(path, 300)
+    cache.invalidate("task_a")
+
+    assert cache.get("task_a")["bytes"] == 300
+
+
+def test_cache_persists_and_prunes_deleted_dirs(tmp_path, monkeypatch):
+    _write(str(tmp_path / "task_a" / "0.png"), 100)
+    _write(str(tmp_path / "task_b" / "0.png"), 100)
+    DirSizeCache(str(tmp_path)).snapshot()
+
+    scans = _count_scans(monkeypatch)
+    reopened = DirSizeCache(str(tmp_path))
+    assert len(reopened.snapshot()) == 2
+    assert scans == []
+
+    import shutil
+    shutil.rmtree(str(tmp_path / "task_b"))
+    assert [d["task_id"] for d in reopened.snapshot()] == ["task_a"]
+    assert "task_b" not in DirSizeCache(str(tmp_path))._entries
+
+
+def test_background_refresh_warms_cache(tmp_path):
+    _write(str(tmp_path / "task_a" / "0.png"), 42)
+    cache = DirSizeCache(str(tmp_path))
+    assert cache.start_background_refresh(interval=0.01) is True
+    try:
+        deadline = time.time() + 5
+        while "task_a" not in cache._entries:
+            assert time.time() < deadline
+            time.sleep(0.01)
+    finally:
+        cache.stop_background_refresh()
+
+    assert cache._entries["task_a"]["bytes"] == 42
+    assert cache.start_background_refresh(interval=0) is False
@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from backend.services.generation_scheduler import GenerationScheduler
+
+
+@pytest.fixture
+def scheduler():
+    s = GenerationScheduler(max_concurrent=2)
+    yield s
+    s.shutdown()
+
+
+def _blocking_job(gate, running, peak, lock, result=None):
+    def job():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        gate.wait(5)
+        with lock:
+            running[0] -= 1
+        return result
+    return job
+
+
+def test_global_and_provider_limits(scheduler):
+    gate = threading.Event()
+    running, peak, lock = [0], [0], threading.Lock()
+    scheduler.set_provider_limit("slow", 1)
+
+    futures = [scheduler.submit(f"task{i}", "slow", _blocking_job(gate, running, peak, lock, i)) for i in range(4)]
+    time.sleep(0.1)
+    assert peak[0] == 1
+    provider_stats = scheduler.stats()["providers"]["slow"]
+    assert (provider_stats["running"], provider_stats["limit"], provider_stats["max_limit"]) == (1, 1, 1)
+
+    gate.set()
+    assert [f.result(5) for f in futures] == [0, 1, 2, 3]
+
+    scheduler.set_provider_limit("slow", None)
+    gate.clear()
+    running[0] = peak[0] = 0
+    futures = [scheduler.submit("task", "slow", _blocking_job(gate, running, peak, lock)) for _ in range(5)]
+    time.sleep(0.1)
+    assert peak[0] == 2
+    gate.set()
+    for f in futures:
+        f.result(5)
+
+
+def test_round_robin_across_tasks():
+    scheduler = GenerationScheduler(max_concurrent=1)
+    gate = threading.Event()
+    order = []
+    try:
+        blocker = scheduler.submit("blocker", "p", lambda: gate.wait(5))
+        time.sleep(0.05)
+        futures = [scheduler.submit("big", "p", lambda i=i: order.append(f"big{i}")) for i in range(3)]
+        futures += [scheduler.submit("small", "p", lambda: order.append("small0"))]
+
+        position = scheduler.queue_position("small")
+        assert position["ahead"] == 1 and position["waiting"] == 1
+        assert scheduler.queue_position("blocker") is None
+
+        gate.set()
+        blocker.result(5)
+        for f in futures:
+            f.result(5)
+        # 小任务不必等大任务全部完成
+        assert order == ["big0", "small0", "big1", "big2"]
+    finally:
+        scheduler.shutdown()
+
+
+def test_task_limit_and_cancel_task():
+    scheduler = GenerationScheduler(max_concurrent=3)
+    gate = threading.Event()
+    running, peak, lock = [0], [0], threading.Lock()
+    try:
+        futures = [
+            scheduler.submit("t", "p", _blocking_job(gate, running, peak, lock), task_limit=1)
+            for _ in range(3)
+        ]
+        time.sleep(0.1)
+        assert peak[0] == 1
+
+        assert scheduler.cancel_task("t") == 2
+        gate.set()
+        futures[0].result(5)
+        assert all(f.cancelled() for f in futures[1:])
+        assert scheduler.stats()["cancelled"] == 2
+    finally:
+        scheduler.shutdown()
+
+
+def test_generate_images_emits_queue_events(tmp_path):
+    from backend.services.image import ImageService
+
+    scheduler = GenerationScheduler(max_concurrent=1)
+    service = ImageService.__new__(ImageService)
+    service.history_root_dir = str(tmp_path)
+    service._task_states = {}
+    service._task_states_lock = threading.Lock()
+    service.provider_name = "fake"
+    service.provider_config = {"high_concurrency": True}
+    service.scheduler = scheduler
+    service.QUEUE_EVENT_INTERVAL = 0.01
+
+    def fake_generate(page, task_id, task_dir, *args):
+        filename = f"{page['index']}.png"
+        with open(f"{task_dir}/{filename}", "wb") as f:
+            f.write(b"png")
+        return page["index"], True, filename, None
+
+    service._generate_single_image = fake_generate
+    service._write_thumbnails = lambda *a, **k: None
+
+    gate = threading.Event()
+    try:
+        blocker = scheduler.submit("other", "fake", lambda: gate.wait(5))
+        pages = [{"index": 0, "type": "content", "content": "a"}, {"index": 1, "type": "content", "content": "b"}]
+        events = []
+        for event in service.generate_images(pages, "task_queue"):
+            events.append(event)
+            if event["event"] == "queue":
+                gate.set()
+        blocker.result(5)
+    finally:
+        gate.set()
+        scheduler.shutdown()
+
+    queue_events = [e for e in events if e["event"] == "queue"]
+    assert queue_events and queue_events[0]["data"]["status"] == "queued"
+    assert events[-1]["event"] == "finish"
+    assert events[-1]["data"]["images"] == ["0.png", "1.png"]
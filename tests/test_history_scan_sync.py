@@ -60,3 +60,110 @@ def test_scan_and_sync_rejects_unsafe_task_id(history_service):
     assert result["success"] is False
     assert "路径不安全" in result["error"]
 
+
+
+def test_scan_all_reads_each_record_once(history_service, sample_outline, temp_history_dir, monkeypatch):
+    # Several records; only one task dir has images.
+    for i in range(5):
+        history_service.create_record(f"Other {i}", sample_outline, task_id=f"task_other{i}")
+    record_id = history_service.create_record("Target", sample_outline, task_id="task_target")
+    _touch(os.path.join(temp_history_dir, "task_target", "0.png"))
+
+    reads = []
+    original_get_record = history_service.get_record
+
+    def counting_get_record(rid):
+        reads.append(rid)
+        return original_get_record(rid)
+
+    monkeypatch.setattr(history_service, "get_record", counting_get_record)
+
+    result = history_service.scan_all_tasks()
+    assert result["success"] is True
+    assert result["synced"] == 1
+    assert reads == [record_id]
+    assert history_service.get_record(record_id)["thumbnail"] == "0.png"
+
+
+def test_task_index_follows_record_updates(history_service, sample_outline, temp_history_dir):
+    record_id = history_service.create_record("Moved", sample_outline, task_id="task_before")
+    history_service.update_record(record_id, images={"task_id": "task_after", "generated": []})
+    _touch(os.path.join(temp_history_dir, "task_before", "0.png"))
+    _touch(os.path.join(temp_history_dir, "task_after", "0.png"))
+
+    assert history_service.scan_and_sync_task_images("task_before").get("no_record") is True
+    assert history_service.scan_and_sync_task_images("task_after")["record_id"] == record_id
+
+    history_service.delete_record(record_id)
+    assert history_service._store.find_by_task_id("task_after") is None
+
+
+def test_incremental_scan_skips_unchanged_task_dirs(history_service, sample_outline, temp_history_dir):
+    task_id = "task_incremental"
+    history_service.create_record("Incremental", sample_outline, task_id=task_id)
+    task_dir = os.path.join(temp_history_dir, task_id)
+    _touch(os.path.join(task_dir, "0.png"))
+
+    first = history_service.scan_all_tasks(incremental=True)
+    assert first["success"] is True
+    assert first["scanned"] == 1
+    assert first["updated"] == 1
+
+    second = history_service.scan_all_tasks(incremental=True)
+    assert second["scanned"] == 0
+    assert second["skipped"] == 1
+    assert second["updated"] == 0
+
+    # 新增图片后目录水位线变化，需要重新扫描
+    _touch(os.path.join(task_dir, "1.png"))
+    third = history_service.scan_all_tasks(incremental=True)
+    assert third["scanned"] == 1
+    assert third["updated"] == 1
+
+
+def test_full_scan_does_not_rewrite_unchanged_record(history_service, sample_outline, temp_history_dir, monkeypatch):
+    task_id = "task_unchanged"
+    record_id = history_service.create_record("Unchanged", sample_outline, task_id=task_id)
+    _touch(os.path.join(temp_history_dir, task_id, "0.png"))
+
+    assert history_service.scan_all_tasks()["updated"] == 1
+
+    writes = []
+    original = history_service._apply_record_update
+
+    def counting_update(*args, **kwargs):
+        writes.append(args[0] if args else kwargs.get("record_id"))
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(history_service, "_apply_record_update", counting_update)
+    result = history_service.scan_all_tasks()
+    assert result["synced"] == 1
+    assert result["updated"] == 0
+    assert writes == []
+    assert history_service.get_record(record_id)["images"]["generated"][0] == "0.png"
+
+
+def test_scan_all_flushes_index_once_around_scan(history_service, sample_outline, temp_history_dir, monkeypatch):
+    record_ids = []
+    for i in range(4):
+        task_id = f"task_flush{i}"
+        record_ids.append(history_service.create_record(f"Flush {i}", sample_outline, task_id=task_id))
+        _touch(os.path.join(temp_history_dir, task_id, "0.png"))
+
+    flushes = []
+    original_flush = history_service.flush
+
+    def counting_flush():
+        flushes.append(1)
+        return original_flush()
+
+    monkeypatch.setattr(history_service, "flush", counting_flush)
+    result = history_service.scan_all_tasks(incremental=True)
+    assert result["updated"] == 4
+    # 扫描前后各一次，而不是每个目录一次
+    assert len(flushes) == 2
+
+    # 扫描中合并的索引更新已写入，水位线与索引一致，下次增量扫描全部跳过
+    for record_id in record_ids:
+        assert history_service._store.get(record_id)["thumbnail"] == "0.png"
+    assert history_service.scan_all_tasks(incremental=True)["skipped"] == 4
@@ -12,14 +12,10 @@ import pytest
 from backend.services.history import HistoryService, RecordStatus
 
 
-@pytest.fixture
-def history_service(temp_history_dir):
-    """Create a HistoryService that writes to a temp directory."""
-    service = HistoryService()
-    service.history_dir = temp_history_dir
-    service.index_file = os.path.join(temp_history_dir, "index.json")
-    service._init_index()
-    return service
+@pytest.fixture(params=["sqlite", "json"])
+def history_service(request, temp_history_dir):
+    """Create a HistoryService that writes to a temp directory, for each index backend."""
+    return HistoryService(temp_history_dir, store_backend=request.param)
 
 
 @pytest.fixture
@@ -256,6 +252,66 @@ class TestListRecords:
         assert result["records"] == []
 
 
+# ---------- list_records_after (cursor pagination) ----------
+
+class TestCursorPagination:
+    def test_cursor_walk_returns_every_record_once(self, history_service, sample_outline):
+        """Walking next_cursor visits all records newest first, even with inserts mid-walk."""
+        ids = [history_service.create_record(f"Record {i}", sample_outline) for i in range(5)]
+
+        first = history_service.list_records_after(limit=2)
+        assert first["has_more"] is True
+        seen = [r["id"] for r in first["records"]]
+
+        # A record created while paging sorts before the cursor and must not shift later pages.
+        history_service.create_record("Late arrival", sample_outline)
+
+        cursor = first["next_cursor"]
+        while cursor:
+            page = history_service.list_records_after(cursor=cursor, limit=2)
+            seen.extend(r["id"] for r in page["records"])
+            cursor = page["next_cursor"]
+
+        assert sorted(seen) == sorted(ids)
+        assert len(seen) == len(set(seen))
+
+    def test_cursor_sort_by_updated_at_with_status_filter(self, history_service, sample_outline):
+        """Sorting by updated_at ascending honours the status filter."""
+        a = history_service.create_record("A", sample_outline)
+        b = history_service.create_record("B", sample_outline)
+        c = history_service.create_record("C", sample_outline)
+        history_service.update_record(b, status=RecordStatus.COMPLETED)
+        history_service.update_record(a, status=RecordStatus.COMPLETED)
+        history_service.update_record(c, status=RecordStatus.ERROR)
+
+        first = history_service.list_records_after(limit=1, status=RecordStatus.COMPLETED,
+                                                   sort="updated_at", order="asc")
+        second = history_service.list_records_after(cursor=first["next_cursor"], limit=1,
+                                                    status=RecordStatus.COMPLETED, sort="updated_at", order="asc")
+
+        assert [r["id"] for r in first["records"] + second["records"]] == [b, a]
+        assert second["has_more"] is False
+        assert second["next_cursor"] is None
+
+    def test_list_records_sort_order(self, history_service, sample_outline):
+        """Page-based listing accepts sort and order."""
+        a = history_service.create_record("A", sample_outline)
+        b = history_service.create_record("B", sample_outline)
+        history_service.update_record(a, status=RecordStatus.PARTIAL)
+
+        result = history_service.list_records(sort="updated_at", order="desc")
+        assert [r["id"] for r in result["records"]] == [a, b]
+
+    def test_invalid_sort_and_cursor_are_rejected(self, history_service):
+        with pytest.raises(ValueError):
+            history_service.list_records_after(sort="title")
+        with pytest.raises(ValueError):
+            history_service.list_records_after(cursor="not-a-cursor")
+        cursor = history_service._encode_cursor("created_at", "desc", {"created_at": "x", "id": "y"})
+        with pytest.raises(ValueError):
+            history_service.list_records_after(cursor=cursor, sort="updated_at")
+
+
 # ---------- search_records ----------
 
 class TestSearchRecords:
@@ -288,6 +344,55 @@ class TestSearchRecords:
 
         assert results == []
 
+    def test_search_covers_outline_and_generated_content(self, history_service):
+        """Outline text, copywriting and tags are searchable, not just titles."""
+        outline = {"raw": "深秋的枫叶", "pages": [{"index": 0, "type": "cover", "content": "Maple leaves in autumn"}]}
+        record_id = history_service.create_record("旅行笔记", outline)
+        history_service.update_record(record_id, content={"titles": ["周末出游"], "copywriting": "拍照攻略", "tags": ["摄影"]})
+
+        for keyword in ("枫叶", "maple", "出游", "攻略", "摄影", "秋"):
+            assert [r["id"] for r in history_service.search_records(keyword)] == [record_id], keyword
+        assert history_service.search_records("叶枫") == []
+
+    def test_search_matches_word_prefixes_and_all_terms(self, history_service, sample_outline):
+        """Latin words match by prefix; every query term must match."""
+        history_service.create_record("Autumn Fashion Guide", sample_outline)
+        history_service.create_record("Autumn recipes", sample_outline)
+
+        assert len(history_service.search_records("aut")) == 2
+        assert [r["title"] for r in history_service.search_records("autumn fash")] == ["Autumn Fashion Guide"]
+
+    def test_search_ranks_title_matches_first(self, history_service):
+        """A title hit ranks above a body-only hit even if the body hit is newer."""
+        title_hit = history_service.create_record("咖啡探店", {"raw": "", "pages": []})
+        history_service.create_record("城市漫步", {"raw": "路过一家咖啡馆", "pages": []})
+
+        results = history_service.search_records("咖啡")
+        assert len(results) == 2
+        assert results[0]["id"] == title_hit
+
+    def test_search_index_follows_updates_and_deletes(self, history_service, sample_outline):
+        """Reindexed on content update; removed on delete."""
+        record_id = history_service.create_record("Draft", sample_outline)
+        assert history_service.search_records("zebra") == []
+
+        history_service.update_record(record_id, content={"titles": [], "copywriting": "zebra crossing", "tags": []})
+        assert [r["id"] for r in history_service.search_records("zebra")] == [record_id]
+
+        history_service.delete_record(record_id)
+        assert history_service.search_records("zebra") == []
+
+    def test_search_records_page(self, history_service, sample_outline):
+        """Paginated search reports totals like list_records."""
+        for i in range(5):
+            history_service.create_record(f"Holiday {i}", sample_outline)
+
+        result = history_service.search_records_page("holiday", page=2, page_size=2)
+
+        assert result["total"] == 5
+        assert result["total_pages"] == 3
+        assert len(result["records"]) == 2
+
 
 # ---------- get_statistics ----------
 
@@ -315,6 +420,38 @@ class TestGetStatistics:
         assert stats["total"] == 0
         assert stats["by_status"] == {}
 
+    def test_statistics_follow_status_changes_and_deletes(self, history_service, sample_outline):
+        """Counters move between statuses and drop on delete without a rescan."""
+        id1 = history_service.create_record("S1", sample_outline)
+        id2 = history_service.create_record("S2", sample_outline)
+        history_service.update_record(id1, status=RecordStatus.GENERATING)
+        history_service.update_record(id1, status=RecordStatus.COMPLETED)
+        history_service.delete_record(id2)
+
+        assert history_service.get_statistics() == {"total": 1, "by_status": {RecordStatus.COMPLETED: 1}}
+
+    def test_daily_counts(self, history_service, sample_outline):
+        """Records created today are counted under today's date."""
+        from datetime import datetime
+
+        history_service.create_record("D1", sample_outline)
+        history_service.create_record("D2", sample_outline)
+
+        assert history_service.get_daily_counts(7) == {datetime.now().strftime("%Y-%m-%d"): 2}
+
+    def test_reconcile_rebuilds_drifted_counters(self, history_service, sample_outline):
+        """reconcile_statistics recomputes counters from the index entries."""
+        history_service.create_record("R1", sample_outline)
+        store = history_service._store
+        if history_service.STORE_BACKEND == "sqlite":
+            with store._conn:
+                store._conn.execute("UPDATE status_counts SET n = 42")
+        else:
+            store._stats_cache = (store._stats_cache[0], {"draft": 42}, {})
+        assert history_service.get_statistics()["total"] == 42
+
+        assert history_service.reconcile_statistics() == {"total": 1, "by_status": {RecordStatus.DRAFT: 1}}
+
 
 # ---------- record_exists ----------
 
@@ -335,3 +472,179 @@ class TestRecordExists:
         history_service.delete_record(record_id)
 
         assert history_service.record_exists(record_id) is False
+
+
+# ---------- index store migration ----------
+
+class TestIndexStoreMigration:
+    def _make_service(self, history_dir, backend="sqlite"):
+        return HistoryService(history_dir, store_backend=backend)
+
+    def test_legacy_index_is_migrated_once(self, temp_history_dir):
+        """A legacy index.json is imported into SQLite and then renamed."""
+        legacy = {
+            "records": [
+                {"id": "rec-new", "title": "Newer", "created_at": "2025-01-02T00:00:00",
+                 "updated_at": "2025-01-02T00:00:00", "status": "completed",
+                 "thumbnail": "0.png", "page_count": 3, "task_id": "task_new"},
+                {"id": "rec-old", "title": "Older", "created_at": "2025-01-01T00:00:00",
+                 "updated_at": "2025-01-01T00:00:00", "status": "draft",
+                 "thumbnail": None, "page_count": 2, "task_id": None},
+            ]
+        }
+        index_file = os.path.join(temp_history_dir, "index.json")
+        with open(index_file, "w", encoding="utf-8") as f:
+            json.dump(legacy, f)
+
+        service = self._make_service(temp_history_dir)
+
+        assert not os.path.exists(index_file)
+        assert os.path.exists(index_file + ".migrated")
+        assert service._load_index()["records"] == legacy["records"]
+        assert service.get_statistics() == {"total": 2, "by_status": {"completed": 1, "draft": 1}}
+        assert service.get_referenced_task_ids() == ["task_new"]
+
+    def test_search_index_is_backfilled_from_record_files(self, temp_history_dir):
+        """Records imported from a legacy index become searchable from their record files."""
+        record = {"id": "rec-1", "title": "Legacy", "created_at": "2025-01-01T00:00:00",
+                  "outline": {"raw": "lighthouse keeper", "pages": []}}
+        with open(os.path.join(temp_history_dir, "rec-1.json"), "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        with open(os.path.join(temp_history_dir, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({"records": [record]}, f)
+
+        service = self._make_service(temp_history_dir)
+
+        assert [r["id"] for r in service.search_records("lighthouse")] == ["rec-1"]
+
+    def test_migration_does_not_resurrect_deleted_records(self, temp_history_dir):
+        """Reopening the store after deletions does not re-import the legacy index."""
+        index_file = os.path.join(temp_history_dir, "index.json")
+        with open(index_file, "w", encoding="utf-8") as f:
+            json.dump({"records": [{"id": "legacy-1", "title": "Legacy", "created_at": "2025-01-01T00:00:00"}]}, f)
+
+        service = self._make_service(temp_history_dir)
+        service._save_index({"records": []})
+        service._init_index()
+
+        assert service.list_records()["total"] == 0
+
+
+# ---------- write-behind index updates ----------
+
+class TestIndexWriteBehind:
+    def test_burst_of_updates_is_written_once(self, history_service, sample_outline, monkeypatch):
+        """Index updates within the flush window are merged into one store write."""
+        history_service.INDEX_FLUSH_DELAY = 60
+        record_id = history_service.create_record("Burst", sample_outline, task_id="task_burst")
+
+        writes = []
+        original = history_service._store.update_many
+        monkeypatch.setattr(history_service._store, "update_many",
+                            lambda updates: writes.append(dict(updates)) or original(updates))
+        monkeypatch.setattr(history_service._store, "update",
+                            lambda *a, **k: pytest.fail("index updated outside the batch"))
+
+        for i in range(5):
+            history_service.update_record(record_id, status=RecordStatus.GENERATING, thumbnail=f"{i}.png")
+        history_service.update_record(record_id, status=RecordStatus.COMPLETED)
+        assert writes == []
+
+        assert history_service.flush() == 1
+        assert len(writes) == 1
+        assert writes[0][record_id]["status"] == RecordStatus.COMPLETED
+        assert writes[0][record_id]["thumbnail"] == "4.png"
+        assert history_service.flush() == 0
+
+    def test_reads_see_pending_updates(self, history_service, sample_outline):
+        """Listing, stats and search flush pending index updates first."""
+        history_service.INDEX_FLUSH_DELAY = 60
+        record_id = history_service.create_record("Pending", sample_outline)
+        history_service.update_record(record_id, status=RecordStatus.COMPLETED)
+
+        listed = history_service.list_records(status=RecordStatus.COMPLETED)
+        assert [r["id"] for r in listed["records"]] == [record_id]
+        assert history_service.get_statistics()["by_status"] == {RecordStatus.COMPLETED: 1}
+
+    def test_delete_discards_pending_update(self, history_service, sample_outline):
+        """A record deleted inside the window does not reappear on flush."""
+        history_service.INDEX_FLUSH_DELAY = 60
+        record_id = history_service.create_record("Gone", sample_outline)
+        history_service.update_record(record_id, status=RecordStatus.GENERATING)
+        history_service.delete_record(record_id)
+
+        assert history_service.flush() == 0
+        assert history_service.list_records()["total"] == 0
+
+    def test_timer_flushes_without_reads(self, history_service, sample_outline):
+        """Pending updates reach the store after the window even with no reads."""
+        import time
+
+        history_service.INDEX_FLUSH_DELAY = 0.05
+        record_id = history_service.create_record("Timer", sample_outline)
+        history_service.update_record(record_id, status=RecordStatus.PARTIAL)
+
+        deadline = time.time() + 5
+        while history_service._store.get(record_id)["status"] != RecordStatus.PARTIAL:
+            assert time.time() < deadline
+            time.sleep(0.01)
+
+
+# ---------- concurrency ----------
+
+def _create_records_in_process(history_dir, backend, count):
+    service = HistoryService(history_dir, store_backend=backend)
+    for i in range(count):
+        record_id = service.create_record(f"proc-{os.getpid()}-{i}", {"pages": [{}]})
+        service.update_record(record_id, status=RecordStatus.COMPLETED)
+    service.flush()
+
+
+class TestConcurrentWriters:
+    def test_threads_do_not_lose_index_entries(self, history_service, sample_outline):
+        """Concurrent creates and updates from many threads all land in the index."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        def work(i):
+            record_id = history_service.create_record(f"t{i}", sample_outline)
+            history_service.update_record(record_id, status=RecordStatus.COMPLETED)
+            return record_id
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            ids = list(executor.map(work, range(40)))
+
+        result = history_service.list_records(page_size=100)
+        assert sorted(r["id"] for r in result["records"]) == sorted(ids)
+        assert history_service.get_statistics()["by_status"] == {RecordStatus.COMPLETED: 40}
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+    def test_processes_share_index_without_losing_records(self, history_service):
+        """Several worker processes writing the same history dir keep every record."""
+        import multiprocessing
+
+        backend = history_service.STORE_BACKEND
+        ctx = multiprocessing.get_context("fork")
+        procs = [
+            ctx.Process(target=_create_records_in_process, args=(history_service.history_dir, backend, 15))
+            for _ in range(3)
+        ]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(30)
+            assert p.exitcode == 0
+
+        history_service._init_index()
+        stats = history_service.get_statistics()
+        assert stats == {"total": 45, "by_status": {RecordStatus.COMPLETED: 45}}
+
+    def test_stale_batched_update_does_not_overwrite_newer_entry(self, history_service, sample_outline):
+        """A delayed index update older than the stored entry is skipped."""
+        record_id = history_service.create_record("Race", sample_outline)
+        history_service._store.update(record_id, {"status": RecordStatus.COMPLETED,
+                                                  "updated_at": "2999-01-01T00:00:00"})
+
+        history_service._store.update_many({record_id: {"status": RecordStatus.GENERATING,
+                                                        "updated_at": "2000-01-01T00:00:00"}})
+
+        assert history_service._store.get(record_id)["status"] == RecordStatus.COMPLETED
@@ -106,6 +106,16 @@ class TestCompressLargeImage:
         result_img = Image.open(io.BytesIO(result))
         assert result_img.mode == "RGB" or result_img.mode == "L"
 
+    def test_small_image_over_budget_at_min_quality(self):
+        """An image that cannot be scaled further returns the lowest-quality JPEG, not empty bytes."""
+        noisy = create_large_test_image(target_kb=300, width=500, height=500)
+
+        result = compress_image(noisy, max_size_kb=5)
+
+        assert len(result) > 5 * 1024
+        assert result[:2] == b"\xff\xd8"
+        assert Image.open(io.BytesIO(result)).size == (500, 500)
+
 
 class TestInvalidData:
     def test_compress_invalid_data(self):
@@ -124,3 +134,191 @@ class TestInvalidData:
         result = compress_image(empty, max_size_kb=200)
 
         assert result is empty
+
+
+class TestSearch:
+    def test_quality_search_matches_linear_ladder(self, monkeypatch):
+        """The galloping/binary search picks the same quality as the old linear ladder."""
+        import backend.utils.image_compressor as ic
+
+        img = Image.open(io.BytesIO(create_large_test_image(target_kb=300, width=400, height=400))).convert("RGB")
+        sizes = {q: len(ic._encode_jpeg(img, q)) for q in range(85, 19, -5)}
+
+        calls = []
+        original = ic._encode_jpeg
+        monkeypatch.setattr(ic, "_encode_jpeg", lambda im, q: calls.append(q) or original(im, q))
+
+        for limit in sorted(set(sizes.values())):
+            calls.clear()
+            expected = next(q for q in range(85, 19, -5) if sizes[q] <= limit)
+            result = ic._search_quality(img, limit, 85, 20)
+            assert len(result) == sizes[expected]
+            assert len(calls) <= 8
+
+    def test_large_image_needs_few_encodes(self, monkeypatch):
+        """Downscaling is estimated from bytes per pixel instead of 10% steps."""
+        import backend.utils.image_compressor as ic
+
+        calls = []
+        original = ic._encode_jpeg
+        monkeypatch.setattr(ic, "_encode_jpeg", lambda im, q: calls.append(q) or original(im, q))
+
+        monkeypatch.setattr(ic, "_compress_cache", ic._CompressCache(max_bytes=0))
+        large_image = create_large_test_image(target_kb=300)
+        result = compress_image(large_image, max_size_kb=50)
+
+        assert len(result) <= 50 * 1024
+        assert len(calls) <= 10
+
+    @pytest.mark.parametrize("side,max_kb", [(3000, 20), (2048, 30)])
+    def test_downscaled_result_fills_budget(self, monkeypatch, side, max_kb):
+        """Size is not proportional to pixel count: the scale search must not stop far below the budget."""
+        import random
+        import backend.utils.image_compressor as ic
+
+        monkeypatch.setattr(ic, "_compress_cache", ic._CompressCache(max_bytes=0))
+        noise = Image.frombytes("RGB", (side, side), random.Random(side).randbytes(side * side * 3))
+        buf = io.BytesIO()
+        noise.save(buf, format="PNG", compress_level=1)
+
+        result = compress_image(buf.getvalue(), max_size_kb=max_kb)
+
+        assert max_kb * 1024 * 0.8 <= len(result) <= max_kb * 1024
+
+
+class TestMemoization:
+    def test_repeated_compression_hits_cache(self, monkeypatch):
+        import backend.utils.image_compressor as ic
+
+        cache = ic._CompressCache(max_bytes=10 * 1024 * 1024)
+        monkeypatch.setattr(ic, "_compress_cache", cache)
+        large_image = create_large_test_image(target_kb=300, width=400, height=400)
+
+        first = compress_image(large_image, max_size_kb=200)
+        second = compress_image(bytes(large_image), max_size_kb=200)
+        assert second is first
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+        # 不同参数是不同的缓存项
+        compress_image(large_image, max_size_kb=100)
+        assert cache.stats()["misses"] == 2
+
+    def test_concurrent_callers_compress_once(self, monkeypatch):
+        import threading
+        import backend.utils.image_compressor as ic
+
+        monkeypatch.setattr(ic, "_compress_cache", ic._CompressCache(max_bytes=10 * 1024 * 1024))
+        calls = []
+        original = ic._compress_uncached
+
+        def slow(*args):
+            calls.append(1)
+            return original(*args)
+
+        monkeypatch.setattr(ic, "_compress_uncached", slow)
+        large_image = create_large_test_image(target_kb=300, width=400, height=400)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(compress_image(large_image, 200))) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(calls) == 1
+        assert len(results) == 6 and all(r is results[0] for r in results)
+
+    def test_byte_budget_evicts_oldest(self):
+        from backend.utils.image_compressor import _CompressCache
+
+        cache = _CompressCache(max_bytes=10)
+        cache.get_or_compute("a", lambda: b"x" * 6)
+        cache.get_or_compute("b", lambda: b"y" * 6)
+        assert cache.stats()["entries"] == 1 and cache.stats()["bytes"] == 6
+        assert cache.get_or_compute("b", lambda: b"new") == b"y" * 6
+        assert cache.get_or_compute("a", lambda: b"new") == b"new"
+
+    def test_failures_are_not_cached(self, monkeypatch):
+        import backend.utils.image_compressor as ic
+
+        cache = ic._CompressCache(max_bytes=10 * 1024 * 1024)
+        monkeypatch.setattr(ic, "_compress_cache", cache)
+        garbage = b"not an image" * 1000
+
+        assert compress_image(garbage, max_size_kb=1) == garbage
+        assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.parametrize("fmt", ["JPEG", "PNG"])
+def test_reduced_decode_never_goes_below_max_dimension(fmt):
+    from backend.utils.image_compressor import _decode_reduced
+
+    data = create_test_image(3000, 1800, fmt=fmt)
+    img = _decode_reduced(data, 700)
+    assert 700 <= max(img.size) < 1400
+    assert img.size[0] / img.size[1] == pytest.approx(3000 / 1800, rel=0.01)
+
+    # 不超过目标边长的图片原样解码
+    assert _decode_reduced(data, 4096).size == (3000, 1800)
+
+
+_BENCH_SCRIPT = r"""
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+import backend.utils.image_compressor as ic
+ic._FAST_DECODE = sys.argv[3] == "fast"
+ic._compress_cache.max_bytes = 0
+with open(sys.argv[2], "rb") as f:
+    data = f.read()
+start = time.perf_counter()
+out = ic.compress_image(data, max_size_kb=50, max_dimension=1024)
+elapsed = time.perf_counter() - start
+# VmHWM 在 exec 后重新计数；ru_maxrss 会继承 fork 时父进程（pytest）的峰值
+with open("/proc/self/status") as f:
+    hwm = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+print(json.dumps({"rss_kb": hwm, "seconds": elapsed, "out": len(out)}))
+"""
+
+
+class TestDecodeBenchmark:
+    """Micro-benchmark: reduced decoding vs full decode, measured in fresh processes."""
+
+    @pytest.mark.parametrize("fmt", ["JPEG", "PNG"])
+    def test_reduced_decode_lowers_peak_rss_and_resample_pixels(self, tmp_path, fmt, record_property):
+        import json
+        import os
+        import subprocess
+        import sys
+        import backend.utils.image_compressor as ic
+
+        if not os.path.exists("/proc/self/status"):
+            pytest.skip("peak RSS is read from /proc/self/status")
+        img = Image.effect_noise((4000, 4000), 40).convert("RGB")
+        src = tmp_path / f"large.{fmt.lower()}"
+        if fmt == "JPEG":
+            img.save(src, format=fmt, quality=95)
+        else:
+            img.save(src, format=fmt, compress_level=1)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+        results = {}
+        for mode in ("full", "fast"):
+            proc = subprocess.run(
+                [sys.executable, "-c", _BENCH_SCRIPT, root, str(src), mode],
+                capture_output=True, text=True, check=True,
+            )
+            results[mode] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+        # 耗时只作记录（junit 报告中的属性），不做断言：墙钟时间在繁忙的 CI 上不稳定
+        for mode, result in results.items():
+            record_property(f"{mode}_seconds", round(result["seconds"], 3))
+
+        assert results["fast"]["out"] <= 50 * 1024
+        # 缩小解码后交给 LANCZOS 重采样的像素数大幅减少（JPEG draft 1/2，PNG reduce 1/3）
+        reduced = ic._decode_reduced(src.read_bytes(), 1024)
+        assert reduced.width * reduced.height * 3 < img.width * img.height
+        # reduce() 需要完整解码，峰值内存持平即可（省下的是重采样耗时）
+        assert results["fast"]["rss_kb"] <= results["full"]["rss_kb"] * 1.05
+        if fmt == "JPEG":
+            # draft() 按 1/2 比例解码：峰值内存应明显下降
+            assert results["fast"]["rss_kb"] < results["full"]["rss_kb"] * 0.9
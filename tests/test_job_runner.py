@@ -0,0 +1,90 @@
+import threading
+
+from backend.services.job_runner import GenerationJobRunner, TaskEventLog
+
+
+def test_event_log_resumes_after_last_event_id():
+    log = TaskEventLog("t", size=3)
+    for i in range(2):
+        log.append("complete", {"index": i})
+
+    events, gap, closed = log.read(1, timeout=0)
+    assert [e[0] for e in events] == [2] and not gap and not closed
+    # 其它执行的 ID 从头读取
+    assert log.parse_event_id(log.event_id(2)) == 2
+    assert log.parse_event_id("other:5") == 0 and log.parse_event_id(None) == 0
+
+    # 缓冲满后旧事件被挤出：落后的客户端先收到快照
+    for i in range(2, 5):
+        log.append("complete", {"index": i})
+    log.append("finish", {"success": True})
+    log.close()
+    items = list(log.tail(1, heartbeat=0.01, snapshot=lambda: [{"event": "complete", "data": {"index": 0}}]))
+    assert items[0] == (None, "complete", {"index": 0})
+    assert [item[0] for item in items[1:]] == [log.event_id(seq) for seq in (4, 5, 6)]
+    assert items[-1][1] == "finish"
+
+
+def test_runner_does_not_start_same_task_twice():
+    runner = GenerationJobRunner()
+    gate = threading.Event()
+    calls = []
+
+    def events():
+        calls.append(1)
+        yield {"event": "progress", "data": {"index": 0}}
+        gate.wait(5)
+        yield {"event": "finish", "data": {"success": True}}
+
+    log, started = runner.start("t", events)
+    again, started_again = runner.start("t", events)
+    assert started and not started_again and again is log
+    assert runner.stats()["running"] == 1
+
+    gate.set()
+    items = [item for item in log.tail(0, heartbeat=0.01) if item]
+    assert [item[1] for item in items] == ["progress", "finish"]
+    assert calls == [1] and not runner.is_running("t")
+
+    # 执行结束后再次提交会重新执行
+    assert runner.start("t", events)[1]
+
+
+def test_generate_runs_in_background_and_reconnect_does_not_regenerate(client, monkeypatch):
+    import backend.routes.image_routes as image_routes
+
+    gate = threading.Event()
+    calls = []
+
+    class _FakeImageService:
+        def generate_images(self, pages, task_id, full_outline, user_images=None, user_topic="", style_hint=""):
+            calls.append(task_id)
+            yield {"event": "complete", "data": {"index": 0, "status": "done"}}
+            gate.wait(5)
+            yield {"event": "complete", "data": {"index": 1, "status": "done"}}
+            yield {"event": "finish", "data": {"success": True, "task_id": task_id}}
+
+        def task_snapshot_events(self, task_id):
+            return []
+
+    runner = GenerationJobRunner()
+    monkeypatch.setattr(image_routes, "get_image_service", lambda: _FakeImageService())
+    monkeypatch.setattr(image_routes, "get_generation_job_runner", lambda: runner)
+    payload = {"pages": [{"index": 0, "type": "cover", "content": "a"}], "task_id": "task_bg"}
+
+    # 收到第一个事件后断开连接
+    resp = client.post("/api/generate", json=payload, buffered=False)
+    first = next(iter(resp.response)).decode()
+    resp.close()
+    assert "event: complete" in first
+    event_id = first.split("\n")[0][len("id: "):]
+
+    # 生成在后台继续；重复提交和重新连接都不会再次生成
+    threading.Timer(0.2, gate.set).start()
+    again = client.post("/api/generate", json=payload, headers={"Last-Event-ID": event_id})
+    body = again.get_data(as_text=True)
+    assert body.count("event: complete") == 1 and "event: finish" in body
+
+    resumed = client.get("/api/task/task_bg/events", headers={"Last-Event-ID": event_id})
+    assert resumed.get_data(as_text=True).count("event: complete") == 1
+    assert calls == ["task_bg"]
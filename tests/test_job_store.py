@@ -0,0 +1,177 @@
+import threading
+
+from backend.services.generation_scheduler import GenerationScheduler
+from backend.services.job_store import (
+    JOB_CANCELLED,
+    JOB_FINISHED,
+    JOB_RUNNING,
+    PAGE_DONE,
+    PAGE_FAILED,
+    PAGE_GENERATING,
+    PAGE_PENDING,
+    GenerationJobStore,
+)
+
+
+def _pages(n):
+    return [{"index": i, "type": "cover" if i == 0 else "content", "content": str(i)} for i in range(n)]
+
+
+def _service(tmp_path, store):
+    from backend.services.image import ImageService
+
+    service = ImageService.__new__(ImageService)
+    service.history_root_dir = str(tmp_path)
+    service._task_states = {}
+    service._task_states_lock = threading.Lock()
+    service.provider_name = "fake"
+    service.provider_config = {"high_concurrency": False}
+    service.scheduler = GenerationScheduler(max_concurrent=2)
+    service.job_store = store
+    service.JOB_FOLLOW_INTERVAL = 0.01
+
+    def fake_generate(page, task_id, task_dir, *args):
+        filename = f"{page['index']}.png"
+        with open(f"{task_dir}/{filename}", "wb") as f:
+            f.write(b"png")
+        return page["index"], True, filename, None
+
+    service._generate_single_image = fake_generate
+    service._write_thumbnails = lambda *a, **k: None
+    return service
+
+
+def test_job_lifecycle_keeps_done_pages_on_restart(tmp_path):
+    store = GenerationJobStore(str(tmp_path / "jobs.db"))
+    try:
+        store.start_job("t1", {"pages": _pages(3), "user_topic": "猫"}, [0, 1, 2])
+        store.set_page("t1", 0, PAGE_DONE, filename="0.png")
+        store.set_page("t1", 1, PAGE_GENERATING)
+        assert not store.set_page("missing", 0, PAGE_DONE)
+
+        # 重新开始：已完成的页面保留，其余重置；不再存在的页面删除
+        store.start_job("t1", {"pages": _pages(2)}, [0, 1])
+        job = store.get_job("t1")
+        assert job["params"]["pages"] == _pages(2)
+        assert {i: p["status"] for i, p in job["pages"].items()} == {0: PAGE_DONE, 1: PAGE_PENDING}
+
+        store.finish_job("t1", JOB_FINISHED)
+        job = store.get_job("t1")
+        assert job["status"] == JOB_FINISHED
+        assert job["pages"][1]["status"] == PAGE_FAILED
+        assert store.stats() == {JOB_FINISHED: 1}
+        assert store.prune(retention=0) == 1 and store.get_job("t1") is None
+    finally:
+        store.close()
+
+
+def test_unfinished_jobs_claimed_once_after_owner_exits(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    first = GenerationJobStore(path)
+    first.start_job("t1", {"pages": _pages(2)}, [0, 1])
+    first.set_page("t1", 0, PAGE_GENERATING)
+    first.start_job("t2", {"pages": _pages(1)}, [0])
+    first.finish_job("t2", JOB_CANCELLED)
+
+    second = GenerationJobStore(path)
+    third = GenerationJobStore(path)
+    try:
+        # 所属进程还在时不接管
+        assert second.claim_unfinished() == []
+
+        first.close()
+        claimed = second.claim_unfinished()
+        assert [job["task_id"] for job in claimed] == ["t1"]
+        assert claimed[0]["pages"][0]["status"] == PAGE_PENDING
+        assert claimed[0]["owner"] == second.owner
+        assert third.claim_unfinished() == []
+
+        # 放弃所有权后可以被单独接管
+        assert second.release_job("t1")
+        assert third.claim_job("t1")["owner"] == third.owner
+        assert second.claim_job("t1") is None
+    finally:
+        second.close()
+        third.close()
+
+
+def test_interrupted_generation_resumes_when_client_reattaches(tmp_path):
+    store = GenerationJobStore(str(tmp_path / "jobs.db"))
+    service = _service(tmp_path, store)
+    try:
+        # 客户端在封面完成后断开
+        events = service.generate_images(_pages(3), "task_follow", user_topic="猫")
+        for event in events:
+            if event["event"] == "complete":
+                break
+        events.close()
+
+        job = store.get_job("task_follow")
+        assert job["status"] == JOB_RUNNING and job["owner"] is None
+        assert job["pages"][0]["status"] == PAGE_DONE
+
+        # 模拟服务重启：内存状态丢失后仍可查询
+        service._task_states.clear()
+        state = service.get_task_state("task_follow")
+        assert state["generated"] == {0: "0.png"} and state["user_topic"] == "猫"
+
+        # 重新连接：回放已完成的页面，接管任务在后台继续生成
+        followed = list(service.follow_job("task_follow"))
+        assert followed[0]["event"] == "complete" and followed[0]["data"]["index"] == 0
+        finish = followed[-1]
+        assert finish["event"] == "finish"
+        assert finish["data"]["success"] is True
+        assert finish["data"]["images"] == ["0.png", "1.png", "2.png"]
+        assert sorted(e["data"]["index"] for e in followed if e["event"] == "complete") == [0, 1, 2]
+        assert store.get_job("task_follow")["status"] == JOB_FINISHED
+    finally:
+        service.scheduler.shutdown()
+        store.close()
+
+
+def test_task_events_route(client, monkeypatch, tmp_path):
+    import backend.routes.image_routes as image_routes
+
+    store = GenerationJobStore(str(tmp_path / "jobs.db"))
+    service = _service(tmp_path, store)
+    monkeypatch.setattr(image_routes, "get_image_service", lambda: service)
+    try:
+        for _ in service.generate_images(_pages(2), "task_route"):
+            pass
+
+        response = client.get("/api/task/task_route/events")
+        assert response.status_code == 200
+        body = response.get_data(as_text=True)
+        assert body.count("event: complete") == 2
+        assert body.rstrip().splitlines()[-2] == "event: finish"
+
+        assert client.get("/api/task/unknown/events").status_code == 404
+        assert client.get("/api/task/..%2Fx/events").status_code in (400, 404)
+    finally:
+        service.scheduler.shutdown()
+        store.close()
+
+
+def test_owner_lock_released_from_another_thread(tmp_path):
+    import os
+
+    store = GenerationJobStore(str(tmp_path / "jobs.db"))
+    owner = store.owner
+    lock_path = store._owner_lock_path(owner)
+    assert os.path.exists(lock_path)
+
+    # owner 在主线程创建，close() 在其它线程（如 atexit / 关闭钩子）调用
+    errors = []
+
+    def _close():
+        try:
+            store.close()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=_close)
+    thread.start()
+    thread.join()
+    assert errors == []
+    assert not os.path.exists(lock_path)
+    store.close()
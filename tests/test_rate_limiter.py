@@ -0,0 +1,114 @@
+import time
+
+import pytest
+
+import backend.utils.text_client as text_client
+from backend.services.generation_scheduler import GenerationScheduler
+from backend.services.rate_limiter import (
+    ProviderRateLimiter,
+    RateLimitTimeout,
+    estimate_tokens,
+    get_provider_rate_limiter,
+)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rpm_and_tpm_buckets_refill_over_time():
+    clock = _Clock()
+    limiter = ProviderRateLimiter("text:test", clock=clock)
+    limiter.configure(rpm=60, tpm=6000, burst=2)
+
+    assert limiter.try_acquire(1000) == 0
+    assert limiter.try_acquire(1000) == 0
+    # 突发额度用完，1 秒补充一个请求
+    assert limiter.try_acquire(1000) == pytest.approx(1.0)
+    clock.now += 1
+    assert limiter.try_acquire(1000) == 0
+
+    # TPM 每秒补充 100：10 秒后剩 4100，需要 5000 时等待 9 秒，期间不扣配额
+    clock.now += 10
+    assert limiter.try_acquire(5000) == pytest.approx(9.0)
+    # 上一次实际只用了 100，归还多扣的 900 后即可放行
+    limiter.settle(1000, 100)
+    assert limiter.try_acquire(5000) == 0
+
+    limiter.penalize(30)
+    assert limiter.try_acquire() == pytest.approx(30.0)
+    assert limiter.stats()["acquired"] == 4
+
+
+def test_acquire_waits_within_deadline_or_fails_fast():
+    limiter = ProviderRateLimiter("text:deadline")
+    limiter.configure(rpm=600, burst=1)
+
+    assert limiter.acquire(timeout=1) == 0
+    started = time.monotonic()
+    limiter.acquire(timeout=1)
+    assert 0.05 <= time.monotonic() - started < 0.5
+
+    limiter.penalize(60)
+    started = time.monotonic()
+    with pytest.raises(RateLimitTimeout) as exc:
+        limiter.acquire(timeout=1)
+    # 预计超过期限时立即失败，不白等
+    assert time.monotonic() - started < 0.1
+    assert exc.value.wait_seconds > 1
+    assert limiter.stats()["timeouts"] == 1
+
+
+def test_registry_shares_limiter_and_applies_config():
+    config = {"type": "openai_compatible", "rate_limit": {"rpm": 30, "tpm": 1000}}
+    first = get_provider_rate_limiter("text", "shared", config)
+    assert get_provider_rate_limiter("text", "shared", dict(config)) is first
+    assert first.stats()["tpm"] == 1000
+
+    # 图片服务商不使用 TPM；未配置时不限流
+    image = get_provider_rate_limiter("image", "shared", config)
+    assert image is not first and image.stats()["tpm"] is None
+    assert get_provider_rate_limiter("text", "none", {"type": "openai_compatible"}) is None
+    assert estimate_tokens(["hello world!", "你好"], images=1, max_output_tokens=100) == 3 + 2 + 1000 + 100
+
+
+def test_scheduler_holds_jobs_until_rate_quota_available():
+    scheduler = GenerationScheduler(max_concurrent=4)
+    limiter = ProviderRateLimiter("image:p")
+    limiter.configure(rpm=300, burst=1)
+    scheduler.set_provider_rate_limiter("p", limiter)
+    try:
+        started = time.monotonic()
+        futures = [scheduler.submit("t", "p", time.monotonic) for _ in range(3)]
+        finished = sorted(f.result(5) - started for f in futures)
+        # 每 0.2 秒放行一个，排队的调用不会被丢弃
+        assert finished[0] < 0.1
+        assert finished[2] >= 0.35
+    finally:
+        scheduler.shutdown()
+
+
+def test_text_client_waits_for_quota_and_settles_usage(monkeypatch):
+    limiter = ProviderRateLimiter("text:client")
+    limiter.configure(rpm=60, tpm=100000)
+    acquired = []
+    original_acquire = limiter.acquire
+    monkeypatch.setattr(limiter, "acquire", lambda tokens=0, timeout=None: acquired.append(tokens) or original_acquire(tokens, timeout))
+
+    class _Response:
+        status_code = 200
+
+        def json(self):
+            return {"choices": [{"message": {"content": "ok"}}], "usage": {"total_tokens": 10}}
+
+    monkeypatch.setattr(text_client.requests, "post", lambda *a, **k: _Response())
+    client = text_client.TextChatClient(api_key="k", base_url="https://example.com", rate_limiter=limiter)
+    assert client.generate_text("hello", max_output_tokens=500) == "ok"
+
+    assert acquired == [502]
+    # 预扣 502 个，实际只用 10 个，多扣的归还
+    assert limiter._tokens.tokens == pytest.approx(100000 - 10, abs=5)
@@ -0,0 +1,71 @@
+import base64
+import io
+
+from PIL import Image
+
+import backend.generators.image_api as image_api_mod
+import backend.generators.reference as reference_mod
+from backend.generators.image_api import ImageApiGenerator
+from backend.generators.reference import ReferencePayload
+
+
+def _image_bytes(fmt, color, size=(64, 64)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, format=fmt)
+    return buf.getvalue()
+
+
+class _FakeResponse:
+    status_code = 200
+
+    def json(self):
+        return {"data": [{"b64_json": base64.b64encode(b"generated").decode("ascii")}]}
+
+
+def test_prepare_encodes_once_with_real_mime_types():
+    cover = _image_bytes("JPEG", "red")
+    user = _image_bytes("PNG", "blue")
+
+    payload = ReferencePayload.prepare(cover_image=cover, user_images=[user, user])
+
+    assert [ref.mime_type for ref in payload.images] == ["image/png", "image/jpeg"]
+    assert payload.cover.data == cover
+    assert payload.images[1] is payload.cover
+    assert payload.cover.data_uri == "data:image/jpeg;base64," + base64.b64encode(cover).decode("ascii")
+    assert not ReferencePayload.prepare()
+
+
+def test_cover_duplicating_user_image_is_sent_once():
+    img = _image_bytes("PNG", "green")
+    payload = ReferencePayload.prepare(cover_image=img, user_images=[img])
+    assert len(payload) == 1
+    assert payload.cover is not None
+
+
+def test_image_api_uses_prepared_payload_without_recompressing(monkeypatch):
+    sent = []
+    monkeypatch.setattr(image_api_mod.requests, "post", lambda url, headers, json, timeout: sent.append(json) or _FakeResponse())
+
+    payload = ReferencePayload.prepare(
+        cover_image=_image_bytes("JPEG", "red"),
+        user_images=[_image_bytes("PNG", "blue")]
+    )
+    monkeypatch.setattr(reference_mod, "compress_image", lambda *a, **k: (_ for _ in ()).throw(AssertionError("recompressed")))
+
+    generator = ImageApiGenerator({"api_key": "k", "base_url": "https://example.com"})
+    for _ in range(3):
+        assert generator.generate_image("prompt", reference_payload=payload) == b"generated"
+
+    assert len(sent) == 3
+    assert all(body["image"] == [ref.data_uri for ref in payload.images] for body in sent)
+
+
+def test_image_api_legacy_arguments_still_work(monkeypatch):
+    sent = []
+    monkeypatch.setattr(image_api_mod.requests, "post", lambda url, headers, json, timeout: sent.append(json) or _FakeResponse())
+    cover = _image_bytes("PNG", "red")
+
+    generator = ImageApiGenerator({"api_key": "k", "base_url": "https://example.com"})
+    generator.generate_image("prompt", reference_image=cover, reference_images=[cover])
+
+    assert sent[0]["image"] == ["data:image/png;base64," + base64.b64encode(cover).decode("ascii")]
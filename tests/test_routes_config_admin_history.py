@@ -121,10 +121,12 @@ def test_admin_endpoints_are_local_only_and_work_in_tests(client, monkeypatch):
     assert data.get("dry_run") is True
 
 
-def test_history_crud_and_download_zip(client, history_service, monkeypatch):
+def test_history_crud_and_download_zip(client, history_service, monkeypatch, tmp_path):
     import backend.services.history as hs_mod
+    import backend.services.zip_cache as zc_mod
 
     monkeypatch.setattr(hs_mod, "_service_instance", history_service)
+    monkeypatch.setattr(zc_mod, "_cache_instance", zc_mod.ZipBundleCache(str(tmp_path / "zip_cache"), max_bytes=10_000_000))
 
     task_id = "task_12345678"
     outline = {"raw": "raw outline", "pages": [{"index": 0, "type": "cover", "content": "封面"}]}
@@ -149,6 +151,24 @@ def test_history_crud_and_download_zip(client, history_service, monkeypatch):
     )
     assert resp.status_code == 200
 
+    resp = client.get("/api/history?cursor=&page_size=1&sort=updated_at")
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert [r["id"] for r in data["records"]] == [record_id]
+    assert data["has_more"] is False and data["next_cursor"] is None
+
+    resp = client.get("/api/history?sort=title")
+    assert resp.status_code == 400
+
+    resp = client.get("/api/history/search?keyword=封面&page=1&page_size=5")
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert [r["id"] for r in data["records"]] == [record_id]
+    assert data["total"] == 1 and data["total_pages"] == 1
+
+    resp = client.get("/api/history/search?keyword=封面&page=abc")
+    assert resp.status_code == 400
+
     task_dir = Path(history_service.history_dir) / task_id
     task_dir.mkdir(parents=True, exist_ok=True)
     (task_dir / "0.png").write_bytes(b"not-a-real-png")
@@ -157,3 +177,27 @@ def test_history_crud_and_download_zip(client, history_service, monkeypatch):
     assert resp.status_code == 200
     assert resp.mimetype == "application/zip"
     assert resp.data[:2] == b"PK"
+
+    import io
+    import zipfile
+
+    with zipfile.ZipFile(io.BytesIO(resp.data)) as zf:
+        assert zf.testzip() is None
+        infos = {info.filename: info for info in zf.infolist()}
+        assert infos["page_1.png"].compress_type == zipfile.ZIP_STORED
+        assert zf.read("page_1.png") == b"not-a-real-png"
+        assert infos["meta.txt"].compress_type == zipfile.ZIP_DEFLATED
+        assert "Title: 测试标题" in zf.read("meta.txt").decode("utf-8")
+        assert "#a #b" in zf.read("content.txt").decode("utf-8")
+    assert "filename*=UTF-8''" in resp.headers["Content-Disposition"]
+
+    # 首次下载边打包边输出并写入缓存；再次下载命中磁盘缓存，支持 Range 与条件请求
+    resp = client.get(f"/api/history/{record_id}/download")
+    assert resp.status_code == 200 and resp.data[:2] == b"PK"
+    etag = resp.headers.get("ETag")
+    assert etag
+    resp = client.get(f"/api/history/{record_id}/download", headers={"Range": "bytes=0-1"})
+    assert resp.status_code == 206
+    assert resp.data == b"PK"
+    resp = client.get(f"/api/history/{record_id}/download", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
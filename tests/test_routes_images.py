@@ -0,0 +1,152 @@
+import shutil
+import threading
+import uuid
+from pathlib import Path
+
+import pytest
+
+from backend.services.image import image_version
+
+HISTORY_ROOT = Path(__file__).resolve().parent.parent / "history"
+
+
+@pytest.fixture
+def task_dir():
+    path = HISTORY_ROOT / f"test_{uuid.uuid4().hex}"
+    path.mkdir(parents=True)
+    (path / "0.png").write_bytes(b"original-png")
+    (path / "thumb_0.png").write_bytes(b"thumb-png")
+    yield path
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def test_image_etag_and_not_modified(client, task_dir):
+    url = f"/api/images/{task_dir.name}/0.png"
+
+    resp = client.get(url)
+    assert resp.status_code == 200
+    assert resp.data == b"thumb-png"
+    etag = resp.headers["ETag"]
+    assert not etag.startswith("W/")
+    assert resp.headers["Last-Modified"]
+    assert resp.headers["Cache-Control"] == "no-cache"
+
+    resp = client.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+    resp = client.get(url + "?thumbnail=false", headers={"Range": "bytes=0-7"})
+    assert resp.status_code == 206
+    assert resp.data == b"original"
+
+
+def test_versioned_image_url_is_immutable(client, task_dir):
+    version = image_version(str(task_dir / "0.png"))
+    url = f"/api/images/{task_dir.name}/0.png"
+
+    resp = client.get(f"{url}?v={version}")
+    assert resp.status_code == 200
+    assert "immutable" in resp.headers["Cache-Control"]
+
+    # 重新生成后旧版本号不再获得长期缓存
+    (task_dir / "0.png").write_bytes(b"regenerated-png")
+    assert image_version(str(task_dir / "0.png")) != version
+    resp = client.get(f"{url}?v={version}")
+    assert resp.headers["Cache-Control"] == "no-cache"
+
+
+def test_image_url_carries_version(task_dir):
+    from backend.services.image import ImageService
+
+    service = ImageService.__new__(ImageService)
+    service.history_root_dir = str(HISTORY_ROOT)
+
+    url = service._image_url(task_dir.name, "0.png")
+    assert url == f"/api/images/{task_dir.name}/0.png?v={image_version(str(task_dir / '0.png'))}"
+    assert service._image_url(task_dir.name, "9.png") == f"/api/images/{task_dir.name}/9.png"
+
+
+def _png_bytes(width=1200, height=1600):
+    import io
+    from PIL import Image
+
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 80, 40)).save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_variants_negotiated_by_accept_and_width(client, task_dir):
+    from backend.utils.image_variants import generate_variants, supported_formats
+
+    if "WEBP" not in supported_formats():
+        pytest.skip("Pillow built without WebP")
+
+    data = _png_bytes()
+    (task_dir / "0.png").write_bytes(data)
+    written = generate_variants(data, str(task_dir), "0.png")
+    assert "var_0_gallery.webp" in written and "var_0_preview.webp" in written
+
+    url = f"/api/images/{task_dir.name}/0.png"
+
+    resp = client.get(url + "?w=300", headers={"Accept": "image/webp,*/*"})
+    assert resp.status_code == 200
+    assert resp.mimetype == "image/webp"
+    assert "Accept" in resp.headers["Vary"]
+    assert resp.data == (task_dir / "var_0_gallery.webp").read_bytes()
+
+    resp = client.get(url + "?w=1000", headers={"Accept": "image/webp"})
+    assert resp.data == (task_dir / "var_0_preview.webp").read_bytes()
+
+    # 不支持 WebP/AVIF 的客户端拿到 JPEG 缩略图，且 MIME 类型与内容一致
+    resp = client.get(url, headers={"Accept": "image/png,image/*"})
+    assert resp.data == b"thumb-png"
+    (task_dir / "thumb_0.png").write_bytes(b"\xff\xd8\xff\xe0jpeg")
+    resp = client.get(url, headers={"Accept": "image/png"})
+    assert resp.mimetype == "image/jpeg"
+
+    resp = client.get(url + "?w=abc")
+    assert resp.status_code == 400
+
+
+def test_pending_thumbnail_falls_back_to_original(client, task_dir, monkeypatch):
+    import backend.services.thumbnail_pool as tp_mod
+
+    pool = tp_mod.ThumbnailPool(workers=1, max_queue=4)
+    monkeypatch.setattr(tp_mod, "_pool_instance", pool)
+    monkeypatch.setattr(tp_mod.ThumbnailPool, "WAIT_TIMEOUT", 0.01)
+    release = threading.Event()
+    try:
+        pool.submit(str((task_dir / "0.png").resolve()), lambda: release.wait(5))
+        version = image_version(str(task_dir / "0.png"))
+
+        resp = client.get(f"/api/images/{task_dir.name}/0.png?v={version}")
+        assert resp.status_code == 200
+        assert resp.data == b"original-png"
+        assert resp.headers["Cache-Control"] == "no-cache"
+    finally:
+        release.set()
+        pool.shutdown()
+
+    resp = client.get(f"/api/images/{task_dir.name}/0.png?v={version}")
+    assert resp.data == b"thumb-png"
+
+
+def test_regenerated_image_drops_stale_variants(tmp_path, monkeypatch):
+    import backend.services.image as image_mod
+    import backend.services.thumbnail_pool as tp_mod
+    from backend.services.image import ImageService
+    from backend.utils.image_variants import find_variant
+
+    monkeypatch.setattr(tp_mod, "_pool_instance", tp_mod.ThumbnailPool(workers=0))
+    service = ImageService.__new__(ImageService)
+    (tmp_path / "0.png").write_bytes(b"old-png")
+    (tmp_path / "thumb_0.png").write_bytes(b"old-thumb")
+    (tmp_path / "var_0_card.webp").write_bytes(b"old-variant")
+
+    # 新图的变体编码失败（只记录日志），不能继续提供旧图的变体
+    monkeypatch.setattr(image_mod, "generate_variants", lambda *a: (_ for _ in ()).throw(OSError("encoder")))
+    service._save_image(_png_bytes(64, 64), "0.png", str(tmp_path))
+
+    assert (tmp_path / "0.png").read_bytes().startswith(b"\x89PNG")
+    assert (tmp_path / "thumb_0.png").read_bytes() != b"old-thumb"
+    assert not (tmp_path / "var_0_card.webp").exists()
+    assert find_variant(str(tmp_path), "0.png", "image/webp", None) is None
@@ -1,5 +1,4 @@
 import json
-import os
 import uuid
 from pathlib import Path
 
@@ -7,10 +6,7 @@ from pathlib import Path
 def test_history_service_rejects_record_id_traversal(temp_history_dir):
     from backend.services.history import HistoryService
 
-    service = HistoryService()
-    service.history_dir = temp_history_dir
-    service.index_file = os.path.join(temp_history_dir, "index.json")
-    service._init_index()
+    service = HistoryService(temp_history_dir)
 
     stem = f"outside_{uuid.uuid4().hex}"
     outside_path = Path(temp_history_dir).parent / f"{stem}.json"
@@ -0,0 +1,78 @@
+import threading
+
+from backend.services.thumbnail_pool import ThumbnailPool
+
+
+def test_background_job_runs_and_wait_returns():
+    pool = ThumbnailPool(workers=1, max_queue=4)
+    release = threading.Event()
+    done = []
+
+    def work():
+        release.wait(5)
+        done.append(1)
+
+    try:
+        assert pool.submit("/tmp/task/0.png", work) is True
+        assert pool.is_pending("/tmp/task/0.png")
+        assert pool.wait("/tmp/task/0.png", timeout=0.01) is False
+        assert pool.stats()["queued"] == 1
+
+        release.set()
+        assert pool.wait("/tmp/task/0.png", timeout=5) is True
+        assert done == [1]
+        stats = pool.stats()
+        assert stats["pending"] == 0 and stats["queued"] == 0 and stats["completed"] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_superseded_job_is_skipped():
+    pool = ThumbnailPool(workers=1, max_queue=4)
+    blocker = threading.Event()
+    ran = []
+
+    try:
+        pool.submit("/tmp/task/blocker.png", lambda: blocker.wait(5))
+        pool.submit("/tmp/task/0.png", lambda: ran.append("old"))
+        pool.submit("/tmp/task/0.png", lambda: ran.append("new"))
+        blocker.set()
+        assert pool.wait("/tmp/task/0.png", timeout=5) is True
+        pool.shutdown()
+
+        assert ran == ["new"]
+        assert pool.stats()["superseded"] == 1
+    finally:
+        blocker.set()
+        pool.shutdown()
+
+
+def test_full_queue_and_no_workers_run_inline():
+    caller = threading.current_thread()
+    threads = []
+
+    pool = ThumbnailPool(workers=0)
+    assert pool.submit("/tmp/task/0.png", lambda: threads.append(threading.current_thread())) is False
+    assert threads == [caller]
+    assert pool.stats()["inline"] == 1
+
+    bounded = ThumbnailPool(workers=1, max_queue=1)
+    release = threading.Event()
+    try:
+        assert bounded.submit("/tmp/task/0.png", lambda: release.wait(5)) is True
+        assert bounded.submit("/tmp/task/1.png", lambda: threads.append(threading.current_thread())) is False
+        assert threads[-1] is caller
+    finally:
+        release.set()
+        bounded.shutdown()
+
+
+def test_failed_job_is_counted_and_released():
+    pool = ThumbnailPool(workers=0)
+
+    def boom():
+        raise RuntimeError("encode failed")
+
+    pool.submit("/tmp/task/0.png", boom)
+    assert not pool.is_pending("/tmp/task/0.png")
+    assert pool.stats()["failed"] == 1
@@ -0,0 +1,228 @@
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+import backend.routes.image_routes as image_routes
+import backend.routes.outline_routes as outline_routes
+import backend.utils.upload_stream as upload_stream
+from backend.services.reference_store import ReferenceImageStore, reference_image_id
+
+
+def _png(color="red"):
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    store = ReferenceImageStore(str(tmp_path / "refs"))
+    monkeypatch.setattr(image_routes, "get_reference_store", lambda: store)
+    monkeypatch.setattr(outline_routes, "get_reference_store", lambda: store)
+    import backend.routes.reference_routes as reference_routes
+    monkeypatch.setattr(reference_routes, "get_reference_store", lambda: store)
+    return store
+
+
+class _FakeOutlineService:
+    def __init__(self):
+        self.calls = []
+
+    def generate_outline(self, topic, images=None):
+        self.calls.append((topic, images))
+        return {"success": True, "outline": "", "pages": []}
+
+
+@pytest.fixture
+def outline_service(monkeypatch):
+    service = _FakeOutlineService()
+    monkeypatch.setattr(outline_routes, "get_outline_service", lambda: service)
+    return service
+
+
+def test_upload_multipart_and_binary_then_reference_by_id(client, store, outline_service):
+    red, blue = _png("red"), _png("blue")
+    resp = client.post(
+        "/api/reference-images",
+        data={"images": [(io.BytesIO(red), "a.png"), (io.BytesIO(blue), "b.png")]},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 200
+    ids = [img["id"] for img in resp.get_json()["images"]]
+    assert [img["mime_type"] for img in resp.get_json()["images"]] == ["image/png", "image/png"]
+
+    resp = client.post("/api/reference-images", data=red, content_type="image/png")
+    assert resp.status_code == 200
+    assert resp.get_json()["images"][0]["bytes"] == len(red)
+
+    resp = client.post("/api/outline", json={"topic": "t", "image_ids": ids})
+    assert resp.status_code == 200
+    assert outline_service.calls[-1] == ("t", [red, blue])
+
+    resp = client.post("/api/outline", json={"topic": "t", "image_ids": ["0" * 64]})
+    assert resp.status_code == 400
+    assert "重新上传" in resp.get_json()["error"]
+
+    resp = client.post("/api/outline", json={"topic": "t", "image_ids": ["../../etc/passwd"]})
+    assert resp.status_code == 400
+    assert "无效的图片 ID" in resp.get_json()["error"]
+
+
+def test_outline_multipart_is_parsed_with_validation(client, store, outline_service):
+    red = _png()
+    image_id = store.put(_png("blue"), "image/png")["id"]
+
+    resp = client.post(
+        "/api/outline",
+        data={"topic": "秋季穿搭", "image_ids": image_id, "images": [(io.BytesIO(red), "a.png")]},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 200
+    topic, images = outline_service.calls[-1]
+    assert topic == "秋季穿搭"
+    assert images == [red, store.get(image_id)]
+
+    resp = client.post(
+        "/api/outline",
+        data={"topic": "t", "images": [(io.BytesIO(b"not an image at all"), "a.png")]},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 400
+    assert "不支持的图片格式" in resp.get_json()["error"]
+
+
+def test_oversized_upload_is_rejected_while_streaming(client, store, monkeypatch):
+    monkeypatch.setattr(upload_stream.Config, "MAX_BASE64_IMAGE_BYTES", 1000)
+    written = []
+    original_write = upload_stream._ValidatingSpool.write
+
+    def counting_write(self, data):
+        written.append(len(data))
+        return original_write(self, data)
+
+    monkeypatch.setattr(upload_stream._ValidatingSpool, "write", counting_write)
+    big = _png() + b"\0" * (2 * 1024 * 1024)
+
+    resp = client.post(
+        "/api/reference-images",
+        data={"images": [(io.BytesIO(big), "big.png")]},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 400
+    assert "过大" in resp.get_json()["error"]
+    # 超限后立即停止，不会把整个文件写入临时文件
+    assert sum(written) < len(big) / 4
+
+    resp = client.post("/api/reference-images", data=big, content_type="image/png")
+    assert resp.status_code == 400
+
+
+def test_too_many_files_rejected(client, store, monkeypatch):
+    monkeypatch.setattr(upload_stream.Config, "MAX_BASE64_IMAGES", 2)
+    files = [(io.BytesIO(_png()), f"{i}.png") for i in range(3)]
+    resp = client.post("/api/reference-images", data={"images": files}, content_type="multipart/form-data")
+    assert resp.status_code == 400
+    assert "最多允许 2 张" in resp.get_json()["error"]
+
+
+def test_generate_accepts_multipart_payload_and_ids(client, store, monkeypatch):
+    captured = {}
+
+    class _FakeImageService:
+        def generate_images(self, pages, task_id, full_outline, user_images=None, user_topic="", style_hint=""):
+            captured.update(pages=pages, task_id=task_id, user_images=user_images)
+            yield {"event": "finish", "data": {"success": True}}
+
+    monkeypatch.setattr(image_routes, "get_image_service", lambda: _FakeImageService())
+    red, blue = _png("red"), _png("blue")
+    image_id = store.put(blue, "image/png")["id"]
+
+    resp = client.post(
+        "/api/generate",
+        data={
+            "payload": '{"pages": [{"index": 0, "type": "cover", "content": "c"}], '
+                       f'"task_id": "task_upload", "user_image_ids": ["{image_id}"]}}',
+            "user_images": [(io.BytesIO(red), "a.png")],
+        },
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 200
+    assert b"event: finish" in resp.data
+    assert captured["task_id"] == "task_upload"
+    assert captured["user_images"] == [red, blue]
+
+    resp = client.post("/api/generate", data={"payload": "[]"}, content_type="multipart/form-data")
+    assert resp.status_code == 400
+
+
+def test_reference_store_dedupes_by_content(client, store):
+    red = _png("red")
+    first = client.post("/api/reference-images", data=red, content_type="image/png").get_json()["images"][0]
+    second = client.post(
+        "/api/reference-images",
+        data={"images": [(io.BytesIO(red), "again.png")]},
+        content_type="multipart/form-data",
+    ).get_json()["images"][0]
+
+    assert first["id"] == second["id"] == reference_image_id(red)
+    assert (first["deduplicated"], second["deduplicated"]) == (False, True)
+    assert store.stats()["entries"] == 1
+    assert store.stats()["deduplicated"] == 1
+
+
+def test_reference_store_expires_entries_after_ttl(tmp_path):
+    store = ReferenceImageStore(str(tmp_path), ttl=60)
+    image_id = store.put(b"a" * 10)["id"]
+    assert store.get(image_id) == b"a" * 10
+
+    path = store._path(image_id)
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert store.get(image_id) is None
+    assert not os.path.exists(path)
+
+
+def test_reference_store_evicts_least_recently_used_over_budget(tmp_path):
+    store = ReferenceImageStore(str(tmp_path), max_bytes=250)
+    a = store.put(b"a" * 100)["id"]
+    b = store.put(b"b" * 100)["id"]
+    now = time.time()
+    os.utime(store._path(a), (now - 10, now - 10))
+    os.utime(store._path(b), (now - 20, now - 20))
+
+    c = store.put(b"c" * 100)["id"]
+    assert store.get(b) is None
+    assert store.get(a) == b"a" * 100
+    assert store.get(c) == b"c" * 100
+    assert store.stats()["bytes"] == 200
+
+    with pytest.raises(ValueError):
+        store.resolve("not-a-list")
+
+
+def test_generate_limits_reference_images_across_sources(client, store, monkeypatch):
+    import base64
+
+    red, blue = _png("red"), _png("blue")
+    image_id = store.put(blue, "image/png")["id"]
+    pages = [{"index": 0, "type": "cover", "content": "c"}]
+    reads = []
+    original_get = store.get
+    monkeypatch.setattr(store, "get", lambda image_id: reads.append(image_id) or original_get(image_id))
+
+    # 数量超限时在读取任何 ID 之前就拒绝
+    resp = client.post("/api/generate", json={"pages": pages, "user_image_ids": [image_id] * 1000})
+    assert resp.status_code == 400 and "最多允许" in resp.get_json()["error"]
+    assert reads == []
+
+    # base64 与 ID 引用的图片共用总大小预算
+    monkeypatch.setattr(image_routes.Config, "MAX_BASE64_TOTAL_BYTES", len(red) + len(blue) - 1)
+    resp = client.post("/api/generate", json={
+        "pages": pages,
+        "user_images": [base64.b64encode(red).decode()],
+        "user_image_ids": [image_id],
+    })
+    assert resp.status_code == 400 and "总大小" in resp.get_json()["error"]
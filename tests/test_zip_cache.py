@@ -0,0 +1,143 @@
+import os
+import time
+
+from backend.services.zip_cache import ZipBundleCache, task_dir_fingerprint
+
+
+def _task_dir(tmp_path, task_id="task_a", size=100):
+    task_dir = tmp_path / "history" / task_id
+    task_dir.mkdir(parents=True, exist_ok=True)
+    (task_dir / "0.png").write_bytes(b"x" * size)
+    return str(task_dir)
+
+
+def _builder(calls, payload=b"PKdata"):
+    def build():
+        calls.append(1)
+        return iter([payload[:2], payload[2:]])
+    return build
+
+
+def _download(cache, task_id, record_id, updated_at, task_dir, build):
+    """模拟一次下载：返回 (命中的缓存文件路径或 None, 下载内容)，未命中时读完整个数据流"""
+    path, stream = cache.open_bundle(task_id, record_id, updated_at, task_dir, build)
+    if stream is not None:
+        return None, b"".join(stream)
+    with open(path, "rb") as f:
+        return path, f.read()
+
+
+def _bundle_path(cache, task_id, record_id, updated_at, task_dir):
+    return cache._bundle_path(task_id, record_id, task_dir_fingerprint(task_dir, updated_at))
+
+
+def test_hit_does_not_rebuild(tmp_path):
+    task_dir = _task_dir(tmp_path)
+    cache = ZipBundleCache(str(tmp_path / "cache"), max_bytes=10_000)
+    calls = []
+
+    assert _download(cache, "task_a", "rec1", "t1", task_dir, _builder(calls)) == (None, b"PKdata")
+    path, data = _download(cache, "task_a", "rec1", "t1", task_dir, _builder(calls))
+
+    assert path == _bundle_path(cache, "task_a", "rec1", "t1", task_dir)
+    assert data == b"PKdata"
+    assert calls == [1]
+
+
+def test_fingerprint_changes_rebuild_and_drop_stale(tmp_path):
+    task_dir = _task_dir(tmp_path)
+    cache = ZipBundleCache(str(tmp_path / "cache"), max_bytes=10_000)
+    calls = []
+
+    _download(cache, "task_a", "rec1", "t1", task_dir, _builder(calls))
+    first = _bundle_path(cache, "task_a", "rec1", "t1", task_dir)
+    # 记录更新时间变化
+    assert _download(cache, "task_a", "rec1", "t2", task_dir, _builder(calls))[0] is None
+    second = _bundle_path(cache, "task_a", "rec1", "t2", task_dir)
+    assert os.path.exists(second) and not os.path.exists(first)
+
+    # 图片重新生成（大小变化）
+    with open(os.path.join(task_dir, "0.png"), "wb") as f:
+        f.write(b"y" * 200)
+    assert _bundle_path(cache, "task_a", "rec1", "t2", task_dir) != second
+    assert _download(cache, "task_a", "rec1", "t2", task_dir, _builder(calls))[0] is None
+    assert os.path.exists(_bundle_path(cache, "task_a", "rec1", "t2", task_dir)) and not os.path.exists(second)
+    assert len(calls) == 3
+
+
+def test_lru_budget_evicts_least_recently_used(tmp_path):
+    cache = ZipBundleCache(str(tmp_path / "cache"), max_bytes=25)
+    payload = b"P" * 10
+    dirs = {task_id: _task_dir(tmp_path, task_id) for task_id in ("task_a", "task_b", "task_c")}
+    paths = {}
+    for task_id in ("task_a", "task_b"):
+        _download(cache, task_id, "rec_" + task_id, "t", dirs[task_id], _builder([], payload))
+        paths[task_id] = _bundle_path(cache, task_id, "rec_" + task_id, "t", dirs[task_id])
+
+    # 访问 task_a，使 task_b 成为最久未使用
+    old = time.time() - 100
+    os.utime(paths["task_b"], (old, old))
+    os.utime(paths["task_a"], (old - 10, old - 10))
+    assert _download(cache, "task_a", "rec_task_a", "t", dirs["task_a"], _builder([], payload))[0] == paths["task_a"]
+
+    _download(cache, "task_c", "rec_task_c", "t", dirs["task_c"], _builder([], payload))
+    assert os.path.exists(paths["task_a"])
+    assert not os.path.exists(paths["task_b"])
+    assert cache.total_bytes() <= 25
+
+
+def test_disabled_cache_streams_without_storing(tmp_path):
+    task_dir = _task_dir(tmp_path)
+    disabled = ZipBundleCache(str(tmp_path / "cache"), max_bytes=0)
+    calls = []
+    assert _download(disabled, "task_a", "rec1", "t", task_dir, _builder(calls)) == (None, b"PKdata")
+    assert calls == [1]
+    assert not os.path.exists(str(tmp_path / "cache"))
+
+
+def test_oversized_bundle_is_built_once_per_fingerprint(tmp_path):
+    task_dir = _task_dir(tmp_path)
+    small = ZipBundleCache(str(tmp_path / "cache"), max_bytes=3)
+    calls = []
+
+    # 第一次下载边输出边写缓存，超出预算后只输出
+    assert _download(small, "task_a", "rec1", "t", task_dir, _builder(calls)) == (None, b"PKdata")
+    assert small.total_bytes() == 0 and not os.listdir(os.path.join(str(tmp_path / "cache"), "task_a"))
+
+    # 同一指纹不再尝试写盘，直接流式输出
+    written = []
+    small._write_through = lambda *args: written.append(1)
+    assert _download(small, "task_a", "rec1", "t", task_dir, _builder(calls)) == (None, b"PKdata")
+    assert calls == [1, 1] and written == [] and small.total_bytes() == 0
+
+
+def test_open_bundle_streams_while_caching(tmp_path):
+    task_dir = _task_dir(tmp_path)
+    cache = ZipBundleCache(str(tmp_path / "cache"), max_bytes=10_000)
+    calls = []
+
+    path, stream = cache.open_bundle("task_a", "rec1", "t", task_dir, _builder(calls))
+    assert path is None
+    assert next(stream) == b"PK" and cache.total_bytes() == 0
+    assert b"".join(stream) == b"data"
+
+    path, stream = cache.open_bundle("task_a", "rec1", "t", task_dir, _builder(calls))
+    assert stream is None and calls == [1]
+    with open(path, "rb") as f:
+        assert f.read() == b"PKdata"
+
+    # 客户端中途断开：不留下不完整的缓存文件
+    interrupted = cache.open_bundle("task_a", "rec2", "t", task_dir, _builder([]))[1]
+    next(interrupted)
+    interrupted.close()
+    assert sorted(os.listdir(os.path.dirname(path))) == [os.path.basename(path)]
+
+
+def test_invalidate_removes_task_bundles(tmp_path):
+    task_dir = _task_dir(tmp_path)
+    cache = ZipBundleCache(str(tmp_path / "cache"), max_bytes=10_000)
+    _download(cache, "task_a", "rec1", "t", task_dir, _builder([]))
+    path = _bundle_path(cache, "task_a", "rec1", "t", task_dir)
+    assert os.path.exists(path)
+    cache.invalidate("task_a")
+    assert not os.path.exists(path)